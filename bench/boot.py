@@ -0,0 +1,116 @@
+"""启动到能接请求要多久：50 个导入要 0.2 秒的服务，顺序恢复（原来的做法）对比先绑端口、后台并发恢复
+
+    python bench/boot.py
+    python bench/boot.py --services 100 --import-delay 0.5
+
+两种做法各起一个服务器子进程（同一份临时库和服务目录），从启动进程开始计时：
+  first  主站 /login 第一次返回 200
+  all    每个 /s/<名称>/ 都返回 200（恢复期间并发做法返回 503 + Retry-After）
+"""
+import argparse, http.client, os, shutil, socket, subprocess, sys, tempfile, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+APP = """\
+import time
+from flask import Flask
+
+time.sleep({delay})
+app = Flask(__name__)
+
+@app.route("/")
+def index():
+    return "ok"
+"""
+
+def prepare(workdir, count, delay):
+    os.chdir(workdir)
+    sys.path.insert(0, ROOT)
+    import pythonapi as P
+    P.init_db()
+    with P.db() as c:
+        c.execute("INSERT INTO users(username,pw_hash) VALUES('bench','x')")
+        for i in range(count):
+            name = "svc{}".format(i)
+            c.execute("INSERT INTO services(user_id,name,title,entry,status) VALUES(1,?,?,'app.py','running')",
+                      [name, name])
+            d = os.path.join(P.SVC_DIR, "1", name)
+            os.makedirs(d)
+            with open(os.path.join(d, "app.py"), "w") as f:
+                f.write(APP.format(delay=delay))
+    P.close_db()
+
+def serve(mode, workdir, port):
+    os.chdir(workdir)
+    sys.path.insert(0, ROOT)
+    import logging
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    import pythonapi as P
+    P.init_db()
+    if mode == "sequential":
+        # 原来 __main__ 里的做法：逐个部署完才开始监听
+        with P.db() as c:
+            rows = c.execute("SELECT * FROM services WHERE status IN ('running','degraded')").fetchall()
+        for svc in rows:
+            P.deploy(svc["id"])
+    else:
+        P.restore_services()
+    P.serve(P.site, "127.0.0.1", port)
+
+def status(port, path):
+    try:
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+        conn.request("GET", path)
+        resp = conn.getresponse()
+        resp.read()
+        conn.close()
+        return resp.status
+    except OSError:
+        return None
+
+def free_port():
+    s = socket.socket()
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+def run(mode, workdir, count):
+    port = free_port()
+    t0   = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve", mode, workdir, str(port)],
+                            stdout=subprocess.DEVNULL)
+    try:
+        while status(port, "/login") != 200:
+            time.sleep(0.01)
+        first   = time.perf_counter() - t0
+        pending = ["/s/svc{}/".format(i) for i in range(count)]
+        while pending:
+            pending = [p for p in pending if status(port, p) != 200]
+            if pending:
+                time.sleep(0.01)
+        every = time.perf_counter() - t0
+    finally:
+        proc.terminate()
+        proc.wait()
+    print("{:<10}  first {:>6.2f}s   all {:>6.2f}s".format(mode, first, every))
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--services", type=int, default=50)
+    ap.add_argument("--import-delay", type=float, default=0.2, help="每个服务导入时睡的秒数")
+    ap.add_argument("--serve", nargs=3, metavar=("MODE", "DIR", "PORT"), help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.serve:
+        serve(args.serve[0], args.serve[1], int(args.serve[2]))
+        return
+    workdir = tempfile.mkdtemp(prefix="paas-boot-")
+    try:
+        prepare(workdir, args.services, args.import_delay)
+        for mode in ("sequential", "concurrent"):
+            run(mode, workdir, args.services)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
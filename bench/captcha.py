@@ -0,0 +1,62 @@
+"""/captcha 吞吐：预渲染池子对比每次现场渲染
+
+    python bench/captcha.py                         # 突发 60 张、持续 300 张，各 3 轮
+    python bench/captcha.py --burst 64 --sustained 1000 --rounds 5
+
+三种做法都走 Flask 测试客户端请求 /captcha：
+  before  每次现场渲染，并且每次重新加载字体（池子之前的做法）
+  inline  每次现场渲染，字体只加载一次（池子取空时就是这条路）
+  pool    先等后台线程把池子填满，再开始计时
+突发量不超过池子大小时，pool 只是出队；持续请求把池子取空以后，吞吐受 Pillow 渲染速度限制。
+需要 Pillow。
+"""
+import argparse, os, sys, tempfile, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--burst", type=int, default=60)
+    ap.add_argument("--sustained", type=int, default=300)
+    ap.add_argument("--rounds", type=int, default=3)
+    args = ap.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="paas-bench-"))
+    sys.path.insert(0, ROOT)
+    import pythonapi as P
+    if not P.HAS_PIL:
+        raise SystemExit("没有 Pillow，/captcha 走的是文字题面，没什么可测的")
+    P.init_db()
+    client = P.main_app.test_client()
+    pool   = P.captcha_pool
+
+    def before():
+        P._font = None
+        return P.CaptchaPool.render()
+
+    def warm():
+        pool.take()
+        deadline = time.time() + 60
+        while len(pool.items) < pool.size and time.time() < deadline:
+            time.sleep(0.05)
+
+    modes = [("before", before, None), ("inline", P.CaptchaPool.render, None), ("pool", pool.take, warm)]
+    for label, n in (("突发", args.burst), ("持续", args.sustained)):
+        for name, take, prepare in modes:
+            rates = []
+            for _ in range(args.rounds):
+                if prepare:
+                    prepare()
+                pool.take, saved = take, pool.take
+                try:
+                    t0 = time.perf_counter()
+                    for _ in range(n):
+                        r = client.get("/captcha")
+                        assert r.mimetype == "image/png"
+                    rates.append(n / (time.perf_counter() - t0))
+                finally:
+                    pool.take = saved
+            print("{} {:>4} 张  {:<7} {}".format(label, n, name, "  ".join("{:>5.0f}/s".format(x) for x in rates)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""网络测速 每 IP 汇总的压测：10 万个不同 IP 存结果，再随机重复存一遍，多个工作进程共用一个库
+
+    python bench/clients.py                         # 2 个进程，共 10 万 IP、20 万次保存
+    python bench/clients.py --ips 20000 --workers 4
+
+每个进程各自加载 网络测速.py（各有一份内存里的 CLIENTS），随机往同一批 IP 写结果，模拟
+gunicorn 之类多工作进程部署。跑完用明细表核对汇总表：每个 IP 的次数、最佳下载、最佳上传、
+最低延迟都必须等于 records 上的 COUNT / MAX / MIN，一个进程写的结果不能被另一个进程覆盖。
+最后报告单次保存耗时、内存字典查询耗时，以及重启时把 10 万行汇总读回内存的时间和内存。
+"""
+import argparse, importlib.util, multiprocessing, os, random, sys, tempfile, time, tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def load():
+    spec = importlib.util.spec_from_file_location("speedtest", os.path.join(ROOT, "网络测速.py"))
+    mod  = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+def ip_list(n):
+    return ["10.{}.{}.{}".format(i >> 16, (i >> 8) & 255, i & 255) for i in range(n)]
+
+def worker(workdir, ips, seed, out):
+    os.chdir(workdir)
+    S   = load()
+    rnd = random.Random(seed)
+    t0  = time.perf_counter()
+    for ip in ips:
+        S.update_records(ip, rnd.uniform(1, 900), rnd.uniform(1, 300), rnd.uniform(1, 100))
+    out.put((len(ips), time.perf_counter() - t0))
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--ips", type=int, default=100000, help="不同 IP 数")
+    ap.add_argument("--workers", type=int, default=2, help="写同一个库的进程数")
+    args = ap.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="speedtest-clients-")
+    os.chdir(workdir)
+    S = load()
+    S.init_data()
+    ips = ip_list(args.ips)
+    # 第一轮每个 IP 一次，第二轮随机重复：两轮都打散分给各进程，同一 IP 会被不同进程写
+    saves = ips + [random.choice(ips) for _ in range(args.ips)]
+    random.shuffle(saves)
+    out   = multiprocessing.Queue()
+    procs = [multiprocessing.Process(target=worker, args=(workdir, saves[i::args.workers], i, out))
+             for i in range(args.workers)]
+    t0 = time.perf_counter()
+    for p in procs:
+        p.start()
+    done = [out.get() for _ in procs]
+    for p in procs:
+        p.join()
+    wall = time.perf_counter() - t0
+    n = sum(d[0] for d in done)
+    print("{} 个进程保存 {} 次（{} 个 IP）：{:.1f}s，每次 {:.0f} us（单进程内 {:.0f} us）".format(
+        args.workers, n, args.ips, wall, wall / n * 1e6, max(d[1] / d[0] for d in done) * 1e6))
+
+    conn = S.db()
+    bad  = conn.execute("""
+        SELECT COUNT(*) FROM clients c JOIN (
+            SELECT ip, COUNT(*) n, MAX(download) d, MAX(upload) u, MIN(latency) l FROM records GROUP BY ip
+        ) r USING(ip)
+        WHERE c.count != r.n OR c.dl_download != r.d OR c.up_upload != r.u OR c.lat_latency != r.l
+    """).fetchone()[0]
+    rows = conn.execute("SELECT COUNT(*) FROM clients").fetchone()[0]
+    print("汇总表 {} 行，和明细不一致的 IP：{}".format(rows, bad))
+
+    S.load_clients()
+    t0 = time.perf_counter()
+    for _ in range(100000):
+        S.get_client_best_record(random.choice(ips))
+    print("内存查询每次 {:.2f} us".format((time.perf_counter() - t0) / 100000 * 1e6))
+
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    S.load_clients()
+    el = time.perf_counter() - t0
+    print("重启读回 {} 行汇总：{:.2f}s，{:.0f} MB".format(len(S.CLIENTS), el, tracemalloc.get_traced_memory()[0] / 1e6))
+    tracemalloc.stop()
+    if bad or rows != args.ips:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""gzip 中间件的代价和收益：每个响应压缩前后的字节数，以及每个请求多花的 CPU
+
+    python bench/compress.py
+    python bench/compress.py --n 2000 --rounds 7
+
+直接调用 site（Gzip(dispatcher)）这个 WSGI app，不经过网络；同一个请求分别带和不带
+Accept-Encoding: gzip，计进程 CPU 时间，取若干轮里最好的一轮：
+  login   主站 /login 页面，每次重新压缩
+  css     带哈希的样式表，有 ETag，压缩结果走内存里的 LRU
+  json    一个挂载服务返回约 57 KB 的 JSON 列表，每次重新压缩
+  stream  同一份 JSON 由生成器分块吐出，按块 Z_SYNC_FLUSH 流式压缩
+"""
+import argparse, json, os, sys, tempfile, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ITEMS = json.dumps([{"id": i, "name": "item-{}".format(i), "price": i * 3 % 997,
+                     "tags": ["a", "b", "c"][: i % 4]} for i in range(900)]).encode()
+
+def json_app(environ, start_response):
+    start_response("200 OK", [("Content-Type", "application/json"), ("Content-Length", str(len(ITEMS)))])
+    return [ITEMS]
+
+def stream_app(environ, start_response):
+    start_response("200 OK", [("Content-Type", "application/json")])
+    return (ITEMS[i:i + 4096] for i in range(0, len(ITEMS), 4096))
+
+def call(app, path, gz):
+    environ = {"REQUEST_METHOD": "GET", "PATH_INFO": path, "SCRIPT_NAME": "", "QUERY_STRING": "",
+               "SERVER_NAME": "127.0.0.1", "SERVER_PORT": "80", "SERVER_PROTOCOL": "HTTP/1.1",
+               "HTTP_HOST": "127.0.0.1", "REMOTE_ADDR": "127.0.0.1", "wsgi.url_scheme": "http",
+               "wsgi.input": None, "wsgi.errors": sys.stderr, "wsgi.multithread": True,
+               "wsgi.multiprocess": False, "wsgi.run_once": False, "wsgi.version": (1, 0)}
+    if gz:
+        environ["HTTP_ACCEPT_ENCODING"] = "gzip, deflate, br"
+    it = app(environ, lambda status, headers, exc_info=None: None)
+    n = 0
+    try:
+        for chunk in it:
+            n += len(chunk)
+    finally:
+        if hasattr(it, "close"):
+            it.close()
+    return n
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--n", type=int, default=500, help="每轮请求数")
+    ap.add_argument("--rounds", type=int, default=5)
+    args = ap.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="paas-bench-"))
+    sys.path.insert(0, ROOT)
+    import pythonapi as P
+    P.init_db()
+    P.dispatcher.mount("json", json_app)
+    P.dispatcher.mount("stream", stream_app)
+    paths = [("login", "/login"), ("css", P.CSS_URL), ("json", "/s/json/"), ("stream", "/s/stream/")]
+    for label, path in paths:
+        row = []
+        for gz in (False, True):
+            size = call(P.site, path, gz)
+            top  = float("inf")
+            for _ in range(args.rounds):
+                c0 = time.process_time()
+                for _ in range(args.n):
+                    call(P.site, path, gz)
+                top = min(top, time.process_time() - c0)
+            row.append((size, top / args.n * 1e6))
+        (b0, u0), (b1, u1) = row
+        print("{:<7} {:>7} B -> {:>6} B ({:>4.0%})   CPU {:>6.0f} us -> {:>6.0f} us".format(
+            label, b0, b1, b1 / b0, u0, u1))
+    s = P.gzip_stats
+    print("gzip_stats: 压缩 {} 次，LRU 命中 {} 次".format(s["responses"], s["memo_hits"]))
+
+if __name__ == "__main__":
+    main()
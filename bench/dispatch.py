@@ -0,0 +1,102 @@
+"""Dispatcher 路由开销：预编译路由表（现在的实现）对比原来逐请求 split 路径 + 复制 environ 的实现
+
+    python bench/dispatch.py                        # 5 / 50 / 500 个挂载点
+    python bench/dispatch.py --mounts 5,5000 --n 500000
+
+每个请求打到随机一个挂载的服务上，environ 有 100 个键（真实请求里 HTTP_* 头和 werkzeug 的键差不多这么多）。
+新实现会原地改 environ，所以每次调用前两边都复制一份 environ，报告的是扣掉这次复制之后的纯路由耗时。
+"new" 把 Metered（指标 + 访问日志）换成直通，和原来的实现比的是同一件事；"new+metered" 是线上真实路径。
+取若干轮里最好的一轮。
+"""
+import argparse, os, random, sys, tempfile, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class OldDispatcher:
+    """user-001 之前的 Dispatcher：每个请求 split 路径、复制 environ"""
+    def __init__(self, app, prefix):
+        self.main   = app
+        self.apps   = {}
+        self.prefix = prefix
+
+    def mount(self, name, wsgi_app):
+        self.apps[name] = wsgi_app
+
+    def __call__(self, environ, start_response):
+        path = environ.get("PATH_INFO", "")
+        pfx  = self.prefix + "/"
+        if path.startswith(pfx):
+            rest = path[len(pfx):]
+            name = rest.split("/")[0]
+            if name and name in self.apps:
+                sub = path[len(pfx) + len(name):] or "/"
+                env = dict(environ)
+                env["SCRIPT_NAME"] = environ.get("SCRIPT_NAME", "") + pfx + name
+                env["PATH_INFO"]   = sub
+                return self.apps[name](env, start_response)
+        return self.main(environ, start_response)
+
+def app(environ, start_response):
+    return ()
+
+def start_response(status, headers, exc_info=None):
+    pass
+
+def environs(prefix, names, n):
+    base = {"HTTP_X_PAD_{}".format(i): "x" * 20 for i in range(96)}
+    base.update(REQUEST_METHOD="GET", SCRIPT_NAME="", HTTP_HOST="127.0.0.1:5000")
+    out = []
+    for _ in range(n):
+        e = dict(base)
+        e["PATH_INFO"] = "{}/{}/api/items/42".format(prefix, random.choice(names))
+        out.append(e)
+    return out
+
+def best(d, envs, rounds):
+    top = float("inf")
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        for e in envs:
+            r = d(dict(e), start_response)
+            if hasattr(r, "close"):             # Metered 在 close 时记指标、写访问日志
+                r.close()
+        top = min(top, time.perf_counter() - t0)
+    return top
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--mounts", default="5,50,500", help="逗号分隔的挂载点数")
+    ap.add_argument("--n", type=int, default=200000, help="每轮请求数")
+    ap.add_argument("--rounds", type=int, default=7)
+    args = ap.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="paas-bench-"))
+    sys.path.insert(0, ROOT)
+    import pythonapi as P
+
+    def bare(name, a, environ, sr, *rest):
+        return a(environ, sr)
+
+    copy = lambda environ, sr: ()
+    for count in [int(x) for x in args.mounts.split(",")]:
+        names = ["svc{}".format(i) for i in range(count)]
+        envs  = environs(P.PREFIX, names, args.n)
+        old   = OldDispatcher(app, P.PREFIX)
+        new   = P.Dispatcher(app)
+        for n in names:
+            old.mount(n, app)
+            new.mount(n, app)
+        base = best(copy, envs, args.rounds)
+        t_old = best(old, envs, args.rounds) - base
+        metered, P.Metered = P.Metered, bare
+        try:
+            t_new = best(new, envs, args.rounds) - base
+        finally:
+            P.Metered = metered
+        t_full = best(new, envs, max(1, args.rounds // 2)) - base
+        ns = lambda t: t / args.n * 1e9
+        print("{:>5} 个挂载点   old {:>6.0f} ns   new {:>6.0f} ns ({:.1f}x)   new+metered {:>6.0f} ns".format(
+            count, ns(t_old), ns(t_new), t_old / t_new, ns(t_full)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""网络测速 /download 回环吞吐：确认服务器本身不是测速的瓶颈
+
+    python bench/download.py                        # 1 和 4 个并发客户端，各下 100 MiB
+    python bench/download.py --clients 1,8 --size 50 --rounds 5
+
+服务器是 网络测速.py 的 app，跑在子进程里的 Werkzeug 多线程服务器上（和 app.run 一样），
+客户端用原始 socket + recv_into 读，尽量不让客户端自己成为瓶颈。报告每轮里最好的聚合吞吐，
+并检查每个响应的字节数正好是 size MiB。千兆网线速约 118 MB/s。
+"""
+import argparse, importlib.util, os, socket, subprocess, sys, tempfile, threading, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MB   = 1024 * 1024
+
+def serve(port):
+    os.chdir(tempfile.mkdtemp(prefix="speedtest-bench-"))
+    spec = importlib.util.spec_from_file_location("speedtest", os.path.join(ROOT, "网络测速.py"))
+    mod  = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    import logging
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    from werkzeug.serving import run_simple
+    run_simple("127.0.0.1", port, mod.app, threaded=True)
+
+def fetch(port, path, out):
+    s = socket.create_connection(("127.0.0.1", port))
+    s.sendall("GET {} HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n".format(path).encode())
+    buf  = memoryview(bytearray(MB))
+    head = b""
+    total = 0
+    while True:
+        n = s.recv_into(buf)
+        if not n:
+            break
+        if head is not None:
+            head += bytes(buf[:n])
+            i = head.find(b"\r\n\r\n")
+            if i < 0:
+                continue
+            total, head = len(head) - i - 4, None
+        else:
+            total += n
+    s.close()
+    out.append(total)
+
+def wait_port(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), 1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise SystemExit("服务器没有启动")
+
+def free_port():
+    s = socket.socket()
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--clients", default="1,4", help="逗号分隔的并发客户端数")
+    ap.add_argument("--size", type=int, default=100, help="每个下载的 MiB 数")
+    ap.add_argument("--rounds", type=int, default=3)
+    ap.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.serve:
+        serve(args.serve)
+        return
+    port = free_port()
+    proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve", str(port)])
+    path = "/download/{}".format(args.size)
+    try:
+        wait_port(port)
+        for n in [int(x) for x in args.clients.split(",")]:
+            best = 0.0
+            for _ in range(args.rounds):
+                got     = []
+                threads = [threading.Thread(target=fetch, args=(port, path, got)) for _ in range(n)]
+                t0 = time.perf_counter()
+                for t in threads:
+                    t.start()
+                for t in threads:
+                    t.join()
+                dt = time.perf_counter() - t0
+                assert got == [args.size * MB] * n, "响应字节数不对: {}".format(got)
+                best = max(best, sum(got) / dt / 1e6)
+            print("{:>3} 客户端 x {} MiB   最好 {:>6.0f} MB/s  ({:.1f} Gbit/s)".format(
+                n, args.size, best, best * 8 / 1000))
+    finally:
+        proc.terminate()
+        proc.wait()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""大目录列表：2 万个文件的服务目录，原来的 list_items 对比 scandir + 按目录缓存 + 分页
+
+    python bench/listing.py
+    python bench/listing.py --files 100000 --dirs 50
+
+  old      原来的 list_items：iterdir 后按 (is_file, 小写名) 排序，每项 is_file/is_dir/stat 各一次
+  cold     现在的 list_items，缓存清空后取第一页（一遍 scandir + 排序）
+  warm     缓存命中时取第一页
+  page     /svc/<sid> 整页渲染（登录后，第一页 LIST_PAGE 条）
+最后把所有页拼起来，和 old 的结果逐项比对。
+"""
+import argparse, os, sys, tempfile, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def old_list_items(P, svc, rel=""):
+    base   = P.svc_dir(svc)
+    target = (base / rel) if rel else base
+    if not target.is_dir():
+        return []
+    out = []
+    for p in sorted(target.iterdir(), key=lambda x: (x.is_file(), x.name.lower())):
+        rel_path = (rel + "/" + p.name) if rel else p.name
+        out.append({"name": p.name, "is_dir": p.is_dir(),
+                    "size": p.stat().st_size if p.is_file() else 0,
+                    "rel":  rel_path})
+    return out
+
+def best(fn, rounds, before=None):
+    top = float("inf")
+    for _ in range(rounds):
+        if before:
+            before()
+        t0 = time.perf_counter()
+        fn()
+        top = min(top, time.perf_counter() - t0)
+    return top * 1000
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--files", type=int, default=20000)
+    ap.add_argument("--dirs", type=int, default=20)
+    ap.add_argument("--rounds", type=int, default=5)
+    args = ap.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="paas-bench-"))
+    sys.path.insert(0, ROOT)
+    import pythonapi as P
+    P.init_db()
+    with P.db() as c:
+        c.execute("INSERT INTO users(username,pw_hash) VALUES('bench','x')")
+        c.execute("INSERT INTO services(user_id,name,title,entry) VALUES(1,'demo','demo','app.py')")
+        svc = c.execute("SELECT * FROM services WHERE id=1").fetchone()
+    base = P.svc_dir(svc)
+    base.mkdir(parents=True)
+    for i in range(args.dirs):
+        (base / "Dir{:03d}".format(i)).mkdir()
+    for i in range(args.files):
+        with open(base / "file_{:06d}.txt".format(i), "w") as f:
+            f.write("x" * (i % 97))
+
+    clear = lambda: P._list_cache.clear()
+    print("old    {:>8.1f} ms  （整个列表）".format(best(lambda: old_list_items(P, svc), args.rounds)))
+    print("cold   {:>8.1f} ms".format(best(lambda: P.list_items(svc), args.rounds, clear)))
+    P.list_items(svc)
+    print("warm   {:>8.2f} ms".format(best(lambda: P.list_items(svc), args.rounds)))
+    client = P.main_app.test_client()
+    with client.session_transaction() as s:
+        s["uid"], s["uname"] = 1, "bench"
+    print("page   {:>8.1f} ms  （/svc/1，第一页 {} 条）".format(
+        best(lambda: client.get("/svc/1").get_data(), args.rounds), P.LIST_PAGE))
+
+    pages, after = [], ""
+    while True:
+        items, more, total = P.list_items(svc, after=after)
+        pages += items
+        if not more:
+            break
+        after = P.list_cursor(items[-1])
+    assert pages == old_list_items(P, svc), "分页拼起来和原来的列表不一致"
+    print("分页拼接 {} 项，和原来的列表一致".format(total))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""PhonePaaS 服务器后端压测：N 个 keep-alive 客户端打 dispatcher，报告吞吐、p50/p99 延迟和建立的连接数
+
+    python bench/loadtest.py                        # 两个后端，8 和 64 个客户端
+    python bench/loadtest.py --backend pool --clients 16 --requests 500 --path /login
+    python bench/loadtest.py --flood 64             # 一个慢服务被打满时，主站页面的 p99（不限流 / 限流对比）
+
+服务器跑在子进程里（临时目录里的空库），和压测客户端不抢 GIL。
+默认路径 /s/bench/ 是挂在 dispatcher 上的一个最小 WSGI app，测的是服务器和分发本身；
+--path /login 之类会带上页面渲染的开销。连接数等于客户端数说明 keep-alive 生效，
+等于请求数说明每个请求都重新建了连接。
+
+--flood N：另挂一个每个请求睡 50 ms 的服务 /s/flood/，N 个客户端不停地打它，同时按 --path
+（flood 模式默认 /login，一个主站页面）测延迟。--flood-limit 列出要对比的 max_inflight（0 = 不限流），
+排队时间是 --queue-ms。不限流时慢服务占满服务器线程，主站请求只能排队；限流后多出来的请求
+直接 503，线程留给主站。
+"""
+import argparse, http.client, os, socket, subprocess, sys, tempfile, threading, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def bench_app(environ, start_response):
+    start_response("200 OK", [("Content-Type", "text/plain"), ("Content-Length", "2")])
+    return [b"ok"]
+
+FLOOD_SLEEP = 0.05
+
+def flood_app(environ, start_response):
+    time.sleep(FLOOD_SLEEP)
+    start_response("200 OK", [("Content-Type", "text/plain"), ("Content-Length", "2")])
+    return [b"ok"]
+
+def serve(backend, port, inflight=None, queue_ms=0):
+    os.chdir(tempfile.mkdtemp(prefix="paas-bench-"))
+    sys.path.insert(0, ROOT)
+    import logging
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    import pythonapi as P
+    P.init_db()
+    P.dispatcher.mount("bench", bench_app)
+    if inflight is not None:
+        P.dispatcher.mount("flood", flood_app)
+        if inflight:
+            P.dispatcher.limit("flood", P.Limiter(inflight=inflight, queue_ms=queue_ms))
+    P.serve(P.site, "127.0.0.1", port, backend)
+
+class CountingConnection(http.client.HTTPConnection):
+    opened = 0
+    lock   = threading.Lock()
+
+    def connect(self):
+        super().connect()
+        with CountingConnection.lock:
+            CountingConnection.opened += 1
+
+def client(port, path, n, lat, errors, retries):
+    conn = CountingConnection("127.0.0.1", port, timeout=30)
+    for _ in range(n):
+        t0 = time.perf_counter()
+        for attempt in range(2):
+            reused = conn.sock is not None
+            try:
+                conn.request("GET", path)
+                resp = conn.getresponse()
+                resp.read()
+                if resp.status >= 500:
+                    errors.append(resp.status)
+                lat.append(time.perf_counter() - t0)
+                break
+            except (ConnectionError, http.client.RemoteDisconnected) as e:
+                conn.close()
+                # 服务器关掉空闲连接的同时客户端发了请求：浏览器和 urllib3 都会在新连接上重试一次
+                if reused and attempt == 0:
+                    retries.append(1)
+                    continue
+                errors.append(type(e).__name__)
+            except (OSError, http.client.HTTPException) as e:
+                conn.close()
+                errors.append(type(e).__name__)
+                break
+    conn.close()
+
+def flooder(port, stop, codes):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    while not stop.is_set():
+        try:
+            conn.request("GET", "/s/flood/")
+            resp = conn.getresponse()
+            resp.read()
+            codes[resp.status] = codes.get(resp.status, 0) + 1
+        except (OSError, http.client.HTTPException) as e:
+            conn.close()
+            codes[type(e).__name__] = codes.get(type(e).__name__, 0) + 1
+    conn.close()
+
+def wait_port(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), 1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise SystemExit("服务器没有启动")
+
+def free_port():
+    s = socket.socket()
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+def run(backend, clients, requests, path, flood=0, inflight=0, queue_ms=0):
+    port = free_port()
+    cmd  = [sys.executable, os.path.abspath(__file__), "--serve", backend, str(port)]
+    if flood:
+        cmd += [str(inflight), str(queue_ms)]
+    proc = subprocess.Popen(cmd)
+    stop, codes = threading.Event(), {}
+    try:
+        wait_port(port)
+        client(port, path, 20, [], [], [])      # 预热
+        floods = [threading.Thread(target=flooder, args=(port, stop, codes)) for _ in range(flood)]
+        for t in floods:
+            t.start()
+        if flood:
+            time.sleep(0.5)                     # 等慢服务把线程占满
+        CountingConnection.opened = 0
+        lat, errors, retries = [], [], []
+        threads = [threading.Thread(target=client, args=(port, path, requests, lat, errors, retries))
+                   for _ in range(clients)]
+        t0 = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - t0
+        stop.set()
+        for t in floods:
+            t.join()
+    finally:
+        stop.set()
+        proc.terminate()
+        proc.wait()
+    lat.sort()
+    pct = lambda p: lat[min(len(lat) - 1, int(len(lat) * p))] * 1000 if lat else 0
+    print("{:<7} {:>4} 客户端  {:>7.0f} req/s  p50 {:>7.2f} ms  p99 {:>7.2f} ms  连接 {:>6}  重试 {:>4}  错误 {}".format(
+        backend, clients, len(lat) / elapsed, pct(0.50), pct(0.99), CountingConnection.opened,
+        len(retries), len(errors)))
+    if flood:
+        print("        flood x{} {}  慢服务响应 {}".format(
+            flood, "max_inflight={} queue_ms={}".format(inflight, queue_ms) if inflight else "不限流",
+            dict(sorted(codes.items(), key=str))))
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--backend", choices=["pool", "simple", "both"], default="both")
+    ap.add_argument("--clients", help="逗号分隔的并发客户端数（默认 8,64；flood 模式默认 1）")
+    ap.add_argument("--requests", type=int, default=200, help="每个客户端的请求数")
+    ap.add_argument("--path", help="默认 /s/bench/；flood 模式默认 /login")
+    ap.add_argument("--flood", type=int, default=0, help="打慢服务的客户端数，0 = 不开 flood 模式")
+    ap.add_argument("--flood-limit", default="0,4", help="flood 模式下对比的 max_inflight，0 = 不限流")
+    ap.add_argument("--queue-ms", type=int, default=20, help="flood 模式下限流的排队毫秒数")
+    ap.add_argument("--serve", nargs="+", metavar="ARG", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.serve:
+        backend, port, *limit = args.serve
+        serve(backend, int(port), *[int(x) for x in limit])
+        return
+    backends = ["simple", "pool"] if args.backend == "both" else [args.backend]
+    clients  = args.clients or ("1" if args.flood else "8,64")
+    path     = args.path or ("/login" if args.flood else "/s/bench/")
+    limits   = [int(x) for x in args.flood_limit.split(",")] if args.flood else [0]
+    for n in [int(x) for x in clients.split(",")]:
+        for backend in backends:
+            for inflight in limits:
+                run(backend, n, args.requests, path, args.flood, inflight, args.queue_ms)
+
+if __name__ == "__main__":
+    main()
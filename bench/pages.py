@@ -0,0 +1,61 @@
+"""页面体积和渲染耗时：登录后的几个常用页面，每个响应多少字节、一次请求多少微秒
+
+    python bench/pages.py                           # 当前工作区的 pythonapi.py
+    python bench/pages.py --rev c913a55^            # 同时测某个历史版本，作对照
+
+走 Flask 测试客户端（不经过 gzip 中间件），库和服务目录在临时目录里。
+--rev 用 git show 取出那个版本的 pythonapi.py，在子进程里跑同样的测量。
+"""
+import argparse, os, subprocess, sys, tempfile, time
+
+ROOT  = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PAGES = [("dashboard", "/"), ("service", "/svc/1"), ("editor", "/svc/1/edit?path=app.py"),
+         ("login", "/login"), ("404", "/no-such-page")]
+
+def measure(src_dir, n):
+    os.chdir(tempfile.mkdtemp(prefix="paas-bench-"))
+    sys.path.insert(0, src_dir)
+    import pythonapi as P
+    P.init_db()
+    with P.db() as c:
+        c.execute("INSERT INTO users(username,pw_hash) VALUES('bench','x')")
+        c.execute("INSERT INTO services(user_id,name,title,entry) VALUES(1,'demo','demo','app.py')")
+    d = os.path.join(P.SVC_DIR, "1", "demo")
+    os.makedirs(d)
+    with open(os.path.join(d, "app.py"), "w") as f:
+        f.write("from flask import Flask\napp = Flask(__name__)\n")
+    client = P.main_app.test_client()
+    with client.session_transaction() as s:
+        s["uid"], s["uname"] = 1, "bench"
+    for label, path in PAGES:
+        if label == "login":
+            client = P.main_app.test_client()
+        size = len(client.get(path).get_data())
+        t0 = time.perf_counter()
+        for _ in range(n):
+            client.get(path).get_data()
+        us = (time.perf_counter() - t0) / n * 1e6
+        print("{:<10} {:>7} B  {:>7.0f} us/请求".format(label, size, us))
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--rev", help="对照的 git 版本")
+    ap.add_argument("--n", type=int, default=300, help="每个页面请求次数")
+    ap.add_argument("--measure", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.measure:
+        measure(args.measure, args.n)
+        return
+    runs = [("工作区", ROOT)]
+    if args.rev:
+        old = tempfile.mkdtemp(prefix="paas-rev-")
+        with open(os.path.join(old, "pythonapi.py"), "wb") as f:
+            f.write(subprocess.check_output(["git", "-C", ROOT, "show", "{}:pythonapi.py".format(args.rev)]))
+        runs.insert(0, (args.rev, old))
+    for label, src in runs:
+        print("── {}".format(label))
+        sys.stdout.flush()
+        subprocess.check_call([sys.executable, os.path.abspath(__file__), "--measure", src, "--n", str(args.n)])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""网络测速 存储压测：库里有 100 万条记录时，保存、查个人最佳、排行榜、启动重建、过期清理各要多久
+
+    python bench/records.py                         # 100 万条记录，每项取 2000 次的平均
+    python bench/records.py --records 200000 --legacy
+
+记录的时间戳均匀分布在最近 8 天里，所以大约 1/8 已经超出 RETENTION_DAYS，留给 compact() 清。
+--legacy 另外把同样多的记录写成旧版的 speedtest_data.json，按旧版 update_records 的做法
+（整个文件读进来、追加、过滤 7 天、排序、整个写回）计一次保存的耗时作对照；很慢，默认不跑。
+"""
+import argparse, importlib.util, json, os, random, tempfile, time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def load():
+    spec = importlib.util.spec_from_file_location("speedtest", os.path.join(ROOT, "网络测速.py"))
+    mod  = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+def timed(fn, calls):
+    t0 = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - t0) / calls
+
+def fmt(sec):
+    return "{:.2f} s".format(sec) if sec >= 1 else "{:.0f} us".format(sec * 1e6)
+
+def legacy_save(path, record):
+    """旧版 update_records：每次保存都把整个 JSON 文件读进来再写回去"""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    data["records"].append(record)
+    week_ago = datetime.now() - timedelta(days=7)
+    data["records"] = [r for r in data["records"] if datetime.fromisoformat(r["timestamp"]) > week_ago]
+    data["weekly_top"] = sorted(data["records"], key=lambda x: x["download"], reverse=True)[:10]
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--records", type=int, default=1000000)
+    ap.add_argument("--ips", type=int, default=50000, help="记录分布在多少个 IP 上")
+    ap.add_argument("--calls", type=int, default=2000, help="每项计时的调用次数")
+    ap.add_argument("--legacy", action="store_true", help="同时测旧版 JSON 存储的一次保存")
+    args = ap.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="speedtest-records-"))
+    S = load()
+    S.init_data()
+    now = time.time()
+    ips = ["10.{}.{}.{}".format(i >> 16, (i >> 8) & 255, i & 255) for i in range(args.ips)]
+    rows = [(random.choice(ips), round(random.uniform(1, 900), 2), round(random.uniform(1, 300), 2),
+             round(random.uniform(1, 100), 2), now - random.uniform(0, 8 * 86400))
+            for _ in range(args.records)]
+    rows.sort(key=lambda r: r[4])
+    t0 = time.perf_counter()
+    with S.db() as conn:
+        conn.executemany("INSERT INTO records(ip, download, upload, latency, ts) VALUES(?,?,?,?,?)", rows)
+    print("写入 {} 条记录：{}".format(args.records, fmt(time.perf_counter() - t0)))
+
+    t0 = time.perf_counter()
+    S.load_clients()                # 汇总表为空，从明细重建（旧库升级的路径）
+    print("从明细重建每 IP 汇总：{}".format(fmt(time.perf_counter() - t0)))
+    t0 = time.perf_counter()
+    S.load_clients()
+    S.rebuild_leaderboards()
+    print("启动（读汇总 + 重建排行榜）：{}".format(fmt(time.perf_counter() - t0)))
+
+    print("update_records          {}".format(fmt(timed(
+        lambda: S.update_records(random.choice(ips), random.uniform(1, 900), random.uniform(1, 300),
+                                 random.uniform(1, 100)), args.calls))))
+    print("get_client_best_record  {}".format(fmt(timed(
+        lambda: S.get_client_best_record(random.choice(ips)), args.calls))))
+    print("get_leaderboard         {}".format(fmt(timed(
+        lambda: S.get_leaderboard(random.choice(("download", "upload", "latency")),
+                                  random.choice(tuple(S.WINDOWS))), args.calls))))
+
+    before = S.db().execute("SELECT COUNT(*) FROM records").fetchone()[0]
+    t0 = time.perf_counter()
+    S.compact()
+    after = S.db().execute("SELECT COUNT(*) FROM records").fetchone()[0]
+    print("compact：删除 {} 条过期记录，{}".format(before - after, fmt(time.perf_counter() - t0)))
+
+    if args.legacy:
+        path = "speedtest_data.json"
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"records": [{"ip": r[0], "download": r[1], "upload": r[2], "latency": r[3],
+                                    "timestamp": datetime.fromtimestamp(r[4]).isoformat(),
+                                    "date": datetime.fromtimestamp(r[4]).strftime("%Y-%m-%d %H:%M:%S")}
+                                   for r in rows], "weekly_top": []}, f, ensure_ascii=False, indent=2)
+        now = datetime.now()
+        record = {"ip": ips[0], "download": 1.0, "upload": 1.0, "latency": 1.0,
+                  "timestamp": now.isoformat(), "date": now.strftime("%Y-%m-%d %H:%M:%S")}
+        print("旧版 JSON 保存一次      {}".format(fmt(timed(lambda: legacy_save(path, record), 1))))
+
+if __name__ == "__main__":
+    main()
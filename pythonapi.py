@@ -3,16 +3,23 @@ PhonePaaS v3 — 单文件 Python PaaS 平台
 依赖: pip install flask pillow werkzeug
 启动: python phonepaas.py
 """
-import io, os, re, shutil, sqlite3, importlib.util, traceback, sys, random, json
+import io, os, re, bisect, collections, hashlib, hmac, shutil, sqlite3, importlib.util, traceback, sys, random, json
+import atexit, itertools, queue, select, signal, socket, subprocess, threading, time, http.client
+import tarfile, tempfile, tracemalloc, zipfile, zlib
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from functools import wraps
+from email.utils import parsedate_to_datetime
+from functools import lru_cache, wraps
 from pathlib import Path
+from urllib.parse import quote, urlencode
 
-from flask import (Flask, request, session, redirect,
-                   render_template_string, flash, send_file, abort)
+from flask import (Flask, Response, request, session, redirect, g, jsonify,
+                   flash, get_flashed_messages, send_file, abort)
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
-from werkzeug.serving import run_simple
+from werkzeug.serving import run_simple, make_server, BaseWSGIServer, WSGIRequestHandler
+from werkzeug.exceptions import InternalServerError, ClientDisconnected
+from werkzeug.wsgi import LimitedStream
 
 try:
     from PIL import Image, ImageDraw, ImageFont, ImageFilter
@@ -28,43 +35,1168 @@ SVC_DIR    = "services"
 MAX_SVC    = 5
 PREFIX     = "/s"
 
-main_app = Flask(__name__)
+main_app = Flask(__name__, static_folder=None)    # /static 只用来发带哈希的 CSS
 main_app.secret_key = os.environ.get("SECRET_KEY", "phonepaas-dev-secret")
 
 # ═══ 同进程 WSGI 分发器 ══════════════════════════════════════
+# 路由表在 mount/unmount 时预先编译好（写时复制，整体替换），
+# 请求路径上只做若干次 dict 查找，不再 split 路径、不再复制 environ
+class Mount:
+    __slots__ = ("name", "prefix", "host", "app", "owner", "key")
+
+    def __init__(self, name, app, prefix=None, host=None, owner=None):
+        self.name   = name
+        self.app    = app
+        self.owner  = owner
+        self.host   = host.lower() if host else None
+        self.prefix = None if host else (prefix or "{}/{}".format(PREFIX, name)).rstrip("/")
+        self.key    = self.host or self.prefix     # 命中计数的键：前缀以 / 开头，主机名不会
+
 class Dispatcher:
     def __init__(self, app):
-        self.main = app
-        self.apps = {}
-
-    def mount(self, name, wsgi_app):
-        self.apps[name] = wsgi_app
+        self.main    = app
+        self.apps    = {}       # name -> wsgi app
+        self.mounts  = {}       # name -> [Mount, ...]
+        self._routes = {}       # "/s/name" -> Mount
+        self._hosts  = {}       # "api.example.com" -> Mount
+        self._depth  = 0        # 路由前缀的最大段数
+        self.limits  = {}       # name -> Limiter，没配限流的服务不在里面
+        self.caches  = {}       # name -> ResponseCache，没开缓存的服务不在里面
+        self._lock   = threading.Lock()   # 写者之间串行（复制-修改-替换），读者不加锁
+
+    def mount(self, name, wsgi_app, prefix=None, host=None, owner=None):
+        new = Mount(name, wsgi_app, prefix, host, owner)
+        with self._lock:
+            ms = [m for m in self.mounts.get(name, [])
+                  if (m.prefix, m.host) != (new.prefix, new.host)]
+            ms.append(new)
+            mounts = dict(self.mounts)
+            mounts[name] = ms
+            self._rebuild(mounts)
+
+    def limit(self, name, limiter):
+        with self._lock:
+            limits = dict(self.limits)
+            if limiter is None:
+                limits.pop(name, None)
+            else:
+                limits[name] = limiter
+            self.limits = limits
+
+    def cache(self, name, rc):
+        with self._lock:
+            caches = dict(self.caches)
+            old = caches.pop(name, None)
+            if rc is not None:
+                caches[name] = rc
+            self.caches = caches
+        if old is not None:
+            old.purge()
 
     def unmount(self, name):
-        self.apps.pop(name, None)
+        self.limit(name, None)
+        self.cache(name, None)
+        with self._lock:
+            if name in self.mounts:
+                mounts = dict(self.mounts)
+                del mounts[name]
+                self._rebuild(mounts)
+
+    def _rebuild(self, mounts):
+        routes, hosts = {}, {}
+        for ms in mounts.values():
+            for m in ms:
+                if m.host:
+                    hosts[m.host] = m
+                else:
+                    routes[m.prefix] = m
+        self._depth  = max([p.count("/") for p in routes] or [0])
+        self._routes = routes
+        self._hosts  = hosts
+        self.mounts  = mounts
+        self.apps    = {n: ms[-1].app for n, ms in mounts.items()}
+
+    def hit_counts(self):
+        """当前挂载点的命中数：{服务名: {前缀或主机名: 次数}}，没被访问过的挂载点记 0"""
+        hits = mount_hits()
+        return {n: {m.key: hits.get(m.key, 0) for m in ms} for n, ms in self.mounts.items()}
 
     def __call__(self, environ, start_response):
-        path = environ.get("PATH_INFO", "")
-        pfx  = PREFIX + "/"
-        if path.startswith(pfx):
-            rest = path[len(pfx):]
-            name = rest.split("/")[0]
-            if name and name in self.apps:
-                sub = path[len(pfx) + len(name):] or "/"
-                env = dict(environ)
-                env["SCRIPT_NAME"] = environ.get("SCRIPT_NAME", "") + pfx + name
-                env["PATH_INFO"]   = sub
-                return self.apps[name](env, start_response)
-        return self.main(environ, start_response)
+        m = None
+        if self._hosts:
+            m = self._hosts.get(environ.get("HTTP_HOST", "").split(":")[0].lower())
+        routes = self._routes
+        if m is None and routes:
+            path = environ.get("PATH_INFO", "")
+            # 只看前 _depth 段，再从长到短逐级回退（嵌套前缀取最长匹配）
+            i = 0
+            for _ in range(self._depth):
+                i = path.find("/", i + 1)
+                if i < 0:
+                    i = len(path)
+                    break
+            while i > 0:
+                m = routes.get(path[:i])
+                if m is not None:
+                    environ["SCRIPT_NAME"] = environ.get("SCRIPT_NAME", "") + path[:i]
+                    environ["PATH_INFO"]   = path[i:] or "/"
+                    break
+                i = path.rfind("/", 0, i)
+        if m is None:
+            return Metered(None, self.main, environ, start_response)
+        tid  = threading.get_ident()
+        hits = _hit_tables.get(tid)
+        if hits is None:
+            hits = _hit_tables[tid] = {}
+        hits[m.key] = hits.get(m.key, 0) + 1
+        app = m.app
+        rc  = self.caches.get(m.name)
+        if rc is not None:
+            hit = rc.lookup(environ)
+            if hit is not None:
+                return Metered(m.name, hit, environ, start_response, None, m.owner)
+            app = rc.fill(app, environ)
+        lim = self.limits.get(m.name)
+        if lim is not None:
+            code = lim.admit()
+            if code:
+                access_log(m.name, environ, code, len(LIMIT_BODY[code]), 0, m.owner)
+                return lim.reject(code, start_response)
+        return Metered(m.name, app, environ, start_response, lim, m.owner)
 
 dispatcher = Dispatcher(main_app)
 
+# ═══ 服务指标 ═════════════════════════════════════════════════
+# 每个线程一张计数表（按线程 ident 存），请求路径上只改本线程自己的 list，
+# 不加锁；读的时候把所有线程的表加起来。线程退出后 ident 会被新线程复用，表也跟着复用。
+# 一行计数：[请求数, 1xx, 2xx, 3xx, 4xx, 5xx, 出字节, 总耗时us, 线程 CPU us, 直方图...]
+# 直方图是 HDR 风格的对数-线性桶（微秒）：每个 2 的幂区间再均分 4 格，相对误差 ≤ 25%
+HIST_SUB     = 4
+HIST_BUCKETS = 100             # 最后一格 ≈ 58 秒起，更慢的也算在里面
+MET_BYTES    = 6
+MET_US       = 7
+MET_CPU      = 8
+MET_HIST     = 9
+MET_LE       = [1 << k for k in range(27)]     # Prometheus 只输出 2 的幂边界，正好都是桶边界
+_met_tables  = {}              # 线程 ident -> {服务名: 计数行}
+_hit_tables  = {}              # 线程 ident -> {挂载点键: 命中数}，分发时计（含缓存命中和被限流的）
+_STATUS_CLS  = {"1": 1, "2": 2, "3": 3, "4": 4, "5": 5}
+
+def _bucket(us):
+    if us < HIST_SUB:
+        return us
+    e = us.bit_length() - 3                    # 让 us >> e 落在 [4, 8)
+    return min(HIST_SUB * e + (us >> e), HIST_BUCKETS - 1)
+
+def _bucket_floor(i):
+    if i < HIST_SUB:
+        return i
+    e = i // HIST_SUB - 1
+    return (i % HIST_SUB + HIST_SUB) << e
+
+def _met_record(name, cls, nbytes, us, cpu_us):
+    tid = threading.get_ident()
+    tab = _met_tables.get(tid)
+    if tab is None:
+        tab = _met_tables[tid] = {}
+    row = tab.get(name)
+    if row is None:
+        row = tab[name] = [0] * (MET_HIST + HIST_BUCKETS)
+    row[0]         += 1
+    row[cls]       += 1
+    row[MET_BYTES] += nbytes
+    row[MET_US]    += us
+    row[MET_CPU]   += cpu_us
+    row[MET_HIST + _bucket(us)] += 1
+
+class Metered:
+    """包住一次请求：记下状态码、出字节数，响应体发完（close）时记耗时并写访问日志。
+    name 为 None 的是主站请求，只写访问日志，不计入服务指标"""
+    __slots__ = ("name", "it", "t0", "c0", "cls", "status", "nbytes", "lim", "environ", "owner")
+
+    def __init__(self, name, app, environ, start_response, lim=None, owner=None):
+        self.name    = name
+        self.lim     = lim
+        self.environ = environ
+        self.owner   = owner
+        self.t0      = time.perf_counter()
+        self.c0      = time.thread_time()     # 整个请求都在同一个服务器线程里，线程 CPU 时间就是它的开销
+        self.cls     = 5
+        self.status  = "500"
+        self.nbytes  = 0
+        self.it      = ()
+
+        def sr(status, headers, exc_info=None):
+            self.status = status
+            self.cls    = _STATUS_CLS.get(status[:1], 5)
+            return start_response(status, headers, exc_info)
+
+        try:
+            self.it = app(environ, sr)
+        except BaseException:
+            self.cls    = 5
+            self.status = "500"
+            self.close()
+            raise
+
+    def __iter__(self):
+        for chunk in self.it:
+            self.nbytes += len(chunk)
+            yield chunk
+
+    def close(self):
+        if self.t0 is None:
+            return
+        try:
+            if hasattr(self.it, "close"):
+                self.it.close()
+        finally:
+            us = int((time.perf_counter() - self.t0) * 1e6)
+            self.t0 = None
+            if self.name is not None:
+                _met_record(self.name, self.cls, self.nbytes, us,
+                            int((time.thread_time() - self.c0) * 1e6))
+            access_log(self.name, self.environ, self.status, self.nbytes, us,
+                       self.environ.get("paas.uid", self.owner))
+            if self.lim is not None:
+                self.lim.release()
+
+def metrics_rows():
+    out = {}
+    for tab in list(_met_tables.values()):
+        for name, row in list(tab.items()):
+            acc = out.get(name)
+            if acc is None:
+                out[name] = list(row)
+            else:
+                for i, v in enumerate(row):
+                    acc[i] += v
+    return out
+
+def mount_hits():
+    out = {}
+    for tab in list(_hit_tables.values()):
+        for key, n in list(tab.items()):
+            out[key] = out.get(key, 0) + n
+    return out
+
+def _quantile_ms(row, q):
+    need = row[0] * q
+    seen = 0
+    for i in range(HIST_BUCKETS):
+        seen += row[MET_HIST + i]
+        if seen >= need and seen:
+            return _bucket_floor(i + 1) / 1000.0     # 取桶上沿，偏保守
+    return 0.0
+
+def metrics_summary(names=None):
+    out = {}
+    for name, row in sorted(metrics_rows().items()):
+        if names is not None and name not in names:
+            continue
+        n = row[0]
+        out[name] = {
+            "requests": n,
+            "status":   {"{}xx".format(c): row[c] for c in range(1, 6)},
+            "bytes":    row[MET_BYTES],
+            "mean_ms":  round(row[MET_US] / n / 1000.0, 3) if n else 0.0,
+            "cpu_ms":   round(row[MET_CPU] / 1000.0, 3),
+            "p50_ms":   _quantile_ms(row, 0.50),
+            "p90_ms":   _quantile_ms(row, 0.90),
+            "p99_ms":   _quantile_ms(row, 0.99),
+            "mounted":  name in dispatcher.mounts,
+        }
+    for name, lim in dispatcher.limits.items():
+        if name in out:
+            out[name]["limited"] = {str(k): v for k, v in lim.rejected.items()}
+    for name, rc in dispatcher.caches.items():
+        if name in out:
+            out[name]["cache"] = rc.summary()
+    for name, hits in dispatcher.hit_counts().items():
+        if name in out:
+            out[name]["mounts"] = hits
+    return out
+
+def metrics_prometheus():
+    rows  = sorted(metrics_rows().items())
+    lines = [
+        "# HELP paas_requests_total Requests handled by a mounted service.",
+        "# TYPE paas_requests_total counter",
+    ]
+    for name, row in rows:
+        for c in range(1, 6):
+            lines.append('paas_requests_total{{service="{}",code="{}xx"}} {}'.format(name, c, row[c]))
+    lines += ["# HELP paas_response_bytes_total Response body bytes sent by a service.",
+              "# TYPE paas_response_bytes_total counter"]
+    for name, row in rows:
+        lines.append('paas_response_bytes_total{{service="{}"}} {}'.format(name, row[MET_BYTES]))
+    lines += ["# HELP paas_cpu_seconds_total Thread CPU time spent serving a service's requests.",
+              "# TYPE paas_cpu_seconds_total counter"]
+    for name, row in rows:
+        lines.append('paas_cpu_seconds_total{{service="{}"}} {:.6f}'.format(name, row[MET_CPU] / 1e6))
+    lines += ["# HELP paas_request_duration_seconds Time until the response body was fully sent.",
+              "# TYPE paas_request_duration_seconds histogram"]
+    for name, row in rows:
+        cum, i = 0, 0
+        for le in MET_LE:
+            while i < HIST_BUCKETS and _bucket_floor(i + 1) <= le:
+                cum += row[MET_HIST + i]
+                i   += 1
+            lines.append('paas_request_duration_seconds_bucket{{service="{}",le="{:g}"}} {}'.format(name, le / 1e6, cum))
+        lines.append('paas_request_duration_seconds_bucket{{service="{}",le="+Inf"}} {}'.format(name, row[0]))
+        lines.append('paas_request_duration_seconds_sum{{service="{}"}} {:.6f}'.format(name, row[MET_US] / 1e6))
+        lines.append('paas_request_duration_seconds_count{{service="{}"}} {}'.format(name, row[0]))
+    lines += ["# HELP paas_mount_requests_total Requests routed to a mount point (path prefix or host).",
+              "# TYPE paas_mount_requests_total counter"]
+    for name, hits in sorted(dispatcher.hit_counts().items()):
+        for key, n in sorted(hits.items()):
+            lines.append('paas_mount_requests_total{{service="{}",mount="{}"}} {}'.format(name, key, n))
+    lines += ["# HELP paas_limited_total Requests rejected by the per-service limiter.",
+              "# TYPE paas_limited_total counter"]
+    for name, lim in sorted(dispatcher.limits.items()):
+        for code, n in sorted(lim.rejected.items()):
+            lines.append('paas_limited_total{{service="{}",code="{}"}} {}'.format(name, code, n))
+    lines += ["# HELP paas_cache_requests_total Response cache lookups by result.",
+              "# TYPE paas_cache_requests_total counter"]
+    for name, rc in sorted(dispatcher.caches.items()):
+        for result in ("hit", "miss", "bypass", "not_modified", "disk_hit"):
+            lines.append('paas_cache_requests_total{{service="{}",result="{}"}} {}'.format(name, result, rc.stats[result]))
+    lines += ["# HELP paas_gzip_bytes_total Body bytes before (in) and after (out) gzip compression.",
+              "# TYPE paas_gzip_bytes_total counter",
+              'paas_gzip_bytes_total{{dir="in"}} {}'.format(gzip_stats["bytes_in"]),
+              'paas_gzip_bytes_total{{dir="out"}} {}'.format(gzip_stats["bytes_out"]),
+              "# HELP paas_gzip_memo_hits_total Responses served from the precompressed LRU.",
+              "# TYPE paas_gzip_memo_hits_total counter",
+              "paas_gzip_memo_hits_total {}".format(gzip_stats["memo_hits"]),
+              "# HELP paas_access_log_lines_total Access log lines written to disk or dropped.",
+              "# TYPE paas_access_log_lines_total counter",
+              'paas_access_log_lines_total{{result="written"}} {}'.format(access_stats["written"]),
+              'paas_access_log_lines_total{{result="dropped"}} {}'.format(access_stats["dropped"])]
+    conns, queries = db_totals()
+    lines += ["# HELP paas_db_connections_total SQLite connections opened by db().",
+              "# TYPE paas_db_connections_total counter",
+              "paas_db_connections_total {}".format(conns),
+              "# HELP paas_db_queries_total SQL statements run through db() connections.",
+              "# TYPE paas_db_queries_total counter",
+              "paas_db_queries_total {}".format(queries)]
+    return "\n".join(lines) + "\n"
+
+# ═══ 访问日志 ═════════════════════════════════════════════════
+# 每个请求一条 JSON（JSON lines）。请求路径上只往环形缓冲里放一个元组：
+# 取一个全局序号，写进 _log_ring[序号 % 容量]，不加锁、不格式化、不碰磁盘。
+# 后台线程每 ACCESS_FLUSH 秒把新条目格式化后一次写进日志文件，文件超过
+# ACCESS_LOG_MAX 时轮转（access.log.1 … .N）。写线程跟不上、条目在写出前
+# 就被覆盖时，按丢弃计数。/admin/logs 直接从环形缓冲里取最近的条目
+ACCESS_LOG      = os.environ.get("PAAS_ACCESS_LOG", "logs/access.log")   # 设为空字符串则不写文件
+ACCESS_RING     = 16384        # 环形缓冲条数（2 的幂）
+ACCESS_FLUSH    = 1.0          # 写线程的批量间隔（秒）
+ACCESS_LOG_MAX  = 10 << 20     # 单个日志文件的大小上限
+ACCESS_LOG_KEEP = 5            # 保留的轮转文件数
+ACCESS_TAIL_MAX = 1000         # /admin/logs 一次最多返回的条数
+_log_ring       = [None] * ACCESS_RING
+_log_seq        = itertools.count(1)      # next() 在 GIL 下是原子的
+_log_lock       = threading.Lock()        # 只有写线程和退出时的 flush 用
+access_stats    = {"written": 0, "dropped": 0, "last": 0}     # last：已写出的最大序号
+
+def access_log(name, environ, status, nbytes, us, uid):
+    seq = next(_log_seq)
+    _log_ring[seq & (ACCESS_RING - 1)] = (
+        seq, time.time(), name, environ.get("REQUEST_METHOD"),
+        environ.get("SCRIPT_NAME", "") + environ.get("PATH_INFO", ""),
+        status, nbytes, us, uid, environ.get("REMOTE_ADDR"))
+
+def _log_dict(e):
+    status = e[5]
+    return {"seq": e[0], "ts": round(e[1], 3), "service": e[2] or "-", "method": e[3], "path": e[4],
+            "status": int(status[:3]) if isinstance(status, str) else status,
+            "bytes": e[6], "ms": round(e[7] / 1000.0, 3), "uid": e[8], "ip": e[9]}
+
+def _log_pending(last):
+    """last 之后已经落进缓冲的条目（按序号），以及其间被覆盖掉的条数"""
+    out, lost, seq = [], 0, last + 1
+    while True:
+        e = _log_ring[seq & (ACCESS_RING - 1)]
+        if e is None or e[0] < seq:
+            return out, lost            # 还没写到这里
+        if e[0] > seq:                  # 被套圈了，seq 到 e[0]-容量 这一段都已覆盖
+            skip  = e[0] - ACCESS_RING + 1
+            lost += skip - seq
+            seq   = skip
+            continue
+        out.append(e)
+        seq += 1
+
+def log_tail(n, since=0, service=None):
+    entries = sorted((e for e in _log_ring if e is not None and e[0] > since), key=lambda e: e[0])
+    if service is not None:
+        entries = [e for e in entries if (e[2] or "-") == service]
+    return [_log_dict(e) for e in entries[-n:]]
+
+def _rotate_log(path):
+    for i in range(ACCESS_LOG_KEEP - 1, 0, -1):
+        if os.path.exists("{}.{}".format(path, i)):
+            os.replace("{}.{}".format(path, i), "{}.{}".format(path, i + 1))
+    os.replace(path, path + ".1")
+
+def flush_access_log():
+    with _log_lock:
+        entries, lost = _log_pending(access_stats["last"])
+        if not entries:
+            return 0
+        access_stats["last"]     = entries[-1][0]
+        access_stats["dropped"] += lost
+        if not ACCESS_LOG:
+            return 0
+        data = "".join(json.dumps(_log_dict(e), ensure_ascii=False) + "\n" for e in entries).encode("utf-8")
+        try:
+            Path(ACCESS_LOG).parent.mkdir(parents=True, exist_ok=True)
+            if os.path.exists(ACCESS_LOG) and os.path.getsize(ACCESS_LOG) + len(data) > ACCESS_LOG_MAX:
+                _rotate_log(ACCESS_LOG)
+            with open(ACCESS_LOG, "ab") as f:
+                f.write(data)
+        except OSError:
+            access_stats["dropped"] += len(entries)
+            return 0
+        access_stats["written"] += len(entries)
+        return len(entries)
+
+def _access_writer():
+    while True:
+        time.sleep(ACCESS_FLUSH)
+        flush_access_log()
+
+def start_access_log():
+    threading.Thread(target=_access_writer, daemon=True, name="access-log").start()
+    atexit.register(flush_access_log)
+
+# ═══ 服务限流 ═════════════════════════════════════════════════
+# 每个服务一个 Limiter：令牌桶限制请求速率（超了回 429），信号量限制同时
+# 在途的请求数（满了最多排队 queue_ms 毫秒，还不行回 503）。被拒的请求
+# 不进入用户代码，也不占用服务器线程。排队的请求是占着服务器线程等的，
+# 所以排队数最多为在途上限的一半，保证一个服务被刷爆时仪表盘和别的服务还有线程可用。
+# 参数存在 services 表里，0 表示不限（默认，服务所有者自己开启）；保存后立即生效，不用重新部署
+LIMIT_BODY     = {429: b"429 Too Many Requests\n", 503: b"503 Service Busy\n"}
+LIMIT_STATUS   = {429: "429 Too Many Requests", 503: "503 Service Unavailable"}
+
+class Limiter:
+    def __init__(self, rate=0, burst=0, inflight=0, queue_ms=0):
+        self.rate     = float(rate or 0)
+        self.burst    = int(burst or 0) or max(1, int(round(self.rate)))
+        self.tokens   = float(self.burst)
+        self.stamp    = time.monotonic()
+        self.inflight = int(inflight or 0)
+        self.sem      = threading.Semaphore(self.inflight) if self.inflight else None
+        self.wait     = (queue_ms or 0) / 1000.0
+        self.queue    = self.inflight // 2
+        self.waiting  = 0
+        self.lock     = threading.Lock()
+        self.rejected = {429: 0, 503: 0}
+
+    @staticmethod
+    def for_service(svc):
+        if not (svc["rate_limit"] or svc["max_inflight"]):
+            return None
+        return Limiter(svc["rate_limit"], svc["rate_burst"], svc["max_inflight"], svc["queue_ms"])
+
+    def admit(self):
+        if self.rate:
+            with self.lock:
+                now         = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+                self.stamp  = now
+                if self.tokens < 1:
+                    self.rejected[429] += 1
+                    return 429
+                self.tokens -= 1
+        if self.sem is None or self.sem.acquire(False):
+            return 0
+        with self.lock:
+            if not self.wait or self.waiting >= self.queue:
+                self.rejected[503] += 1
+                return 503
+            self.waiting += 1
+        ok = self.sem.acquire(timeout=self.wait)
+        with self.lock:
+            self.waiting -= 1
+            if not ok:
+                self.rejected[503] += 1
+        return 0 if ok else 503
+
+    def release(self):
+        if self.sem is not None:
+            self.sem.release()
+
+    def reject(self, code, start_response):
+        body  = LIMIT_BODY[code]
+        retry = max(1, int(1 / self.rate + 0.999)) if code == 429 else 1
+        start_response(LIMIT_STATUS[code], [
+            ("Content-Type",   "text/plain; charset=utf-8"),
+            ("Content-Length", str(len(body))),
+            ("Retry-After",    str(retry)),
+        ])
+        return [body]
+
+# ═══ 服务响应缓存 ═════════════════════════════════════════════
+# 可选，按服务开启：挡在挂载的 WSGI app 前面，命中时不进入用户代码（也不占限流名额）。
+# 只缓存 GET 的 200 响应，且响应必须用 Cache-Control: max-age / s-maxage 或 Expires
+# 明确给出新鲜期；no-store / private / no-cache、带 Set-Cookie、Vary: * 的都不存，
+# 带 Authorization 的请求直接穿透。按 Vary 列出的请求头区分变体。
+# 内存里是按字节计预算的 LRU；开了磁盘层时，被挤出内存的条目落到 CACHE_DIR/<服务名>/，
+# 再次命中时读回内存。缓存的响应都带 ETag（应用没给就按内容算一个），
+# If-None-Match 对上时回 304。对同一 URL 的 POST/PUT/PATCH/DELETE 会让它失效；
+# 重新部署或在服务页点「清空缓存」时整体清空
+CACHE_DIR      = "cache"
+CACHE_ITEM_MAX = 1 << 20       # 单个响应体超过这个大小就不缓存
+CACHE_MAX_MB   = 256           # 内存 / 磁盘预算各自的上限（MiB）
+CACHE_SKIP     = {"connection", "keep-alive", "transfer-encoding", "age", "x-cache"}
+CACHE_304_KEEP = {"cache-control", "content-location", "date", "etag", "expires", "vary", "last-modified"}
+_CC_ITEM       = re.compile(r"([\w-]+)\s*(?:=\s*\"?([^\",]*)\"?)?")
+
+def _cache_control(value):
+    return {k.lower(): v for k, v in _CC_ITEM.findall(value or "")}
+
+def _etag_match(header, etag):
+    if header.strip() == "*":
+        return True
+    tag = etag[2:] if etag.startswith("W/") else etag
+    return any((t[2:] if t.startswith("W/") else t) == tag
+               for t in (s.strip() for s in header.split(",")))
+
+class CacheEntry:
+    __slots__ = ("status", "headers", "body", "etag", "expires", "stored", "size")
+
+    def __init__(self, status, headers, body, etag, expires, stored):
+        self.status  = status
+        self.headers = headers
+        self.body    = body
+        self.etag    = etag
+        self.expires = expires
+        self.stored  = stored
+        self.size    = len(body) + sum(len(k) + len(v) for k, v in headers) + 64
+
+class ResponseCache:
+    def __init__(self, name, mem_bytes, disk_bytes=0):
+        self.name     = name
+        self.mem_max  = mem_bytes
+        self.disk_max = disk_bytes
+        self.dir      = Path(CACHE_DIR) / name
+        self.mem      = collections.OrderedDict()     # key -> CacheEntry，末尾是最近用过的
+        self.mem_size = 0
+        self.disk     = collections.OrderedDict()     # key -> (文件路径, 大小, 过期时间)
+        self.disk_size = 0
+        self.vary     = {}                            # 基础 key -> 参与区分的请求头（environ 名）
+        self.variants = {}                            # 基础 key -> {完整 key}
+        self.lock     = threading.Lock()
+        self.stats    = {"hit": 0, "miss": 0, "not_modified": 0, "disk_hit": 0, "store": 0, "bypass": 0}
+
+    @staticmethod
+    def for_service(svc):
+        if not svc["cache_mb"]:
+            return None
+        return ResponseCache(svc["name"], svc["cache_mb"] << 20, (svc["cache_disk_mb"] or 0) << 20)
+
+    @staticmethod
+    def base_key(environ):
+        return "{}{}{}?{}".format(environ.get("HTTP_HOST", ""), environ.get("SCRIPT_NAME", ""),
+                                  environ.get("PATH_INFO", ""), environ.get("QUERY_STRING", ""))
+
+    def _key(self, base, environ):
+        names = self.vary.get(base)
+        if not names:
+            return base
+        return base + "\0" + "\0".join(environ.get(n, "") for n in names)
+
+    # —— 请求路径 ——
+    def lookup(self, environ):
+        """命中返回一个直接吐缓存内容的 WSGI app；否则返回 None，由 fill() 去跑用户 app"""
+        method = environ.get("REQUEST_METHOD", "GET")
+        if method not in ("GET", "HEAD"):
+            self.invalidate(self.base_key(environ))
+            return None
+        req_cc = environ.get("HTTP_CACHE_CONTROL", "")
+        if "HTTP_AUTHORIZATION" in environ or "no-store" in req_cc \
+                or "no-cache" in req_cc or "no-cache" in environ.get("HTTP_PRAGMA", ""):
+            with self.lock:
+                self.stats["bypass"] += 1
+            return None
+        base = self.base_key(environ)
+        key  = self._key(base, environ)
+        now  = time.time()
+        with self.lock:
+            e = self.mem.get(key)
+            if e is not None:
+                if e.expires > now:
+                    self.mem.move_to_end(key)
+                else:
+                    self._drop(key)
+                    e = None
+        if e is None:
+            e = self._disk_get(key, now)
+        inm = environ.get("HTTP_IF_NONE_MATCH")
+        nm  = e is not None and bool(inm) and _etag_match(inm, e.etag)
+        with self.lock:
+            self.stats["hit" if e is not None else "miss"] += 1
+            if nm:
+                self.stats["not_modified"] += 1
+        if e is None:
+            return None
+        if nm:
+            return lambda env, sr: self._serve(e, sr, now, 304)
+        return lambda env, sr: self._serve(e, sr, now, e.status, method == "HEAD")
+
+    def _serve(self, e, start_response, now, status, head=False):
+        headers = [("Age", str(max(0, int(now - e.stored)))), ("X-Cache", "HIT")]
+        if status == 304:
+            start_response("304 Not Modified",
+                           [h for h in e.headers if h[0].lower() in CACHE_304_KEEP] + headers)
+            return []
+        start_response(e.status, e.headers + headers)
+        return [] if head else [e.body]
+
+    def fill(self, app, environ):
+        """包住一次未命中的 GET：边往外发边攒响应体，完整发完且可缓存时存下来"""
+        if environ.get("REQUEST_METHOD") != "GET" or "HTTP_AUTHORIZATION" in environ \
+                or "no-store" in environ.get("HTTP_CACHE_CONTROL", ""):
+            return app
+        return lambda env, sr: CacheFill(self, app, env, sr)
+
+    def store(self, environ, status, headers, body):
+        now     = time.time()
+        expires = self._expires(headers, now)
+        if expires is None:
+            return
+        vary = []
+        etag = None
+        for k, v in headers:
+            lk = k.lower()
+            if lk == "vary":
+                vary += [h.strip() for h in v.split(",") if h.strip()]
+            elif lk == "etag":
+                etag = v
+            elif lk == "set-cookie":
+                return
+        if "*" in vary:
+            return
+        headers = [(k, v) for k, v in headers if k.lower() not in CACHE_SKIP]
+        if etag is None:
+            etag = '"{}"'.format(hashlib.sha1(body).hexdigest()[:20])
+            headers.append(("ETag", etag))
+        base  = self.base_key(environ)
+        names = tuple(sorted("HTTP_" + h.upper().replace("-", "_") for h in vary))
+        e     = CacheEntry(status, headers, body, etag, expires, now)
+        with self.lock:
+            if self.vary.get(base, ()) != names:
+                self._invalidate(base)
+                self.vary[base] = names
+            key = self._key(base, environ)
+            self._drop(key)
+            self.variants.setdefault(base, set()).add(key)
+            spill = self._admit(key, e, now)
+            self.stats["store"] += 1
+        for k, old in spill:
+            self._disk_put(k, old)
+
+    def _admit(self, key, e, now):
+        """放进内存 LRU，挤出来的条目返回给调用方在锁外写盘（没开磁盘层就直接丢掉）"""
+        self.mem[key] = e
+        self.mem_size += e.size
+        spill = []
+        while self.mem_size > self.mem_max and self.mem:
+            k, old = self.mem.popitem(last=False)
+            self.mem_size -= old.size
+            if self.disk_max and old.expires > now:
+                spill.append((k, old))
+            else:
+                self._forget(k)
+        return spill
+
+    @staticmethod
+    def _expires(headers, now):
+        cc = exp = None
+        for k, v in headers:
+            lk = k.lower()
+            if lk == "cache-control":
+                cc = _cache_control(v)
+            elif lk == "expires":
+                exp = v
+        if cc is not None:
+            if "no-store" in cc or "private" in cc or "no-cache" in cc:
+                return None
+            for d in ("s-maxage", "max-age"):
+                if d in cc:
+                    try:
+                        age = int(cc[d])
+                    except ValueError:
+                        return None
+                    return now + age if age > 0 else None
+        if exp:
+            try:
+                t = parsedate_to_datetime(exp).timestamp()
+            except (TypeError, ValueError):
+                return None
+            return t if t > now else None
+        return None
+
+    # —— 失效 ——
+    def invalidate(self, base):
+        with self.lock:
+            self._invalidate(base)
+
+    def _invalidate(self, base):
+        for key in self.variants.pop(base, ()):
+            self._drop(key, False)
+        self.vary.pop(base, None)
+
+    def _drop(self, key, forget=True):
+        e = self.mem.pop(key, None)
+        if e is not None:
+            self.mem_size -= e.size
+        d = self.disk.pop(key, None)
+        if d is not None:
+            self.disk_size -= d[1]
+            try:
+                os.unlink(d[0])
+            except OSError:
+                pass
+        if forget:
+            self._forget(key)
+
+    def _forget(self, key):
+        if key in self.disk:
+            return
+        base = key.split("\0", 1)[0]
+        keys = self.variants.get(base)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self.variants[base]
+                self.vary.pop(base, None)
+
+    def purge(self):
+        with self.lock:
+            self.mem.clear()
+            self.disk.clear()
+            self.vary.clear()
+            self.variants.clear()
+            self.mem_size = self.disk_size = 0
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    # —— 磁盘层 ——
+    # 一个条目一个文件：第一行是 JSON 元数据，后面是响应体
+    def _disk_put(self, key, e):
+        if e.size > self.disk_max:
+            return
+        path = self.dir / hashlib.sha1(key.encode("utf-8", "surrogateescape")).hexdigest()
+        meta = json.dumps({"status": e.status, "headers": e.headers, "etag": e.etag,
+                           "expires": e.expires, "stored": e.stored}).encode()
+        try:
+            self.dir.mkdir(parents=True, exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(meta + b"\n" + e.body)
+        except OSError:
+            with self.lock:
+                self._forget(key)
+            return
+        with self.lock:
+            if key in self.mem or key.split("\0", 1)[0] not in self.variants:
+                return          # 写盘期间被重新存进内存或被失效了
+            old = self.disk.pop(key, None)
+            if old is not None:
+                self.disk_size -= old[1]
+            self.disk[key] = (path, e.size, e.expires)
+            self.disk_size += e.size
+            while self.disk_size > self.disk_max and self.disk:
+                k, (p, size, _) = self.disk.popitem(last=False)
+                self.disk_size -= size
+                self._forget(k)
+                try:
+                    os.unlink(p)
+                except OSError:
+                    pass
+
+    def _disk_get(self, key, now):
+        with self.lock:
+            d = self.disk.get(key)
+            if d is None:
+                return None
+            if d[2] <= now:
+                self._drop(key)
+                return None
+        try:
+            with open(d[0], "rb") as f:
+                meta = json.loads(f.readline())
+                body = f.read()
+        except (OSError, ValueError):
+            with self.lock:
+                self._drop(key)
+            return None
+        e = CacheEntry(meta["status"], [tuple(h) for h in meta["headers"]], body,
+                       meta["etag"], meta["expires"], meta["stored"])
+        spill = []
+        with self.lock:
+            self.stats["disk_hit"] += 1
+            if self.disk.pop(key, None) is not None:
+                self.disk_size -= d[1]
+                spill = self._admit(key, e, now)
+        try:
+            os.unlink(d[0])
+        except OSError:
+            pass
+        for k, old in spill:
+            self._disk_put(k, old)
+        return e
+
+    def summary(self):
+        s = dict(self.stats)
+        looked = s["hit"] + s["miss"]
+        s["hit_ratio"]  = round(s["hit"] / looked, 4) if looked else 0.0
+        s["entries"]    = len(self.mem) + len(self.disk)
+        s["mem_bytes"]  = self.mem_size
+        s["disk_bytes"] = self.disk_size
+        return s
+
+class CacheFill:
+    """未命中时包住用户 app 的响应：原样流式往外发，同时攒一份，close 时交给缓存"""
+    __slots__ = ("cache", "environ", "it", "status", "headers", "chunks", "size", "done")
+
+    def __init__(self, cache, app, environ, start_response):
+        self.cache   = cache
+        self.environ = environ
+        self.status  = None
+        self.chunks  = []
+        self.size    = 0
+        self.done    = False
+
+        def sr(status, headers, exc_info=None):
+            self.status  = status
+            self.headers = list(headers)
+            return start_response(status, headers + [("X-Cache", "MISS")], exc_info)
+
+        self.it = app(environ, sr)
+
+    def __iter__(self):
+        for chunk in self.it:
+            if self.chunks is not None:
+                self.size += len(chunk)
+                if self.size > CACHE_ITEM_MAX:
+                    self.chunks = None
+                else:
+                    self.chunks.append(chunk)
+            yield chunk
+        self.done = True
+
+    def close(self):
+        try:
+            if hasattr(self.it, "close"):
+                self.it.close()
+        finally:
+            chunks, self.chunks = self.chunks, None
+            if self.done and chunks is not None and self.status and self.status[:3] == "200":
+                self.cache.store(self.environ, self.status, self.headers, b"".join(chunks))
+
+# ═══ 响应压缩 ═════════════════════════════════════════════════
+# 包在 dispatcher 外面，主站和所有挂载的服务一起压缩，只用标准库 zlib（gzip 格式）。
+# 只压缩白名单里的文本类型；已经带 Content-Encoding 的、Range 请求、HEAD、
+# 204/206/304 原样放行。Content-Length 已知且不大的响应一次压完并改写长度，
+# 长度小于 GZIP_MIN 的不压；长度未知或很大的（生成器、大文件）边读边压，
+# 每块后 Z_SYNC_FLUSH，不会把流式响应攒起来。带 ETag 或可缓存的响应
+# （静态 CSS、响应缓存的命中、错误页之类）按内容摘要把压好的结果存进 LRU，下次直接用。
+# 压缩后是另一个表示，ETag 加上 -gzip 后缀（"abc" -> "abc-gzip"），缓存不会把两种表示当成
+# 同一份字节；请求里 If-None-Match / If-Match 带回来的后缀先去掉再交给应用，应用照常比对，
+# 它回的 304 再把后缀加回去
+GZIP_LEVEL      = 6
+GZIP_MIN        = 512          # 小于这个字节数不压缩
+GZIP_BUFFER_MAX = 1 << 20      # Content-Length 不超过这个值时整块压缩
+GZIP_MEMO_BYTES = 4 << 20      # 预压缩结果 LRU 的字节预算
+GZIP_TYPES      = ("text/", "application/json", "application/javascript",
+                   "application/xml", "application/xhtml+xml", "image/svg+xml")
+_gz_memo        = collections.OrderedDict()    # sha1(原文) -> gzip 结果
+_gz_memo_size   = 0
+_gz_lock        = threading.Lock()
+GZIP_ETAG       = "-gzip"
+gzip_stats      = {"responses": 0, "memo_hits": 0, "bytes_in": 0, "bytes_out": 0}
+
+def _accepts_gzip(value):
+    for part in value.lower().split(","):
+        name, _, params = part.partition(";")
+        if name.strip() in ("gzip", "*"):
+            q = params.strip()
+            return not (q.startswith("q=") and q[2:].strip() in ("0", "0.0", "0.00", "0.000"))
+    return False
+
+def gzip_bytes(data, memo=False):
+    global _gz_memo_size
+    key = None
+    if memo:
+        key = hashlib.sha1(data).digest()
+        with _gz_lock:
+            out = _gz_memo.get(key)
+            if out is not None:
+                _gz_memo.move_to_end(key)
+                gzip_stats["memo_hits"] += 1
+                return out
+    z   = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    out = z.compress(data) + z.flush()
+    if key is not None and len(out) <= GZIP_MEMO_BYTES // 8:
+        with _gz_lock:
+            if key not in _gz_memo:
+                _gz_memo[key] = out
+                _gz_memo_size += len(out)
+                while _gz_memo_size > GZIP_MEMO_BYTES:
+                    _gz_memo_size -= len(_gz_memo.popitem(last=False)[1])
+    return out
+
+def _gzip_etags(headers):
+    """ETag 加上 -gzip 后缀，弱标记 W/ 保留"""
+    out = []
+    for k, v in headers:
+        if k.lower() == "etag" and v.endswith('"') and not v.endswith(GZIP_ETAG + '"'):
+            v = v[:-1] + GZIP_ETAG + '"'
+        out.append((k, v))
+    return out
+
+class Gzip:
+    def __init__(self, app):
+        self.app = app
+
+    def __call__(self, environ, start_response):
+        # 不管这次要不要压缩都先去掉后缀：编辑器拿压缩过的 GET 的 ETag 去做 PUT 的 If-Match。
+        # If-Range 不动：压缩表示的 ETag 不该让未压缩的分段响应生效
+        retag = False
+        for key in ("HTTP_IF_NONE_MATCH", "HTTP_IF_MATCH"):
+            v = environ.get(key)
+            if v and GZIP_ETAG + '"' in v:
+                environ[key] = v.replace(GZIP_ETAG + '"', '"')
+                retag = True
+        if environ.get("REQUEST_METHOD") == "HEAD" or "HTTP_RANGE" in environ \
+                or not _accepts_gzip(environ.get("HTTP_ACCEPT_ENCODING", "")):
+            return self.app(environ, start_response)
+        return GzipResponse(self.app, environ, start_response, retag)
+
+class GzipResponse:
+    """决定压不压要等看到响应头；要压时 start_response 推迟到拿到响应体之后"""
+    __slots__ = ("it", "start_response", "status", "headers", "length", "memo", "z", "started", "ready", "wfn",
+                 "retag")
+
+    def __init__(self, app, environ, start_response, retag=False):
+        self.start_response = start_response
+        self.status  = None
+        self.z       = None
+        self.started = False
+        self.ready   = False
+        self.retag   = retag    # 条件请求带的是压缩表示的 ETag：应用回 304 时也要带后缀
+        self.it      = app(environ, self._sr)
+        self.ready   = True
+        if self.status is not None and not self.started:
+            self._begin()
+
+    def _sr(self, status, headers, exc_info=None):
+        if exc_info is not None or self.started or not self._wants(status, headers):
+            self.started = True
+            if self.retag and status[:3] == "304":
+                headers = _gzip_etags(headers)
+            return self.start_response(status, headers, exc_info)
+        self.status  = status
+        self.headers = headers
+        if self.ready:
+            # 到迭代时才调 start_response 的应用：只能流式压缩
+            self._stream()
+        return self._write
+
+    def _wants(self, status, headers):
+        if status[:3] in ("204", "206", "304"):
+            return False
+        ctype = ""
+        self.length = None
+        self.memo   = False
+        for k, v in headers:
+            lk = k.lower()
+            if lk == "content-encoding":
+                return False
+            if lk == "content-type":
+                ctype = v.lower()
+            elif lk == "content-length":
+                try:
+                    self.length = int(v)
+                except ValueError:
+                    return False
+            elif lk == "etag" or (lk == "cache-control" and ("max-age" in v or "public" in v)):
+                self.memo = True
+        if not ctype.startswith(GZIP_TYPES):
+            return False
+        return self.length is None or self.length >= GZIP_MIN
+
+    def _headers(self, length=None):
+        headers = [(k, v) for k, v in _gzip_etags(self.headers) if k.lower() != "content-length"]
+        headers.append(("Content-Encoding", "gzip"))
+        for i, (k, v) in enumerate(headers):
+            if k.lower() == "vary":
+                if "accept-encoding" not in v.lower():
+                    headers[i] = (k, v + ", Accept-Encoding")
+                break
+        else:
+            headers.append(("Vary", "Accept-Encoding"))
+        if length is not None:
+            headers.append(("Content-Length", str(length)))
+        return headers
+
+    def _begin(self):
+        """长度已知且不大的一次压完，其余改成流式"""
+        if self.length is None or self.length > GZIP_BUFFER_MAX:
+            self._stream()
+            return
+        self.started = True
+        try:
+            data = b"".join(self.it)
+        finally:
+            self._close_app()
+        out = gzip_bytes(data, self.memo)
+        self._count(len(data), len(out))
+        self.start_response(self.status, self._headers(len(out)))
+        self.it = (out,)
+
+    def _stream(self):
+        self.started = True
+        self.z   = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        self.wfn = self.start_response(self.status, self._headers())
+
+    def _write(self, data):
+        # 老式 write() 接口：直接切到流式压缩
+        if not self.started:
+            self._stream()
+        self.wfn(self.z.compress(data) + self.z.flush(zlib.Z_SYNC_FLUSH))
+
+    def _count(self, n_in, n_out):
+        with _gz_lock:
+            gzip_stats["responses"] += 1
+            gzip_stats["bytes_in"]  += n_in
+            gzip_stats["bytes_out"] += n_out
+
+    def __iter__(self):
+        n_in = n_out = 0
+        try:
+            for chunk in self.it:
+                z = self.z
+                if z is None:
+                    yield chunk
+                elif chunk:
+                    out = z.compress(chunk) + z.flush(zlib.Z_SYNC_FLUSH)
+                    n_in  += len(chunk)
+                    n_out += len(out)
+                    yield out
+            if self.z is not None:
+                out = self.z.flush()
+                n_out += len(out)
+                yield out
+        finally:
+            if self.z is not None:
+                self._count(n_in, n_out)
+
+    def _close_app(self):
+        it, self.it = self.it, ()
+        if hasattr(it, "close"):
+            it.close()
+
+    def close(self):
+        self._close_app()
+
+site = Gzip(dispatcher)
+
 # ═══ 数据库 ══════════════════════════════════════════════════
+# 后加的 services 列，init_db 时对旧库自动 ALTER TABLE
+SVC_COLUMNS = [
+    ("workers",      "INTEGER DEFAULT 0"),     # >0 时使用独立 worker 进程池
+    ("rate_limit",   "REAL DEFAULT 0"),        # 每秒请求数，0 = 不限
+    ("rate_burst",   "INTEGER DEFAULT 0"),     # 令牌桶容量，0 = 取每秒请求数
+    ("max_inflight", "INTEGER DEFAULT 0"),     # 同时在途请求上限，0 = 不限
+    ("queue_ms",     "INTEGER DEFAULT 0"),     # 在途满了以后排队等待的毫秒数
+    ("cache_mb",     "INTEGER DEFAULT 0"),     # 响应缓存的内存预算（MiB），0 = 不缓存
+    ("cache_disk_mb", "INTEGER DEFAULT 0"),    # 磁盘层预算（MiB），0 = 只用内存
+    ("cpu_budget",   "REAL DEFAULT 0"),        # CPU 预算（单核百分比），超出自动停止，0 = 不限
+    ("mem_budget_mb", "INTEGER DEFAULT 0"),    # 内存预算（MiB，需 PAAS_TRACEMALLOC=1），0 = 不限
+]
+
+# 每个线程复用一条连接：WAL + synchronous=NORMAL + busy timeout，
+# sqlite3 自带按 SQL 文本缓存的预编译语句，这里把缓存调大。
+# trace 回调统计连接数 / 语句数；PAAS_DB_TRACE=1 时每个响应带 X-DB-Stats 头，
+# 进程累计数在 /metrics 里（paas_db_connections_total / paas_db_queries_total）
+DB_TIMEOUT    = 5        # 等锁的秒数（busy timeout）
+DB_STMT_CACHE = 256      # 每条连接缓存的预编译语句数
+DB_TRACE      = os.environ.get("PAAS_DB_TRACE") == "1"
+_db_local     = threading.local()
+_db_totals    = {}       # 线程 ident -> [连接数, 语句数]，进程累计，和服务指标一样读时合并
+
+def _db_total(i):
+    tid = threading.get_ident()
+    row = _db_totals.get(tid)
+    if row is None:
+        row = _db_totals[tid] = [0, 0]
+    row[i] += 1
+
+def db_totals():
+    conns = queries = 0
+    for row in list(_db_totals.values()):
+        conns   += row[0]
+        queries += row[1]
+    return conns, queries
+
+def _count_query(sql):
+    if not sql.startswith(("BEGIN", "COMMIT", "ROLLBACK", "PRAGMA")):
+        _db_local.queries = getattr(_db_local, "queries", 0) + 1
+        _db_total(1)
+
 def db():
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
+    conn = getattr(_db_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DB_FILE, timeout=DB_TIMEOUT, cached_statements=DB_STMT_CACHE)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.set_trace_callback(_count_query)
+        _db_local.conn  = conn
+        _db_local.conns = getattr(_db_local, "conns", 0) + 1
+        _db_total(0)
     return conn
 
+def close_db():
+    """关闭当前线程的连接（线程退出时连接也会随 threading.local 一起释放）"""
+    conn = getattr(_db_local, "conn", None)
+    if conn is not None:
+        _db_local.conn = None
+        conn.close()
+
+def db_request_stats():
+    """当前请求里打开的连接数和执行的语句数"""
+    return getattr(_db_local, "conns", 0), getattr(_db_local, "queries", 0)
+
+@main_app.before_request
+def _db_reset_stats():
+    _db_local.conns   = 0
+    _db_local.queries = 0
+
+@main_app.after_request
+def _db_stats_header(resp):
+    if DB_TRACE:
+        resp.headers["X-DB-Stats"] = "conns={} queries={}".format(*db_request_stats())
+    return resp
+
+@main_app.after_request
+def _log_uid(resp):
+    # 本请求里查过当前用户的话，访问日志顺便记下用户 id（不为此多解一次 session）
+    u = g.get("user")
+    if u:
+        request.environ["paas.uid"] = u["id"]
+    return resp
+
+@main_app.teardown_request
+def _db_teardown(exc):
+    # 连接留给本线程下一个请求复用，只回滚异常中断留下的事务
+    conn = getattr(_db_local, "conn", None)
+    if conn is not None and conn.in_transaction:
+        conn.rollback()
+
+atexit.register(close_db)
+
 def init_db():
     with db() as c:
         c.executescript("""
@@ -84,15 +1216,78 @@ def init_db():
             err_msg TEXT,
             deployed_at TEXT
         );
+        CREATE TABLE IF NOT EXISTS jobs(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            svc_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            state TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER DEFAULT 0,
+            progress INTEGER DEFAULT 0,
+            message TEXT,
+            created_at TEXT,
+            updated_at TEXT
+        );
+        CREATE INDEX IF NOT EXISTS jobs_state ON jobs(state, id);
+        CREATE INDEX IF NOT EXISTS jobs_svc ON jobs(svc_id, id);
+        CREATE TABLE IF NOT EXISTS usage(
+            ts INTEGER NOT NULL,
+            svc TEXT NOT NULL,
+            cpu_ms REAL,
+            requests INTEGER,
+            mem_kb INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS usage_ts ON usage(ts);
         """)
+        # 旧库补列
+        cols = {r[1] for r in c.execute("PRAGMA table_info(services)")}
+        for col, decl in SVC_COLUMNS:
+            if col not in cols:
+                c.execute("ALTER TABLE services ADD COLUMN {} {}".format(col, decl))
 
 # ═══ 认证 ═════════════════════════════════════════════════════
+# 当前用户在一个请求里只查一次库，结果挂在 flask.g 上。
+# PAAS_FAST_AUTH=1 时直接信任签名 session 里的 uid/uname，完全不查库
+FAST_AUTH = os.environ.get("PAAS_FAST_AUTH") == "1"
+
+def login_session(row):
+    session["uid"]   = row["id"]
+    session["uname"] = row["username"]
+
 def me():
-    uid = session.get("uid")
-    if not uid:
-        return None
-    with db() as c:
-        return c.execute("SELECT * FROM users WHERE id=?", [uid]).fetchone()
+    if "user" in g:
+        return g.user
+    uid  = session.get("uid")
+    user = None
+    if uid:
+        if FAST_AUTH and session.get("uname"):
+            user = {"id": uid, "username": session["uname"]}
+        else:
+            with db() as c:
+                user = c.execute("SELECT * FROM users WHERE id=?", [uid]).fetchone()
+            if user and session.get("uname") != user["username"]:
+                session["uname"] = user["username"]
+    g.user = user
+    return user
+
+# 管理员：PAAS_ADMINS=alice,bob（用户名，逗号分隔），可以看所有服务的指标。
+# Prometheus 抓取 /metrics 时没有登录态，用 PAAS_METRICS_TOKEN 作 Bearer token
+ADMINS        = {x.strip() for x in os.environ.get("PAAS_ADMINS", "").split(",") if x.strip()}
+METRICS_TOKEN = os.environ.get("PAAS_METRICS_TOKEN", "")
+
+def is_admin(u):
+    return bool(u) and u["username"] in ADMINS
+
+def admin_required(f):
+    @wraps(f)
+    def inner(*a, **kw):
+        u = me()
+        if not u:
+            return redirect("/login")
+        if not is_admin(u):
+            abort(403)
+        return f(*a, **kw)
+    return inner
 
 def login_required(f):
     @wraps(f)
@@ -103,7 +1298,24 @@ def login_required(f):
     return inner
 
 # ═══ 验证码 ═══════════════════════════════════════════════════
-def new_captcha():
+# 图片由后台线程预先渲染成 (题面, 答案, PNG) 放进有界池子，
+# /captcha 只取一张；池子低于一半时唤醒后台线程补满，取空了才现场渲染
+CAPTCHA_POOL = 64
+_font        = None
+
+def captcha_font():
+    global _font
+    if _font is None:
+        try:
+            _font = ImageFont.truetype("/system/fonts/DroidSans.ttf", 22)
+        except Exception:
+            try:
+                _font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", 20)
+            except Exception:
+                _font = ImageFont.load_default()
+    return _font
+
+def make_captcha():
     a  = random.randint(2, 15)
     b  = random.randint(1, 12)
     op = random.choice(["+", "-"])
@@ -111,6 +1323,10 @@ def new_captcha():
         a, b = b, a
     ans   = str(a + b if op == "+" else a - b)
     label = "{} {} {} = ?".format(a, op, b)
+    return label, ans
+
+def new_captcha():
+    label, ans = make_captcha()
     session["cap"] = ans
     return label
 
@@ -125,13 +1341,7 @@ def captcha_img(label):
     for _ in range(60):
         draw.point((random.randint(0,w-1), random.randint(0,h-1)),
                    fill=(random.randint(50,90),)*3)
-    try:
-        font = ImageFont.truetype("/system/fonts/DroidSans.ttf", 22)
-    except Exception:
-        try:
-            font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", 20)
-        except Exception:
-            font = ImageFont.load_default()
+    font = captcha_font()
     x = 8
     for ch in label:
         draw.text((x, random.randint(5,14)), ch, font=font,
@@ -140,13 +1350,164 @@ def captcha_img(label):
     img = img.filter(ImageFilter.SMOOTH)
     buf = io.BytesIO()
     img.save(buf, "PNG")
-    buf.seek(0)
-    return buf
+    return buf.getvalue()
+
+class CaptchaPool:
+    def __init__(self, size=CAPTCHA_POOL):
+        self.size    = size
+        self.items   = collections.deque()
+        self.wake    = threading.Event()
+        self.started = False
+        self.lock    = threading.Lock()     # 只启动一个填充线程
+
+    @staticmethod
+    def render():
+        label, ans = make_captcha()
+        return label, ans, captcha_img(label)
+
+    def take(self):
+        try:
+            item = self.items.popleft()
+        except IndexError:
+            item = None
+        if len(self.items) < self.size // 2:
+            if not self.started:
+                with self.lock:
+                    if not self.started:
+                        threading.Thread(target=self._fill, daemon=True).start()
+                        self.started = True
+            self.wake.set()
+        return item or self.render()
+
+    def _fill(self):
+        while True:
+            self.wake.wait()
+            self.wake.clear()
+            while len(self.items) < self.size:
+                self.items.append(self.render())
+
+captcha_pool = CaptchaPool()
 
 # ═══ 部署 ═════════════════════════════════════════════════════
+NO_APP_ERR = "未找到 Flask app。请确保代码顶层有：\n\napp = Flask(__name__)\n\n不要写 app.run()"
+
 def svc_dir(svc):
     return Path(SVC_DIR) / str(svc["user_id"]) / svc["name"]
 
+def load_wsgi(mod_name, entry):
+    """导入入口文件并找出 WSGI app；导入出错直接抛异常，找不到 app 返回 None"""
+    spec = importlib.util.spec_from_file_location(mod_name, str(entry))
+    mod  = importlib.util.module_from_spec(spec)
+    sys.modules[mod_name] = mod
+    try:
+        spec.loader.exec_module(mod)
+    except BaseException:
+        sys.modules.pop(mod_name, None)
+        raise
+    for attr in ("app", "application"):
+        obj = getattr(mod, attr, None)
+        if obj is not None and hasattr(obj, "wsgi_app"):
+            return obj
+    fn = getattr(mod, "create_app", None)
+    if callable(fn):
+        return fn()
+    return None
+
+# ═══ 启动时并发恢复 ═══════════════════════════════════════════
+# 端口先监听起来，上次在运行的服务交给有界线程池并发 deploy；
+# 加载完成前先挂一个占位 app，访问时返回 503「启动中」
+RESTORE_WORKERS = 4
+
+def warming_app(environ, start_response):
+    start_response("503 Service Unavailable", [
+        ("Content-Type", "text/plain; charset=utf-8"), ("Retry-After", "2")])
+    return ["服务正在启动，请稍后刷新".encode()]
+
+def _restore_one(svc):
+    t0 = time.time()
+    try:
+        ok, msg = deploy(svc["id"])
+    except Exception as e:
+        ok, msg = False, repr(e)
+    finally:
+        close_db()
+    if not ok and dispatcher.apps.get(svc["name"]) is warming_app:
+        dispatcher.unmount(svc["name"])
+    print("  自动恢复 [{}]: {} ({:.2f}s)".format(
+        svc["name"], "OK" if ok else "FAIL — " + msg, time.time() - t0))
+
+def restore_services():
+    with db() as c:
+        rows = c.execute("SELECT * FROM services WHERE status IN ('running','degraded')").fetchall()
+    for svc in rows:
+        dispatcher.mount(svc["name"], warming_app)
+    if not rows:
+        return
+    t0   = time.time()
+    pool = ThreadPoolExecutor(RESTORE_WORKERS, thread_name_prefix="restore")
+    futs = [pool.submit(_restore_one, svc) for svc in rows]
+
+    def report():
+        for f in futs:
+            f.result()
+        pool.shutdown()
+        print("  {} 个服务恢复完成，用时 {:.2f}s".format(len(rows), time.time() - t0))
+
+    threading.Thread(target=report, daemon=True).start()
+
+# ═══ 热重载 ═══════════════════════════════════════════════════
+# 同进程服务的模块树按服务登记：入口模块固定叫 _svc_<id>，另外记下
+# 加载期间新 import 的、文件位于服务目录里的子模块。重新部署前先把旧
+# 模块树从 sys.modules 摘掉（新代码才能被重新 import），加载失败再放回去；
+# 停止时连同 sys.path 里的服务目录一起清掉，反复部署不会越积越多
+SVC_MODULES = {}    # svc_id -> {模块名: 模块}
+
+def _svc_path_entry(svc_path):
+    while svc_path in sys.path:
+        sys.path.remove(svc_path)
+    sys.path.insert(0, svc_path)
+
+def _detach_modules(svc_id):
+    mods = SVC_MODULES.pop(svc_id, {})
+    for name, mod in mods.items():
+        if sys.modules.get(name) is mod:
+            del sys.modules[name]
+    return mods
+
+def unload_svc(svc_id, svc_path):
+    _detach_modules(svc_id)
+    while svc_path in sys.path:
+        sys.path.remove(svc_path)
+    importlib.invalidate_caches()
+
+def load_svc(svc_id, svc_path, entry):
+    """加载（或重新加载）同进程服务；返回 wsgi app，失败抛异常或返回 None"""
+    old = _detach_modules(svc_id)
+    _svc_path_entry(svc_path)
+    importlib.invalidate_caches()
+    mod_name = "_svc_{}".format(svc_id)
+    before   = set(sys.modules)
+    root     = os.path.abspath(svc_path) + os.sep
+    wsgi     = None
+    try:
+        wsgi = load_wsgi(mod_name, entry)
+    finally:
+        new = {n: sys.modules[n] for n in set(sys.modules) - before
+               if n == mod_name or (getattr(sys.modules[n], "__file__", None) or "").startswith(root)}
+        if wsgi is None:
+            for n in new:
+                sys.modules.pop(n, None)
+            sys.modules.update(old)
+            if old:
+                SVC_MODULES[svc_id] = old
+        else:
+            SVC_MODULES[svc_id] = new
+    return wsgi
+
+def set_status(svc_id, status, err=None):
+    with db() as c:
+        c.execute("UPDATE services SET status=?,err_msg=? WHERE id=?", [status, err, svc_id])
+
 def deploy(svc_id):
     with db() as c:
         svc = c.execute("SELECT * FROM services WHERE id=?", [svc_id]).fetchone()
@@ -158,38 +1519,33 @@ def deploy(svc_id):
         return False, "入口文件 {} 不存在".format(svc["entry"])
 
     svc_path = str(svc_dir(svc))
-    if svc_path not in sys.path:
-        sys.path.insert(0, svc_path)
-
-    try:
-        mod_name = "_svc_{}_{}".format(svc_id, int(datetime.now().timestamp()))
-        spec = importlib.util.spec_from_file_location(mod_name, str(entry))
-        mod  = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(mod)
-    except Exception:
-        err = traceback.format_exc()
-        with db() as c:
-            c.execute("UPDATE services SET status='error',err_msg=? WHERE id=?",
-                      [err[-2000:], svc_id])
-        return False, "代码加载失败，请查看错误详情"
-
-    wsgi = None
-    for attr in ("app", "application"):
-        obj = getattr(mod, attr, None)
-        if obj is not None and hasattr(obj, "wsgi_app"):
-            wsgi = obj
-            break
-    if wsgi is None:
-        fn = getattr(mod, "create_app", None)
-        if callable(fn):
-            wsgi = fn()
-    if wsgi is None:
-        err = "未找到 Flask app。请确保代码顶层有：\n\napp = Flask(__name__)\n\n不要写 app.run()"
-        with db() as c:
-            c.execute("UPDATE services SET status='error',err_msg=? WHERE id=?", [err, svc_id])
-        return False, err
-
-    dispatcher.mount(svc["name"], wsgi)
+    if svc["workers"]:
+        pool = WorkerPool(svc, min(svc["workers"], MAX_WORKERS), entry, "_svc_{}".format(svc_id))
+        err  = pool.start()
+        if err:
+            set_status(svc_id, "error", err[-2000:])
+            return False, "worker 进程启动失败，请查看错误详情"
+        wsgi = WorkerProxy(pool.sock_path)
+        unload_svc(svc_id, svc_path)
+    else:
+        pool = None
+        try:
+            wsgi = load_svc(svc_id, svc_path, entry)
+        except Exception:
+            set_status(svc_id, "error", traceback.format_exc()[-2000:])
+            return False, "代码加载失败，请查看错误详情"
+        if wsgi is None:
+            set_status(svc_id, "error", NO_APP_ERR)
+            return False, NO_APP_ERR
+
+    dispatcher.limit(svc["name"], Limiter.for_service(svc))
+    dispatcher.mount(svc["name"], wsgi, owner=svc["user_id"])
+    dispatcher.cache(svc["name"], ResponseCache.for_service(svc))     # 换上新 app 后再换新缓存，旧内容不会留下
+    old = POOLS.pop(svc_id, None)
+    if pool:
+        POOLS[svc_id] = pool
+    if old:
+        old.stop()
     with db() as c:
         c.execute("UPDATE services SET status='running',err_msg=NULL,deployed_at=? WHERE id=?",
                   [datetime.now().strftime("%Y-%m-%d %H:%M:%S"), svc_id])
@@ -200,8 +1556,521 @@ def undeploy(svc_id):
         svc = c.execute("SELECT * FROM services WHERE id=?", [svc_id]).fetchone()
     if svc:
         dispatcher.unmount(svc["name"])
-        with db() as c:
-            c.execute("UPDATE services SET status='stopped',err_msg=NULL WHERE id=?", [svc_id])
+        unload_svc(svc_id, str(svc_dir(svc)))
+        pool = POOLS.pop(svc_id, None)
+        if pool:
+            pool.stop()
+        set_status(svc_id, "stopped")
+
+# ═══ 后台任务队列 ═════════════════════════════════════════════
+# 部署 / 停止 / 删除不在请求线程里做：写进 jobs 表就返回，由 JOB_WORKERS 个后台线程执行。
+# 同一个服务同时只跑一个任务，按提交顺序执行；和该服务最近一个未完成任务相同的提交
+# 直接返回那个任务，服务在删除中时不再接受新任务。执行中抛异常的任务重新排队，
+# 最多执行 JOB_RETRIES 次；进程重启时没做完的任务也重新排队——三种操作重复执行都是安全的。
+# 页面通过 /svc/<sid>/job 轮询进度
+JOB_WORKERS  = 2
+JOB_RETRIES  = 3
+JOB_POLL     = 5          # 空闲线程兜底轮询的秒数（正常靠提交时唤醒）
+JOB_KEEP     = 20         # 每个服务保留的已结束任务数
+JOB_STEP     = 2000       # 删除时每删这么多个文件更新一次进度
+JOB_KIND_CN  = {"deploy": "部署", "undeploy": "停止", "remove": "删除"}
+JOB_STATE_CN = {"queued": "排队中", "running": "进行中", "done": "完成", "failed": "失败"}
+_job_wake    = threading.Condition()
+_job_lock    = threading.Lock()        # 提交和认领互斥，避免同一服务同时跑两个任务
+
+def _now():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+def submit_job(svc_id, user_id, kind):
+    """返回 (任务 id, 是否新建)"""
+    with _job_lock, db() as c:
+        last = c.execute("SELECT id, kind FROM jobs WHERE svc_id=? AND state IN ('queued','running') "
+                         "ORDER BY id DESC LIMIT 1", [svc_id]).fetchone()
+        if last and last["kind"] in (kind, "remove"):
+            return last["id"], False
+        jid = c.execute("INSERT INTO jobs(svc_id,user_id,kind,state,created_at,updated_at) "
+                        "VALUES(?,?,?,'queued',?,?)", [svc_id, user_id, kind, _now(), _now()]).lastrowid
+    with _job_wake:
+        _job_wake.notify()
+    return jid, True
+
+def job_progress(jid, done, message):
+    with db() as c:
+        c.execute("UPDATE jobs SET progress=?,message=?,updated_at=? WHERE id=?", [done, message, _now(), jid])
+
+def active_jobs(svc_ids):
+    """svc_id -> 该服务最早的未完成任务"""
+    if not svc_ids:
+        return {}
+    with db() as c:
+        rows = c.execute("SELECT * FROM jobs WHERE state IN ('queued','running') AND svc_id IN ({}) "
+                         "ORDER BY id DESC".format(",".join("?" * len(svc_ids))), list(svc_ids)).fetchall()
+    return {r["svc_id"]: r for r in rows}
+
+def job_label(job):
+    text = "{} {}".format(JOB_KIND_CN[job["kind"]], JOB_STATE_CN[job["state"]])
+    if job["message"]:
+        text += " · " + job["message"]
+    return text
+
+def _claim_job():
+    with _job_lock, db() as c:
+        job = c.execute("SELECT * FROM jobs WHERE state='queued' AND svc_id NOT IN "
+                        "(SELECT svc_id FROM jobs WHERE state='running') ORDER BY id LIMIT 1").fetchone()
+        if job:
+            c.execute("UPDATE jobs SET state='running',attempts=attempts+1,updated_at=? WHERE id=?",
+                      [_now(), job["id"]])
+    return job
+
+def _finish_job(job, state, message):
+    with db() as c:
+        c.execute("UPDATE jobs SET state=?,message=?,updated_at=? WHERE id=?",
+                  [state, message, _now(), job["id"]])
+        c.execute("DELETE FROM jobs WHERE svc_id=? AND state IN ('done','failed') AND id NOT IN "
+                  "(SELECT id FROM jobs WHERE svc_id=? ORDER BY id DESC LIMIT ?)",
+                  [job["svc_id"], job["svc_id"], JOB_KEEP])
+
+def _job_deploy(job):
+    return deploy(job["svc_id"])
+
+def _job_undeploy(job):
+    undeploy(job["svc_id"])
+    return True, "服务已停止"
+
+def remove_tree(path, report=None):
+    """自底向上逐个删除，每 JOB_STEP 个文件回调一次 report(已删除数)；返回删除的文件数"""
+    n = 0
+    for root, dirs, files in os.walk(path, topdown=False):
+        for name in files:
+            try:
+                os.unlink(os.path.join(root, name))
+            except OSError:
+                continue
+            n += 1
+            if report and n % JOB_STEP == 0:
+                report(n)
+        for name in dirs:
+            p = os.path.join(root, name)
+            try:
+                if os.path.islink(p):
+                    os.unlink(p)
+                else:
+                    os.rmdir(p)
+            except OSError:
+                pass
+    shutil.rmtree(path, ignore_errors=True)
+    return n
+
+def _job_remove(job):
+    sid = job["svc_id"]
+    with db() as c:
+        svc = c.execute("SELECT * FROM services WHERE id=?", [sid]).fetchone()
+    if not svc:
+        return True, "服务已删除"
+    undeploy(sid)
+    set_status(sid, "removing")
+    n = remove_tree(str(svc_dir(svc)),
+                    lambda n: job_progress(job["id"], n, "已删除 {} 个文件".format(n)))
+    _usage.pop(sid, None)
+    with db() as c:
+        c.execute("DELETE FROM services WHERE id=?", [sid])
+    return True, "已删除 {} 个文件".format(n)
+
+JOB_RUNNERS = {"deploy": _job_deploy, "undeploy": _job_undeploy, "remove": _job_remove}
+
+def _job_worker():
+    while True:
+        try:
+            job = _claim_job()
+        except sqlite3.Error:
+            job = None
+        if job is None:
+            with _job_wake:
+                _job_wake.wait(JOB_POLL)
+            continue
+        try:
+            ok, msg = JOB_RUNNERS[job["kind"]](job)
+            _finish_job(job, "done" if ok else "failed", msg)
+        except Exception:
+            err = traceback.format_exc()[-2000:]
+            if job["attempts"] + 1 < JOB_RETRIES:
+                _finish_job(job, "queued", "第 {} 次执行出错，稍后重试".format(job["attempts"] + 1))
+            else:
+                _finish_job(job, "failed", err)
+        with _job_wake:
+            _job_wake.notify()     # 同一服务后面排着的任务可以开始了
+
+def start_jobs():
+    with db() as c:
+        c.execute("UPDATE jobs SET state='queued' WHERE state='running'")
+    close_db()
+    for _ in range(JOB_WORKERS):
+        threading.Thread(target=_job_worker, daemon=True, name="job").start()
+
+JOB_JS = """<script>
+(function () {
+  var els = document.querySelectorAll('[data-job]');
+  if (!els.length) return;
+  function tick() {
+    var busy = 0;
+    Promise.all([].map.call(els, function (el) {
+      return fetch(el.dataset.job, {cache: 'no-cache'}).then(function (r) { return r.json(); }).then(function (j) {
+        el.textContent = j.label;
+        if (j.active) busy++;
+      });
+    })).then(function () { busy ? setTimeout(tick, 1000) : location.reload(); },
+             function () { setTimeout(tick, 3000); });
+  }
+  setTimeout(tick, 1000);
+})();
+</script>"""
+
+# ═══ 资源统计 ═════════════════════════════════════════════════
+# 同进程服务都跑在平台进程里，这里按服务分摊 CPU 和内存：
+#   CPU  Metered 记下每个请求的线程 CPU 时间（time.thread_time），累加在服务指标里
+#   内存 PAAS_TRACEMALLOC=1 时在恢复服务之前启动 tracemalloc；采样时拍一张快照，
+#        调用栈里有帧落在某个服务目录下的分配就算给该服务。worker 进程模式的服务不在统计内
+# 后台线程每 ACCT_INTERVAL 秒取一次增量：最近 ACCT_WINDOW 个区间留在内存里，
+# 同时写进 usage 表。管理员给服务设了预算（cpu_budget：单核百分比，按一个区间平均；
+# mem_budget_mb）时，超出的服务会被自动停止并标成异常
+ACCT_INTERVAL  = 60
+ACCT_WINDOW    = 60        # 内存里保留的区间数（默认一小时）
+ACCT_KEEP_DAYS = 7         # usage 表保留的天数
+ACCT_FRAMES    = 16        # tracemalloc 记录的调用栈深度
+TRACEMALLOC    = os.environ.get("PAAS_TRACEMALLOC") == "1"
+_acct_window   = collections.deque(maxlen=ACCT_WINDOW)    # (时间, {服务名: [cpu_us, 请求数, 内存字节]})
+_acct_last     = {}        # 服务名 -> (累计 cpu_us, 累计请求数)，算增量用
+
+def service_memory(dirs):
+    """dirs: {服务名: 服务目录绝对路径} -> {服务名: 当前归属的字节数}"""
+    if not tracemalloc.is_tracing():
+        return {}
+    snap = tracemalloc.take_snapshot()
+    return {name: sum(t.size for t in snap.filter_traces(
+                [tracemalloc.Filter(True, os.path.join(path, "*"), all_frames=True)]).traces)
+            for name, path in dirs.items()}
+
+def _acct_totals():
+    return {name: (row[MET_CPU], row[0]) for name, row in metrics_rows().items()}
+
+def acct_tick(now=None):
+    now = now or time.time()
+    with db() as c:
+        svcs = c.execute("SELECT * FROM services WHERE status IN ('running','degraded')").fetchall()
+    mem = service_memory({s["name"]: os.path.abspath(str(svc_dir(s))) for s in svcs if not s["workers"]})
+    sample = {}
+    for name, (cpu, n) in _acct_totals().items():
+        cpu0, n0 = _acct_last.get(name, (0, 0))
+        _acct_last[name] = (cpu, n)
+        if cpu > cpu0 or n > n0:
+            sample[name] = [cpu - cpu0, n - n0, 0]
+    for name, nbytes in mem.items():
+        sample.setdefault(name, [0, 0, 0])[2] = nbytes
+    span = now - _acct_window[-1][0] if _acct_window else ACCT_INTERVAL
+    _acct_window.append((now, sample))
+    with db() as c:
+        c.executemany("INSERT INTO usage(ts,svc,cpu_ms,requests,mem_kb) VALUES(?,?,?,?,?)",
+                      [(int(now), name, round(d[0] / 1000.0, 3), d[1], d[2] >> 10) for name, d in sample.items()])
+        c.execute("DELETE FROM usage WHERE ts<?", [int(now) - ACCT_KEEP_DAYS * 86400])
+    for s in svcs:
+        d = sample.get(s["name"])
+        if not d:
+            continue
+        pct  = d[0] / 1e4 / max(span, 1e-6)
+        over = None
+        if s["cpu_budget"] and pct > s["cpu_budget"]:
+            over = "CPU {:.1f}% 超出预算 {:g}%".format(pct, s["cpu_budget"])
+        elif s["mem_budget_mb"] and d[2] > s["mem_budget_mb"] << 20:
+            over = "内存 {:.1f} MiB 超出预算 {} MiB".format(d[2] / 1048576, s["mem_budget_mb"])
+        if over:
+            undeploy(s["id"])
+            set_status(s["id"], "error", "资源超限，已自动停止：" + over)
+            print("  资源超限 [{}]: {}".format(s["name"], over))
+    return sample
+
+def acct_top(limit=20):
+    """最近窗口内的资源消耗，按 CPU 从高到低"""
+    if not _acct_window:
+        return []
+    span = max(_acct_window[-1][0] - _acct_window[0][0], ACCT_INTERVAL) if len(_acct_window) > 1 else ACCT_INTERVAL
+    acc  = {}
+    for _, sample in _acct_window:
+        for name, d in sample.items():
+            a = acc.setdefault(name, [0, 0, 0])
+            a[0] += d[0]
+            a[1] += d[1]
+            a[2]  = d[2]
+    rows = [{"service": name, "cpu_s": round(a[0] / 1e6, 3), "cpu_pct": round(a[0] / 1e4 / span, 2),
+             "requests": a[1], "cpu_ms_per_req": round(a[0] / 1000.0 / a[1], 3) if a[1] else 0.0,
+             "mem_bytes": a[2]} for name, a in acc.items()]
+    rows.sort(key=lambda r: (r["cpu_s"], r["mem_bytes"]), reverse=True)
+    return rows[:limit]
+
+def _acct_loop():
+    while True:
+        time.sleep(ACCT_INTERVAL)
+        try:
+            acct_tick()
+        except Exception:
+            traceback.print_exc()
+
+def start_accounting():
+    if TRACEMALLOC and not tracemalloc.is_tracing():
+        tracemalloc.start(ACCT_FRAMES)
+    _acct_last.update(_acct_totals())
+    _acct_window.append((time.time(), {}))
+    threading.Thread(target=_acct_loop, daemon=True, name="acct").start()
+
+# ═══ 进程池隔离模式 ════════════════════════════════════════════
+# services.workers > 0 的服务不 import 进主进程：主进程监听一个 Unix socket，
+# 预先启动 N 个 worker 进程共享这个 socket 抢 accept，各自加载用户 app；
+# Dispatcher 挂载的 WorkerProxy 把 WSGI 请求按 HTTP/1.1 转发过去。
+# 守护线程负责崩溃重启，并把实际状态写回 services.status：
+#   running 全部存活 / degraded 有 worker 正在重启 / error 反复崩溃已放弃
+RUN_DIR         = os.path.join(SVC_DIR, ".run")
+MAX_WORKERS     = 8
+WORKER_BOOT     = 30     # 等待单个 worker 加载完成的秒数
+WORKER_TIMEOUT  = 60     # 转发单个请求的超时秒数
+CRASH_WINDOW    = 10     # 启动后这么多秒内退出算「秒退」
+CRASH_LIMIT     = 5      # 连续秒退次数上限
+HOP_HEADERS     = {"connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+                   "te", "trailer", "transfer-encoding", "upgrade"}
+POOLS           = {}     # svc_id -> WorkerPool
+_pool_seq       = itertools.count(1)
+
+class WorkerPool:
+    def __init__(self, svc, size, entry, mod_name):
+        self.svc_id    = svc["id"]
+        self.name      = svc["name"]
+        self.size      = size
+        self.entry     = str(entry)
+        self.svc_path  = str(svc_dir(svc))
+        self.mod_name  = mod_name
+        self.sock_path = os.path.abspath(os.path.join(
+            RUN_DIR, "{}.{}.{}.sock".format(self.name, os.getpid(), next(_pool_seq))))
+        self.log_path  = os.path.join(RUN_DIR, self.name + ".log")
+        self.procs     = []
+        self.state     = None
+        self.crashes   = 0
+        self.stopping  = False
+        self.listener  = None
+
+    def start(self):
+        """启动全部 worker；成功返回 None，失败返回错误信息"""
+        os.makedirs(RUN_DIR, exist_ok=True)
+        open(self.log_path, "wb").close()
+        if os.path.exists(self.sock_path):
+            os.unlink(self.sock_path)
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(self.sock_path)
+        self.listener.listen(128)
+        for _ in range(self.size):
+            p = self._spawn()
+            self.procs.append(p)
+            if not self._wait_ready(p):
+                err = self._log_tail()
+                self.stop()
+                return err
+        self.state = "running"
+        threading.Thread(target=self._watch, daemon=True).start()
+        return None
+
+    def stop(self):
+        self.stopping = True
+        for p in self.procs:
+            if p.poll() is None:
+                p.terminate()
+        for p in self.procs:
+            try:
+                p.wait(5)
+            except subprocess.TimeoutExpired:
+                p.kill()
+        if self.listener:
+            self.listener.close()
+        if os.path.exists(self.sock_path):
+            os.unlink(self.sock_path)
+
+    def alive(self):
+        return sum(1 for p in self.procs if p.poll() is None)
+
+    def _spawn(self):
+        fd = self.listener.fileno()
+        with open(self.log_path, "ab") as log:
+            p = subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), "--worker", str(fd),
+                 self.sock_path, self.entry, self.svc_path, self.mod_name],
+                stdout=subprocess.PIPE, stderr=log, pass_fds=[fd])
+        p.started = time.time()
+        return p
+
+    def _wait_ready(self, p):
+        r, _, _ = select.select([p.stdout], [], [], WORKER_BOOT)
+        line = p.stdout.readline() if r else b""
+        p.stdout.close()
+        if line.strip() == b"READY":
+            return True
+        try:
+            p.wait(1 if r else 0)
+        except subprocess.TimeoutExpired:
+            p.kill()
+            with open(self.log_path, "ab") as log:
+                log.write("worker 启动超过 {} 秒，已终止\n".format(WORKER_BOOT).encode())
+        return False
+
+    def _log_tail(self):
+        try:
+            with open(self.log_path, "rb") as f:
+                f.seek(0, 2)
+                f.seek(max(0, f.tell() - 2000))
+                return f.read().decode("utf-8", "replace")
+        except OSError:
+            return "worker 进程启动失败"
+
+    def _set_state(self, state, err=None):
+        if state != self.state and not self.stopping:
+            self.state = state
+            set_status(self.svc_id, state, err)
+
+    def _watch(self):
+        while not self.stopping:
+            time.sleep(1)
+            for i, p in enumerate(self.procs):
+                if self.stopping or p.poll() is None:
+                    continue
+                fast = time.time() - p.started < CRASH_WINDOW
+                self.crashes = self.crashes + 1 if fast else 1
+                if self.crashes > CRASH_LIMIT:
+                    err = "worker 连续崩溃 {} 次，已停止\n\n{}".format(self.crashes, self._log_tail())
+                    self._set_state("error", err[-2000:])
+                    if POOLS.get(self.svc_id) is self:
+                        dispatcher.unmount(self.name)
+                        POOLS.pop(self.svc_id, None)
+                    self.stop()
+                    return
+                self._set_state("degraded")
+                np = self._spawn()
+                self.procs[i] = np
+                self._wait_ready(np)
+            if self.alive() == self.size:
+                self._set_state("running")
+
+def stop_pools():
+    for pool in list(POOLS.values()):
+        pool.stop()
+
+atexit.register(stop_pools)
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, sock_path, timeout):
+        super().__init__("localhost", timeout=timeout)
+        self.sock_path = sock_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.sock_path)
+
+class WorkerProxy:
+    """挂载到 Dispatcher 上的 WSGI app，把请求转发给 worker 进程"""
+    def __init__(self, sock_path):
+        self.sock_path = sock_path
+
+    def __call__(self, environ, start_response):
+        url = quote(environ.get("PATH_INFO", "").encode("latin-1"), safe="/:@!$&'()*+,;=~")
+        if environ.get("QUERY_STRING"):
+            url += "?" + environ["QUERY_STRING"]
+        headers = {}
+        for k, v in environ.items():
+            if k.startswith("HTTP_") and not k.startswith("HTTP_X_PAAS_"):
+                name = k[5:].replace("_", "-").title()
+                if name.lower() not in HOP_HEADERS:
+                    headers[name] = v
+        if environ.get("CONTENT_TYPE"):
+            headers["Content-Type"] = environ["CONTENT_TYPE"]
+        headers["X-Paas-Script-Name"] = environ.get("SCRIPT_NAME", "")
+        headers["X-Paas-Remote-Addr"] = environ.get("REMOTE_ADDR", "")
+        headers["X-Paas-Scheme"]      = environ.get("wsgi.url_scheme", "http")
+
+        body, length = None, int(environ.get("CONTENT_LENGTH") or 0)
+        chunked = not length and environ.get("wsgi.input_terminated", False)
+        if length:
+            headers["Content-Length"] = str(length)
+            body = self._body(environ["wsgi.input"], length)
+        elif chunked:
+            # 请求体是 chunked 的（没有 Content-Length）：服务器已经解开分块，
+            # 读到 EOF 为止，再按 chunked 转发给 worker
+            headers["Transfer-Encoding"] = "chunked"
+            body = self._body(environ["wsgi.input"], None)
+
+        conn = _UnixHTTPConnection(self.sock_path, WORKER_TIMEOUT)
+        try:
+            conn.request(environ["REQUEST_METHOD"], url, body=body, headers=headers, encode_chunked=chunked)
+            resp = conn.getresponse()
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            start_response("502 Bad Gateway", [("Content-Type", "text/plain; charset=utf-8")])
+            return ["服务 worker 无响应".encode()]
+        start_response("{} {}".format(resp.status, resp.reason),
+                       [(k, v) for k, v in resp.getheaders() if k.lower() not in HOP_HEADERS])
+        return self._stream(conn, resp)
+
+    @staticmethod
+    def _body(stream, length):
+        """按块读请求体；length 为 None 时读到 EOF"""
+        while length is None or length > 0:
+            chunk = stream.read(65536 if length is None else min(length, 65536))
+            if not chunk:
+                break
+            if length is not None:
+                length -= len(chunk)
+            yield chunk
+
+    @staticmethod
+    def _stream(conn, resp):
+        try:
+            while True:
+                chunk = resp.read(65536)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            conn.close()
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_request(self, *a, **kw):
+        pass
+
+def worker_main(fd, sock_path, entry, svc_path, mod_name):
+    """worker 进程入口：加载用户 app，在继承来的 socket 上提供服务"""
+    ready = os.fdopen(os.dup(1), "w")
+    os.dup2(2, 1)                      # 用户代码的 print 进日志，不堵塞就绪管道
+    sys.path.insert(0, svc_path)
+    try:
+        app = load_wsgi(mod_name, entry)
+    except Exception:
+        traceback.print_exc()
+        sys.exit(1)
+    if app is None:
+        print(NO_APP_ERR, file=sys.stderr)
+        sys.exit(2)
+
+    def wsgi(environ, start_response):
+        environ["SCRIPT_NAME"]     = environ.pop("HTTP_X_PAAS_SCRIPT_NAME", "")
+        environ["REMOTE_ADDR"]     = environ.pop("HTTP_X_PAAS_REMOTE_ADDR", "")
+        environ["wsgi.url_scheme"] = environ.pop("HTTP_X_PAAS_SCHEME", "http")
+        return app(environ, start_response)
+
+    def orphan_watch(ppid=os.getppid()):
+        while os.getppid() == ppid:
+            time.sleep(2)
+        os._exit(0)
+
+    threading.Thread(target=orphan_watch, daemon=True).start()
+    server = make_server("unix://" + sock_path, 0, wsgi,
+                         request_handler=_QuietHandler, fd=int(fd))
+    ready.write("READY\n")
+    ready.close()
+    server.serve_forever()
 
 # ═══════════════════════════════════════════════════════════════
 # 公共 CSS
@@ -281,8 +2150,26 @@ input:focus,textarea:focus{outline:none;border-color:var(--acc)}
 @media(max-width:580px){.wrap{padding:16px 10px}nav{padding:0 12px}}
 </style>"""
 
+# CSS 不再内联进每个页面：按内容哈希发布成 /static/app.<hash>.css，
+# 浏览器长期缓存，内容变了 URL 跟着变
+CSS_TEXT = CSS[len("<style>"):-len("</style>")].encode("utf-8")
+CSS_HASH = hashlib.sha1(CSS_TEXT).hexdigest()[:12]
+CSS_URL  = "/static/app.{}.css".format(CSS_HASH)
+CSS_LINK = "<link rel='stylesheet' href='{}'>".format(CSS_URL)
+
+@main_app.route("/static/app.<h>.css")
+def static_css(h):
+    if h != CSS_HASH:
+        abort(404)
+    resp = Response(CSS_TEXT, mimetype="text/css",
+                    headers={"Cache-Control": "public, max-age=31536000, immutable"})
+    resp.set_etag(CSS_HASH)
+    return resp.make_conditional(request)
+
 # ═══════════════════════════════════════════════════════════════
 # page() — 使用 Jinja2 变量，body 里的 JS { } 不会破坏渲染
+# 模板在导入时编译一次；flash 消息由 page() 取出后传进去，
+# 这样模板渲染不依赖请求上下文，错误页可以提前渲染好缓存
 # ═══════════════════════════════════════════════════════════════
 PAGE_TPL = """\
 <!DOCTYPE html><html lang='zh'><head>
@@ -295,29 +2182,30 @@ PAGE_TPL = """\
   <div class='nav-r'>{{ page_nav | safe }}</div>
 </nav>
 <div class='wrap'>
-  {% with msgs = get_flashed_messages(with_categories=true) %}
-    {% for cat, txt in msgs %}
-      <div class='fl fl{{ cat[0] }}'>{{ txt }}</div>
-    {% endfor %}
-  {% endwith %}
+  {% for cat, txt in page_msgs %}
+    <div class='fl fl{{ cat[0] }}'>{{ txt }}</div>
+  {% endfor %}
   {{ page_body | safe }}
 </div>
 </body></html>"""
 
+PAGE_T = main_app.jinja_env.from_string(PAGE_TPL)
+
 def page(body, title="PhonePaaS"):
     user = me()
     if user:
         nav = '<a href="/">仪表盘</a><a href="/logout">退出 {}</a>'.format(user["username"])
     else:
         nav = '<a href="/login">登录</a><a href="/register" class="btn bp sm" style="margin-left:4px">注册</a>'
-    return render_template_string(
-        PAGE_TPL,
+    return PAGE_T.render(
         page_title=title,
-        page_css=CSS,
+        page_css=CSS_LINK,
         page_nav=nav,
         page_body=body,
+        page_msgs=get_flashed_messages(with_categories=True),
     )
 
+@lru_cache(maxsize=None)
 def error_page(code, title, desc):
     body = (
         "<div class='err-page'>"
@@ -330,7 +2218,14 @@ def error_page(code, title, desc):
         "<a href='javascript:history.back()' class='btn bgg'>返回上页</a>"
         "</div></div>"
     )
-    return page(body, "{} — PhonePaaS".format(code))
+    # 每个状态码只渲染一次：导航不带用户名，也不消费 flash 消息
+    return PAGE_T.render(
+        page_title="{} — PhonePaaS".format(code),
+        page_css=CSS_LINK,
+        page_nav='<a href="/">仪表盘</a>',
+        page_body=body,
+        page_msgs=[],
+    )
 
 # ═══ 错误处理器 ════════════════════════════════════════════════
 @main_app.errorhandler(400)
@@ -364,9 +2259,12 @@ def err_503(e):
 # ═══ 验证码路由 ════════════════════════════════════════════════
 @main_app.route("/captcha")
 def captcha_route():
-    label = new_captcha()
     if HAS_PIL:
-        return send_file(captcha_img(label), mimetype="image/png", max_age=0)
+        label, ans, png = captcha_pool.take()
+        session["cap"] = ans
+        return Response(png, mimetype="image/png",
+                        headers={"Cache-Control": "no-cache, no-store, must-revalidate"})
+    label = new_captcha()
     return (
         "<div style='background:#0d1321;color:#4f9cf9;font-size:1.4rem;"
         "padding:8px 14px;border-radius:6px;font-family:monospace'>{}</div>".format(label)
@@ -392,8 +2290,8 @@ def register():
                     c.execute("INSERT INTO users(username,pw_hash,email) VALUES(?,?,?)",
                               [u, generate_password_hash(pw), em])
                 with db() as c:
-                    row = c.execute("SELECT id FROM users WHERE username=?", [u]).fetchone()
-                session["uid"] = row["id"]
+                    row = c.execute("SELECT id,username FROM users WHERE username=?", [u]).fetchone()
+                login_session(row)
                 return redirect("/")
             except sqlite3.IntegrityError:
                 flash("用户名已存在", "error")
@@ -432,7 +2330,7 @@ def login():
             with db() as c:
                 row = c.execute("SELECT * FROM users WHERE username=?", [u]).fetchone()
             if row and check_password_hash(row["pw_hash"], pw):
-                session["uid"] = row["id"]
+                login_session(row)
                 return redirect("/")
             flash("用户名或密码错误", "error")
 
@@ -471,6 +2369,8 @@ def dashboard():
             "SELECT * FROM services WHERE user_id=? ORDER BY id DESC", [u["id"]]
         ).fetchall()
 
+    stats = metrics_summary({s["name"] for s in svcs})
+    jobs  = active_jobs([s["id"] for s in svcs])
     cards = ""
     for s in svcs:
         nm = s["name"]
@@ -480,6 +2380,15 @@ def dashboard():
             pub     = "{}{}/{}/".format(PUBLIC_URL, PREFIX, nm)
             publink = '<a href="{}" target="_blank" style="font-size:.78rem">{}</a>'.format(pub, pub)
             tbtn    = '<form method="post" action="/svc/{}/undeploy" style="display:inline"><button class="btn bgg sm">停止</button></form>'.format(s["id"])
+        elif st == "degraded":
+            badge   = "<span class='badge ber2'>重启中</span>"
+            pub     = "{}{}/{}/".format(PUBLIC_URL, PREFIX, nm)
+            publink = '<a href="{}" target="_blank" style="font-size:.78rem">{}</a>'.format(pub, pub)
+            tbtn    = '<form method="post" action="/svc/{}/undeploy" style="display:inline"><button class="btn bgg sm">停止</button></form>'.format(s["id"])
+        elif st == "removing":
+            badge   = "<span class='badge bst'>删除中</span>"
+            publink = ""
+            tbtn    = ""
         elif st == "error":
             badge   = "<span class='badge ber2'>异常</span>"
             publink = ""
@@ -490,8 +2399,14 @@ def dashboard():
             tbtn    = '<form method="post" action="/svc/{}/deploy" style="display:inline"><button class="btn bok sm"><svg width="12" height="12" viewBox="0 0 12 12" fill="currentColor" style="vertical-align:middle"><polygon points="2,1 11,6 2,11"/></svg> 部署</button></form>'.format(s["id"])
 
         dep_info = ""
-        if s["deployed_at"] and st == "running":
+        if s["deployed_at"] and st in ("running", "degraded"):
             dep_info = "<span>· 部署于 {}</span>".format(s["deployed_at"])
+        if s["workers"]:
+            dep_info += "<span>· {} 个 worker 进程</span>".format(s["workers"])
+        job = jobs.get(s["id"])
+        if job:
+            dep_info += "<span>· <span data-job='/svc/{}/job'>{}</span></span>".format(
+                s["id"], job_label(job).replace("<", "&lt;"))
 
         err_html = ""
         if st == "error" and s["err_msg"]:
@@ -503,6 +2418,15 @@ def dashboard():
                 "<pre>{}</pre></div>".format(safe_err)
             )
 
+        mt = stats.get(nm)
+        if mt and mt["requests"]:
+            badge += ("<span style='font-size:.72rem;color:var(--dim);font-family:var(--mono)'>"
+                      "{} 次 · p50 {:g}ms · p99 {:g}ms · 5xx {}</span>").format(
+                          mt["requests"], mt["p50_ms"], mt["p99_ms"], mt["status"]["5xx"])
+            if "cache" in mt:
+                badge += ("<span style='font-size:.72rem;color:var(--dim);font-family:var(--mono)'>"
+                          "缓存命中 {:.0%}</span>").format(mt["cache"]["hit_ratio"])
+
         sn = (s["title"] or nm).replace("<","&lt;")
         cards += (
             "<div class='card' style='margin-bottom:10px'>"
@@ -539,10 +2463,95 @@ def dashboard():
         "<div><h1>我的服务</h1>"
         "<p style='color:var(--dim);font-size:.82rem'>{} / {} 个</p></div>".format(len(svcs), MAX_SVC) +
         "<a href='/new' class='btn bp'>+ 新建服务</a>"
-        "</div>" + cards
+        "</div>" + cards + (JOB_JS if jobs else "")
     )
     return page(body)
 
+# ═══ 指标接口 ══════════════════════════════════════════════════
+# /admin/metrics 给管理员看 JSON；/metrics 是 Prometheus 文本格式；
+# /admin/logs?n=100&since=<seq>&service=<名称> 从环形缓冲里取最近的访问日志（主站请求的 service 为 "-"）
+# /admin/usage 按服务列出最近的 CPU / 内存占用，并可设置自动停止的预算（?format=json 给脚本用）
+@main_app.route("/admin/metrics")
+@admin_required
+def admin_metrics():
+    return jsonify(metrics_summary())
+
+@main_app.route("/admin/usage")
+@admin_required
+def admin_usage():
+    top = acct_top()
+    if request.args.get("format") == "json":
+        return jsonify(top)
+    with db() as c:
+        svcs = {r["name"]: r for r in c.execute(
+            "SELECT s.id, s.name, s.status, s.cpu_budget, s.mem_budget_mb, u.username "
+            "FROM services s JOIN users u ON u.id=s.user_id")}
+    seen = {r["service"] for r in top}
+    top += [{"service": n, "cpu_s": 0, "cpu_pct": 0, "requests": 0, "cpu_ms_per_req": 0, "mem_bytes": 0}
+            for n in sorted(svcs) if n not in seen]
+    rows = ""
+    for r in top:
+        s = svcs.get(r["service"])
+        budget = ""
+        if s:
+            budget = (
+                "<form method='post' action='/admin/usage/{}' style='display:inline-flex;gap:4px;align-items:center'>".format(s["id"]) +
+                "CPU%<input type='number' name='cpu_budget' min='0' step='any' value='{:g}' style='width:60px;padding:3px 6px;font-size:.73rem'>".format(s["cpu_budget"] or 0) +
+                "MiB<input type='number' name='mem_budget_mb' min='0' value='{}' style='width:60px;padding:3px 6px;font-size:.73rem'>".format(s["mem_budget_mb"] or 0) +
+                "<button class='btn bgg sm'>保存</button></form>"
+            )
+        rows += (
+            "<div class='frow' style='gap:12px;flex-wrap:wrap'>"
+            "<strong style='min-width:110px'>{}</strong>".format(r["service"]) +
+            "<span class='fsize' style='min-width:70px'>{}</span>".format((s["username"] if s else "—").replace("<", "&lt;")) +
+            "<span class='fsize' style='font-family:var(--mono);flex:1'>CPU {:.2f}s · {:.2f}% · {} 次 · {:.2f}ms/次 · 内存 {:.1f} MiB</span>".format(
+                r["cpu_s"], r["cpu_pct"], r["requests"], r["cpu_ms_per_req"], r["mem_bytes"] / 1048576) +
+            budget + "</div>"
+        )
+    note = "" if tracemalloc.is_tracing() else "（内存统计未开启：启动时设置 PAAS_TRACEMALLOC=1）"
+    body = (
+        "<div class='ph'><div><h1>资源占用</h1>"
+        "<p style='color:var(--dim);font-size:.82rem'>最近 {} 分钟，按 CPU 排序；预算为 0 表示不限，超出后自动停止{}</p></div></div>".format(
+            len(_acct_window) * ACCT_INTERVAL // 60, note) +
+        "<div class='ftree'>{}</div>".format(rows or "<div class='frow'>暂无数据</div>")
+    )
+    return page(body, "资源占用")
+
+@main_app.route("/admin/usage/<int:sid>", methods=["POST"])
+@admin_required
+def set_budget(sid):
+    try:
+        cpu = float(request.form.get("cpu_budget") or 0)
+        mem = int(request.form.get("mem_budget_mb") or 0)
+    except ValueError:
+        cpu = -1
+    if cpu < 0 or mem < 0:
+        flash("预算需为非负数", "error")
+    else:
+        with db() as c:
+            c.execute("UPDATE services SET cpu_budget=?,mem_budget_mb=? WHERE id=?", [cpu, mem, sid])
+        flash("预算已保存，下一个统计周期生效", "success")
+    return redirect("/admin/usage")
+
+@main_app.route("/admin/logs")
+@admin_required
+def admin_logs():
+    try:
+        n     = max(1, min(int(request.args.get("n", 100)), ACCESS_TAIL_MAX))
+        since = int(request.args.get("since", 0))
+    except ValueError:
+        abort(400)
+    entries = log_tail(n, since, request.args.get("service"))
+    return jsonify(entries=entries, last=entries[-1]["seq"] if entries else since,
+                   written=access_stats["written"], dropped=access_stats["dropped"])
+
+@main_app.route("/metrics")
+def prom_metrics():
+    auth = request.headers.get("Authorization", "")
+    if not ((METRICS_TOKEN and hmac.compare_digest(auth, "Bearer " + METRICS_TOKEN)) or is_admin(me())):
+        abort(403)
+    return Response(metrics_prometheus(), mimetype="text/plain; version=0.0.4")
+
 # ═══ 新建服务 ══════════════════════════════════════════════════
 DEFAULT_CODE = """\
 from flask import Flask, jsonify
@@ -625,19 +2634,71 @@ def safe_path(base, rel):
         return p
     return None
 
-def list_items(svc, rel=""):
-    base   = svc_dir(svc)
-    target = (base / rel) if rel else base
-    if not target.is_dir():
-        return []
+# 目录列表：os.scandir 一遍扫完，目录项靠 d_type 判断，只对文件 stat 一次取大小；
+# 排好序的结果按目录缓存，目录 mtime 变化或经由本平台写入时失效。
+# 页面按游标分页，游标是上一页最后一项的排序键，bisect 定位
+LIST_PAGE  = 200       # 每页条目数
+LIST_CACHE = 64        # 缓存的目录数
+_list_cache = collections.OrderedDict()     # 绝对路径 -> (目录 mtime_ns, 排好序的条目)
+_list_lock  = threading.Lock()
+
+def _scan_dir(path):
     out = []
-    for p in sorted(target.iterdir(), key=lambda x: (x.is_file(), x.name.lower())):
-        rel_path = (rel + "/" + p.name) if rel else p.name
-        out.append({"name": p.name, "is_dir": p.is_dir(),
-                    "size": p.stat().st_size if p.is_file() else 0,
-                    "rel":  rel_path})
+    with os.scandir(path) as it:
+        for e in it:
+            try:
+                is_dir = e.is_dir()
+                size   = 0 if is_dir else e.stat().st_size
+            except OSError:
+                is_dir, size = False, 0
+            out.append(((not is_dir, e.name.lower(), e.name), is_dir, size))
+    out.sort()
     return out
 
+def _listing(path):
+    key = os.path.realpath(path)
+    try:
+        mtime = os.stat(key).st_mtime_ns
+    except OSError:
+        return []
+    with _list_lock:
+        hit = _list_cache.get(key)
+        if hit and hit[0] == mtime:
+            _list_cache.move_to_end(key)
+            return hit[1]
+    entries = _scan_dir(key)
+    with _list_lock:
+        _list_cache[key] = (mtime, entries)
+        _list_cache.move_to_end(key)
+        while len(_list_cache) > LIST_CACHE:
+            _list_cache.popitem(last=False)
+    return entries
+
+def invalidate_listing(path):
+    """path 目录（及其下所有子目录）的列表缓存失效"""
+    key = os.path.realpath(path)
+    with _list_lock:
+        for k in [k for k in _list_cache if k == key or k.startswith(key + os.sep)]:
+            del _list_cache[k]
+
+def list_cursor(item):
+    return ("f:" if not item["is_dir"] else "d:") + item["name"]
+
+def list_items(svc, rel="", after="", limit=LIST_PAGE):
+    """返回 (本页条目, 是否还有下一页, 总数)；after 是上一页最后一项的游标"""
+    base    = svc_dir(svc)
+    target  = (base / rel) if rel else base
+    entries = _listing(target) if target.is_dir() else []
+    start   = 0
+    if after[:2] in ("d:", "f:"):
+        name  = after[2:]
+        start = bisect.bisect_right(entries, ((after[0] == "f", name.lower(), name), True, float("inf")))
+    out = []
+    for (_, _, name), is_dir, size in entries[start:start + limit]:
+        out.append({"name": name, "is_dir": is_dir, "size": size,
+                    "rel":  (rel + "/" + name) if rel else name})
+    return out, start + limit < len(entries), len(entries)
+
 @main_app.route("/svc/<int:sid>")
 @login_required
 def svc_files(sid):
@@ -648,14 +2709,24 @@ def svc_files(sid):
         abort(404)
 
     rel    = request.args.get("rel", "")
-    items  = list_items(svc, rel)
+    after  = request.args.get("after", "")
+    try:
+        limit = max(1, min(int(request.args.get("limit", LIST_PAGE)), 1000))
+    except ValueError:
+        limit = LIST_PAGE
+    items, more, total = list_items(svc, rel, after, limit)
     parent = str(Path(rel).parent) if rel and str(Path(rel).parent) != "." else ""
 
-    if svc["status"] == "running":
+    if svc["status"] in ("running", "degraded"):
         toggle = '<form method="post" action="/svc/{}/undeploy"><button class="btn bgg sm">停止</button></form>'.format(sid)
     else:
         toggle = '<form method="post" action="/svc/{}/deploy"><button class="btn bok sm"><svg width="12" height="12" viewBox="0 0 12 12" fill="currentColor" style="vertical-align:middle"><polygon points="2,1 11,6 2,11"/></svg> 部署</button></form>'.format(sid)
 
+    job = active_jobs([sid]).get(sid)
+    if job:
+        toggle = "<span class='fsize' data-job='/svc/{}/job'>{}</span>".format(
+            sid, job_label(job).replace("<", "&lt;")) + JOB_JS
+
     err_html = ""
     if svc["status"] == "error" and svc["err_msg"]:
         safe_err = svc["err_msg"].replace("&","&amp;").replace("<","&lt;")
@@ -664,6 +2735,13 @@ def svc_files(sid):
             "部署失败 — 修改代码后重新部署</div><pre>{}</pre></div>".format(safe_err)
         )
 
+    cache_info = ""
+    rc = dispatcher.caches.get(svc["name"])
+    if rc is not None:
+        cs = rc.summary()
+        cache_info = "<span style='font-family:var(--mono)'>命中率 {:.1%} · {} 条 · {:.1f} MiB</span>".format(
+            cs["hit_ratio"], cs["entries"], (cs["mem_bytes"] + cs["disk_bytes"]) / 1048576)
+
     rows = ""
     if rel:
         back = "/svc/{}".format(sid) + ("?rel={}".format(parent) if parent else "")
@@ -701,6 +2779,15 @@ def svc_files(sid):
     if not rows:
         rows = "<div class='frow' style='color:var(--dim);justify-content:center;font-size:.83rem'>目录为空</div>"
 
+    if after or more:
+        page_url = "/svc/{}?".format(sid) + urlencode(dict([("rel", rel)] if rel else []))
+        pager = "<a class='btn bgg sm' href='{}'>第一页</a>".format(page_url) if after else ""
+        if more:
+            nxt = urlencode({"after": list_cursor(items[-1]), "limit": limit})
+            pager += "<a class='btn bgg sm' href='{}{}{}'>下一页</a>".format(page_url, "&" if rel else "", nxt)
+        rows += ("<div class='frow' style='justify-content:center;gap:8px'>"
+                 "<span class='fsize'>共 {} 项</span>{}</div>".format(total, pager))
+
     rel_display = ("/" + rel) if rel else "/"
     title_h     = (svc["title"] or svc["name"]).replace("<","&lt;")
 
@@ -715,10 +2802,18 @@ def svc_files(sid):
         "<div style='display:flex;gap:8px;margin-bottom:12px;flex-wrap:wrap;align-items:center'>"
         "<span style='font-size:.78rem;color:var(--dim);font-family:var(--mono)'>{}</span>".format(rel_display) +
         "<div style='flex:1'></div>"
+        "<span id='up-st' class='fsize'></span>"
         "<form method='post' action='/svc/{}/upload' enctype='multipart/form-data' style='display:inline-flex;gap:6px;align-items:center'>".format(sid) +
         "<input type='hidden' name='rel' value='{}'>".format(rel) +
-        "<input type='file' name='files' id='fu' multiple style='display:none' onchange='this.form.submit()'>"
+        "<input type='file' name='files' id='fu' multiple style='display:none' data-url='/svc/{}/put' data-rel='{}'"
+        " onchange='window.fetch ? phUpload(this) : this.form.submit()'>".format(sid, rel) +
         "<button type='button' class='btn bgg sm' onclick=\"document.getElementById('fu').click()\">上传文件</button></form>"
+        "<input type='file' id='fimp' accept='.zip,.tar,.gz,.tgz' style='display:none' data-url='/svc/{}/import'"
+        " onchange='phImport(this)'>".format(sid) +
+        "<label class='fsize' title='压缩包里只有一个顶层目录时勾选'><input type='checkbox' id='imp-strip'"
+        " style='width:auto;vertical-align:middle'> 去掉顶层目录</label>"
+        "<button type='button' class='btn bgg sm' onclick=\"document.getElementById('fimp').click()\">导入压缩包</button>"
+        "<a class='btn bgg sm' href='/svc/{}/export'>导出 zip</a>".format(sid) +
         "<form method='post' action='/svc/{}/newfile' style='display:inline-flex;gap:6px;align-items:center'>".format(sid) +
         "<input type='hidden' name='rel' value='{}'>".format(rel) +
         "<input type='text' name='fname' placeholder='新文件.py' style='width:130px;padding:5px 9px;font-size:.78rem'>"
@@ -728,10 +2823,347 @@ def svc_files(sid):
         "<input type='text' name='dname' placeholder='文件夹名' style='width:110px;padding:5px 9px;font-size:.78rem'>"
         "<button class='btn bgg sm'>新建文件夹</button></form>"
         "</div>"
-        "<div class='ftree'>{}</div>".format(rows)
+        "<form method='post' action='/svc/{}/workers' style='display:flex;gap:6px;align-items:center;margin-bottom:12px'>".format(sid) +
+        "<span style='font-size:.78rem;color:var(--dim)'>worker 进程数（0 = 与平台同进程运行）</span>"
+        "<input type='number' name='workers' min='0' max='{}' value='{}' style='width:70px;padding:5px 9px;font-size:.78rem'>".format(MAX_WORKERS, svc["workers"] or 0) +
+        "<button class='btn bgg sm'>保存</button></form>"
+        "<form method='post' action='/svc/{}/limits' style='display:flex;flex-wrap:wrap;gap:6px;align-items:center;margin-bottom:12px;font-size:.78rem;color:var(--dim)'>".format(sid) +
+        "<span>限流（0 = 不限）</span>"
+        "每秒<input type='number' name='rate_limit' min='0' step='any' value='{:g}' style='width:70px;padding:5px 9px;font-size:.78rem'>".format(svc["rate_limit"] or 0) +
+        "突发<input type='number' name='rate_burst' min='0' value='{}' style='width:60px;padding:5px 9px;font-size:.78rem'>".format(svc["rate_burst"] or 0) +
+        "在途<input type='number' name='max_inflight' min='0' value='{}' style='width:60px;padding:5px 9px;font-size:.78rem'>".format(svc["max_inflight"] or 0) +
+        "排队毫秒<input type='number' name='queue_ms' min='0' value='{}' style='width:70px;padding:5px 9px;font-size:.78rem'>".format(svc["queue_ms"] or 0) +
+        "<button class='btn bgg sm'>保存</button></form>"
+        "<form method='post' action='/svc/{}/cache' style='display:flex;flex-wrap:wrap;gap:6px;align-items:center;margin-bottom:12px;font-size:.78rem;color:var(--dim)'>".format(sid) +
+        "<span>响应缓存（0 = 关闭）</span>"
+        "内存 MiB<input type='number' name='cache_mb' min='0' max='{}' value='{}' style='width:60px;padding:5px 9px;font-size:.78rem'>".format(CACHE_MAX_MB, svc["cache_mb"] or 0) +
+        "磁盘 MiB<input type='number' name='cache_disk_mb' min='0' max='{}' value='{}' style='width:60px;padding:5px 9px;font-size:.78rem'>".format(CACHE_MAX_MB, svc["cache_disk_mb"] or 0) +
+        "<button class='btn bgg sm'>保存</button>"
+        "<button class='btn bgg sm' formaction='/svc/{}/cache/purge'>清空缓存</button>{}</form>".format(sid, cache_info) +
+        "<div class='ftree'>{}</div>".format(rows) + UPLOAD_JS + IMPORT_JS
     )
     return page(body, "文件 — {}".format(svc["name"]))
 
+# ═══ 流式上传 ══════════════════════════════════════════════════
+# 页面上的上传走 PUT /svc/<sid>/put：请求体按块直接写进服务目录下的
+# <文件>.part，写完再改名；带 Content-Range 时可以断点续传（GET 同一 URL
+# 查询已收到的字节数）。单文件上限和服务配额在写入过程中逐块检查。
+# 旧的 multipart 表单只在浏览器不支持 fetch 时使用
+UPLOAD_CHUNK  = 1 << 20      # 每次从请求体读取的字节数
+UPLOAD_SLICE  = 8 << 20      # 浏览器端每个 PUT 请求的分片大小
+MAX_FILE_SIZE = 2 << 30      # 单文件上限
+SVC_QUOTA     = 4 << 30      # 每个服务的磁盘配额
+USAGE_TTL     = 60           # 服务目录占用统计的缓存秒数
+CONTENT_RANGE = re.compile(r"bytes (\d+)-(\d+)/(\d+)$")
+_usage        = {}           # svc_id -> (统计时间, 字节数)
+
+def svc_usage(svc):
+    hit = _usage.get(svc["id"])
+    if hit and time.time() - hit[0] < USAGE_TTL:
+        return hit[1]
+    total = 0
+    for root, _, files in os.walk(svc_dir(svc)):
+        for n in files:
+            try:
+                total += os.stat(os.path.join(root, n)).st_size
+            except OSError:
+                pass
+    _usage[svc["id"]] = (time.time(), total)
+    return total
+
+def add_usage(svc_id, n):
+    hit = _usage.get(svc_id)
+    if hit:
+        _usage[svc_id] = (hit[0], hit[1] + n)
+
+UPLOAD_JS = """<script>
+async function phUpload(inp) {
+  var st = document.getElementById('up-st'), SLICE = %d;
+  for (const f of inp.files) {
+    var path = (inp.dataset.rel ? inp.dataset.rel + '/' : '') + f.name;
+    var url  = inp.dataset.url + '?path=' + encodeURIComponent(path);
+    var r = await fetch(url), j = await r.json(), pos = j.received || 0;
+    if (pos > f.size) pos = 0;
+    do {
+      var end  = Math.min(pos + SLICE, f.size);
+      var hdrs = f.size ? {'Content-Range': 'bytes ' + pos + '-' + (end - 1) + '/' + f.size} : {};
+      r = await fetch(url, {method: 'PUT', headers: hdrs, body: f.slice(pos, end)});
+      j = await r.json();
+      if (!r.ok) { st.textContent = f.name + '：' + j.error; return; }
+      pos = j.received;
+      st.textContent = f.name + ' ' + (f.size ? Math.floor(pos * 100 / f.size) : 100) + '%%' +
+                       (j.mbps ? ' · ' + j.mbps + ' MB/s' : '');
+    } while (!j.done);
+  }
+  location.reload();
+}
+</script>""" % UPLOAD_SLICE
+
+@main_app.route("/svc/<int:sid>/put", methods=["GET", "PUT"])
+@login_required
+def stream_upload(sid):
+    u = me()
+    with db() as c:
+        svc = c.execute("SELECT * FROM services WHERE id=? AND user_id=?", [sid, u["id"]]).fetchone()
+    if not svc:
+        abort(404)
+    d, _, name = request.args.get("path", "").strip("/").rpartition("/")
+    name   = secure_filename(name)
+    target = safe_path(svc_dir(svc), (d + "/" + name) if d else name) if name else None
+    if not target or target.is_dir():
+        return jsonify(error="文件路径无效"), 400
+    part = target.with_name(target.name + ".part")
+    have = part.stat().st_size if part.exists() else 0
+    if request.method == "GET":
+        return jsonify(received=have)
+
+    cr = request.headers.get("Content-Range")
+    if cr:
+        m = CONTENT_RANGE.match(cr)
+        if not m:
+            return jsonify(error="Content-Range 格式错误"), 400
+        start, total = int(m.group(1)), int(m.group(3))
+        if start > have:
+            return jsonify(error="分片不连续", received=have), 416
+    else:
+        start, total, have = 0, request.content_length, 0
+    if total is not None and total > MAX_FILE_SIZE:
+        return jsonify(error="单个文件不能超过 {} MB".format(MAX_FILE_SIZE >> 20)), 413
+    used  = svc_usage(svc) - have
+    if used + (total or 0) > SVC_QUOTA:
+        return jsonify(error="超出服务空间配额 {} MB".format(SVC_QUOTA >> 20)), 413
+    limit = min(total if total is not None else MAX_FILE_SIZE, MAX_FILE_SIZE, SVC_QUOTA - used)
+
+    target.parent.mkdir(parents=True, exist_ok=True)
+    stream, pos, t0 = request.stream, start, time.time()
+    with open(part, "r+b" if start else "wb") as f:
+        f.seek(start)
+        while True:
+            chunk = stream.read(UPLOAD_CHUNK)
+            if not chunk:
+                break
+            if pos + len(chunk) > limit:
+                f.truncate(start)
+                return jsonify(error="超出单文件上限或服务配额", received=start), 413
+            f.write(chunk)
+            pos += len(chunk)
+    elapsed  = time.time() - t0
+    received = max(have, pos)
+    add_usage(svc["id"], received - have)
+    done = total is None or received >= total
+    if done:
+        os.replace(part, target)
+        invalidate_listing(target.parent)
+    return jsonify(received=received, done=done, bytes=pos - start, elapsed=round(elapsed, 3),
+                   mbps=round((pos - start) / 1048576 / elapsed, 2) if elapsed else None)
+
+# ═══ 打包导入 / 导出 ═══════════════════════════════════════════
+# 导入：请求体就是压缩包。tar / tar.gz 边收边解；zip 的目录在文件末尾，
+# 先按块落到临时文件再解。每个成员都过 safe_path，只解普通文件和目录，
+# 解出的总字节数受服务配额限制（防 zip 炸弹）：成员头里声明的大小先核一遍，
+# 写的时候再按实际字节数核。成员先写到目标目录里的临时文件，整个包解完才逐个
+# os.replace 到位；中途出错（超配额、包损坏）临时文件全部删掉，已有文件一个不动。
+# 导出：zipfile 写到一个不可 seek 的管道对象上，写一块吐一块，不在内存里攒整个包
+ARCHIVE_SKIP = ("__MACOSX/", "__pycache__/")
+QUOTA_ERROR  = "超出服务空间配额"
+
+def _member_path(base, name, strip):
+    name  = name.replace("\\", "/").lstrip("/")
+    parts = [x for x in name.split("/") if x not in ("", ".")]
+    if strip:
+        parts = parts[1:]
+    if not parts or any((x + "/") in ARCHIVE_SKIP for x in parts):
+        return None
+    p = safe_path(base, "/".join(parts))
+    return None if p is None or p == base.resolve() else p
+
+def _copy_member(src, dst_path, budget, staged):
+    """按块拷贝一个成员到 dst_path 旁边的临时文件，(临时文件, 目标) 记进 staged；
+    返回写入字节数，超出 budget 抛 ValueError"""
+    dst_path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=str(dst_path.parent), prefix=".import-", suffix=".tmp")
+    staged.append((tmp, dst_path))
+    n = 0
+    with os.fdopen(fd, "wb") as dst:
+        while True:
+            chunk = src.read(UPLOAD_CHUNK)
+            if not chunk:
+                return n
+            n += len(chunk)
+            if n > budget:
+                raise ValueError(QUOTA_ERROR)
+            dst.write(chunk)
+
+def _commit_staged(staged):
+    for tmp, dst in staged:
+        os.replace(tmp, str(dst))
+    del staged[:]
+
+def _discard_staged(staged):
+    for tmp, _ in staged:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+
+def _import_tar(stream, base, strip, budget):
+    files = skipped = total = 0
+    staged = []
+    try:
+        with tarfile.open(fileobj=stream, mode="r|*") as tf:
+            for m in tf:
+                p = _member_path(base, m.name, strip)
+                if p is None or not (m.isfile() or m.isdir()):
+                    skipped += 1
+                elif m.isdir():
+                    p.mkdir(parents=True, exist_ok=True)
+                else:
+                    # tar 是流式的，拿不到全部成员的大小，只能逐个成员先核头里的 size
+                    if m.size > budget - total:
+                        raise ValueError(QUOTA_ERROR)
+                    total += _copy_member(tf.extractfile(m), p, budget - total, staged)
+                    files += 1
+        _commit_staged(staged)
+    finally:
+        _discard_staged(staged)
+    return files, skipped, total
+
+def _import_zip(stream, base, strip, budget):
+    files = skipped = total = 0
+    staged = []
+    with tempfile.TemporaryFile() as tmp:
+        size = 0
+        while True:
+            chunk = stream.read(UPLOAD_CHUNK)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > MAX_FILE_SIZE:
+                raise ValueError("压缩包不能超过 {} MB".format(MAX_FILE_SIZE >> 20))
+            tmp.write(chunk)
+        tmp.seek(0)
+        with zipfile.ZipFile(tmp) as zf:
+            plan = []
+            for info in zf.infolist():
+                p = _member_path(base, info.filename, strip)
+                is_link = (info.external_attr >> 16) & 0o170000 == 0o120000
+                if p is None or is_link:
+                    skipped += 1
+                else:
+                    plan.append((info, p))
+            # 目录在文件头里，动手之前就能核总大小；声明的大小可能是假的，拷贝时还会再核
+            if sum(info.file_size for info, _ in plan if not info.is_dir()) > budget:
+                raise ValueError(QUOTA_ERROR)
+            try:
+                for info, p in plan:
+                    if info.is_dir():
+                        p.mkdir(parents=True, exist_ok=True)
+                    else:
+                        with zf.open(info) as src:
+                            total += _copy_member(src, p, budget - total, staged)
+                        files += 1
+                _commit_staged(staged)
+            finally:
+                _discard_staged(staged)
+    return files, skipped, total
+
+@main_app.route("/svc/<int:sid>/import", methods=["POST"])
+@login_required
+def import_archive(sid):
+    u = me()
+    with db() as c:
+        svc = c.execute("SELECT * FROM services WHERE id=? AND user_id=?", [sid, u["id"]]).fetchone()
+    if not svc:
+        abort(404)
+    name  = request.args.get("name", "").lower()
+    strip = request.args.get("strip") == "1"
+    base  = svc_dir(svc)
+    base.mkdir(parents=True, exist_ok=True)
+    t0 = time.time()
+    try:
+        if name.endswith(".zip"):
+            res = _import_zip(request.stream, base, strip, SVC_QUOTA - svc_usage(svc))
+        elif name.endswith((".tar", ".tar.gz", ".tgz")):
+            res = _import_tar(request.stream, base, strip, SVC_QUOTA - svc_usage(svc))
+        else:
+            return jsonify(error="只支持 .zip / .tar / .tar.gz / .tgz"), 400
+    except ValueError as e:
+        return jsonify(error=str(e)), 413
+    except (zipfile.BadZipFile, tarfile.TarError, EOFError, OSError) as e:
+        return jsonify(error="压缩包无法解析：{}".format(e)), 400
+    finally:
+        invalidate_listing(base)
+        _usage.pop(svc["id"], None)
+    files, skipped, total = res
+    return jsonify(files=files, skipped=skipped, bytes=total, elapsed=round(time.time() - t0, 3))
+
+class _ZipPipe:
+    """给 zipfile 用的只写管道：没有 seek/tell，zipfile 会改用数据描述符"""
+    def __init__(self):
+        self.buf = bytearray()
+
+    def write(self, b):
+        self.buf += b
+        return len(b)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        out = bytes(self.buf)
+        self.buf.clear()
+        return out
+
+def zip_stream(base):
+    pipe = _ZipPipe()
+    with zipfile.ZipFile(pipe, "w", zipfile.ZIP_DEFLATED) as zf:
+        for root, dirs, files in os.walk(base):
+            dirs[:] = sorted(d for d in dirs if d + "/" not in ARCHIVE_SKIP)
+            for n in sorted(files):
+                full = os.path.join(root, n)
+                try:
+                    info = zipfile.ZipInfo.from_file(full, os.path.relpath(full, base))
+                except OSError:
+                    continue
+                info.compress_type = zipfile.ZIP_DEFLATED
+                with open(full, "rb") as src, \
+                        zf.open(info, "w", force_zip64=info.file_size > zipfile.ZIP64_LIMIT >> 1) as dst:
+                    while True:
+                        chunk = src.read(UPLOAD_CHUNK)
+                        if not chunk:
+                            break
+                        dst.write(chunk)
+                        if pipe.buf:
+                            yield pipe.drain()
+                if pipe.buf:
+                    yield pipe.drain()
+    yield pipe.drain()
+
+@main_app.route("/svc/<int:sid>/export")
+@login_required
+def export_archive(sid):
+    u = me()
+    with db() as c:
+        svc = c.execute("SELECT * FROM services WHERE id=? AND user_id=?", [sid, u["id"]]).fetchone()
+    if not svc:
+        abort(404)
+    return Response(zip_stream(str(svc_dir(svc))), mimetype="application/zip", headers={
+        "Content-Disposition": "attachment; filename={}.zip".format(svc["name"])})
+
+IMPORT_JS = """<script>
+async function phImport(inp) {
+  var st = document.getElementById('up-st'), f = inp.files[0];
+  if (!f) return;
+  var strip = document.getElementById('imp-strip').checked ? '1' : '0';
+  st.textContent = '导入 ' + f.name + ' …';
+  var r = await fetch(inp.dataset.url + '?strip=' + strip + '&name=' + encodeURIComponent(f.name),
+                      {method: 'POST', body: f});
+  var j = await r.json();
+  if (!r.ok) { st.textContent = f.name + '：' + j.error; return; }
+  location.reload();
+}
+</script>"""
+
 @main_app.route("/svc/<int:sid>/upload", methods=["POST"])
 @login_required
 def upload_file(sid):
@@ -740,6 +3172,8 @@ def upload_file(sid):
         svc = c.execute("SELECT * FROM services WHERE id=? AND user_id=?", [sid, u["id"]]).fetchone()
     if not svc:
         abort(404)
+    if (request.content_length or 0) > min(MAX_FILE_SIZE, SVC_QUOTA - svc_usage(svc)):
+        abort(413)
     rel  = request.form.get("rel","")
     base = svc_dir(svc) / rel if rel else svc_dir(svc)
     base.mkdir(parents=True, exist_ok=True)
@@ -748,6 +3182,8 @@ def upload_file(sid):
         if f.filename:
             f.save(str(base / secure_filename(f.filename)))
             count += 1
+    invalidate_listing(base)
+    _usage.pop(svc["id"], None)
     flash("上传了 {} 个文件".format(count), "success")
     return redirect("/svc/{}".format(sid) + ("?rel={}".format(rel) if rel else ""))
 
@@ -768,6 +3204,7 @@ def new_file(sid):
     fp   = base / fname
     if not fp.exists():
         fp.write_text("")
+        invalidate_listing(base)
     path = "{}/{}".format(rel, fname) if rel else fname
     return redirect("/svc/{}/edit?path={}".format(sid, path))
 
@@ -784,6 +3221,7 @@ def make_dir(sid):
     if dname:
         target = svc_dir(svc) / rel / dname if rel else svc_dir(svc) / dname
         target.mkdir(exist_ok=True)
+        invalidate_listing(target.parent)
         flash("{} 已创建".format(dname), "success")
     else:
         flash("文件夹名不能为空", "error")
@@ -802,6 +3240,9 @@ def delete_path(sid):
     target   = safe_path(svc_dir(svc), rel_path)
     if target and target.exists():
         shutil.rmtree(target) if target.is_dir() else target.unlink()
+        invalidate_listing(target)
+        invalidate_listing(target.parent)
+        _usage.pop(svc["id"], None)
         flash("已删除", "info")
     return redirect("/svc/{}".format(sid) + ("?rel={}".format(back_rel) if back_rel else ""))
 
@@ -882,13 +3323,19 @@ EDITOR_TPL = """\
     </div>
   </div>
 
-  <form method='post' id='ef'>
+  <!-- 保存只走 JS（PATCH + If-Match）；编辑器没加载出来时表单不提交，不会把空内容写进文件 -->
+  <form id='ef' onsubmit='return false'>
     <input type='hidden' name='path' value='{{ e_path }}'>
+    <input type='hidden' name='etag' id='ed-etag' value=''>
     <div class='ed-bar'>
       <span style='font-family:var(--mono);font-size:.78rem;color:var(--acc)'>{{ e_path }}</span>
       <div style='display:flex;gap:8px;align-items:center'>
         <span id='ed-status' style='font-size:.72rem;color:var(--dim)'></span>
         <a href='{{ e_back_url }}' class='btn bgg sm'>取消</a>
+        {% if e_big %}
+        <button type='button' id='pg-prev' class='btn bgg sm'>上一段</button>
+        <button type='button' id='pg-next' class='btn bgg sm'>下一段</button>
+        {% else %}
         <button type='submit' class='btn bp sm'>
           <svg width='13' height='13' viewBox='0 0 13 13' fill='none' stroke='currentColor'
                stroke-width='1.4' stroke-linecap='round' stroke-linejoin='round'
@@ -899,9 +3346,9 @@ EDITOR_TPL = """\
           </svg>
           保存 (Ctrl+S)
         </button>
+        {% endif %}
       </div>
     </div>
-    <textarea id='ed' name='code' style='display:none'></textarea>
     <div id='cm-wrap'></div>
   </form>
 </div>
@@ -915,14 +3362,15 @@ EDITOR_TPL = """\
 <script src='{{ e_cdn }}addon/comment/comment.min.js'></script>
 
 <script>
-/* 用 JSON 安全注入两个值，完全不受代码内容特殊字符影响 */
-var _CODE = {{ e_code_json | safe }};
+/* 用 JSON 安全注入参数；文件内容不再内联，由 JS 从文件接口单独拉取 */
+var _URL  = {{ e_file_url_json | safe }};
 var _MODE = {{ e_mode_json | safe }};
+var _BIG  = {{ e_big_json | safe }};   /* 大文件：{size, page}，按字节区间分段只读 */
 </script>
 <script>
 (function () {
   var cm = CodeMirror(document.getElementById('cm-wrap'), {
-    value:             _CODE,
+    value:             '',
     mode:              _MODE,
     theme:             'material-darker',
     lineNumbers:       true,
@@ -933,6 +3381,7 @@ var _MODE = {{ e_mode_json | safe }};
     indentWithTabs:    false,
     lineWrapping:      false,
     autofocus:         true,
+    readOnly:          !!_BIG,
     extraKeys: {
       'Ctrl-S': function () { doSave(); },
       'Cmd-S':  function () { doSave(); },
@@ -940,139 +3389,618 @@ var _MODE = {{ e_mode_json | safe }};
       'Ctrl-/': 'toggleComment'
     }
   });
+  var st      = document.getElementById('ed-status');
+  var etagEl  = document.getElementById('ed-etag');
+  var base    = [];
+  var offset  = 0;
+  var isSaved = true;
+
+  function lines(t) { return t.split(/\r?\n/); }
+
+  function load() {
+    var hdrs = _BIG ? {'Range': 'bytes=' + offset + '-' + (offset + _BIG.page - 1)} : {};
+    st.textContent = '加载中…';
+    fetch(_URL, {headers: hdrs, cache: 'no-cache'}).then(function (r) {
+      if (r.status === 404) { etagEl.value = '*'; return ''; }   /* 新文件，首次保存时创建 */
+      etagEl.value = r.headers.get('ETag') || '';
+      return r.text();
+    }).then(function (t) {
+      base = lines(t);
+      cm.setValue(t);
+      cm.clearHistory();
+      isSaved = true;
+      st.textContent = _BIG ? ('只读 · ' + offset + '-' + Math.min(offset + _BIG.page, _BIG.size) +
+                               ' / ' + _BIG.size + ' 字节') : '';
+    });
+  }
 
+  /* 只发送改动的那一段行：去掉首尾相同的行，剩下的作为一个 hunk，
+     带上 If-Match，文件被别人改过时服务器返回 412 而不是覆盖 */
   function doSave() {
-    document.getElementById('ed').value = cm.getValue();
-    document.getElementById('ef').submit();
+    if (_BIG) return;
+    var cur = lines(cm.getValue()), a = 0, b = 0;
+    while (a < base.length && a < cur.length && base[a] === cur[a]) a++;
+    while (b < base.length - a && b < cur.length - a &&
+           base[base.length - 1 - b] === cur[cur.length - 1 - b]) b++;
+    var hunk = {start: a, end: base.length - b, lines: cur.slice(a, cur.length - b)};
+    st.textContent = '保存中…';
+    fetch(_URL, {
+      method:  'PATCH',
+      headers: {'Content-Type': 'application/json', 'If-Match': etagEl.value},
+      body:    JSON.stringify(hunk)
+    }).then(function (r) {
+      return r.json().then(function (j) { return [r.ok, j]; });
+    }).then(function (x) {
+      if (x[0]) {
+        etagEl.value = x[1].etag;
+        base = cur;
+        isSaved = true;
+        st.textContent = '已保存';
+      } else {
+        st.textContent = x[1].error;
+      }
+    }).catch(function () { st.textContent = '保存失败，请重试'; });
   }
 
-  document.getElementById('ef').addEventListener('submit', function () {
-    document.getElementById('ed').value = cm.getValue();
+  document.getElementById('ef').addEventListener('submit', function (ev) {
+    ev.preventDefault();
+    doSave();
   });
 
-  var isSaved = true;
   cm.on('change', function () {
-    if (isSaved) {
+    if (isSaved && !_BIG) {
       isSaved = false;
-      document.getElementById('ed-status').textContent = '● 未保存';
+      st.textContent = '● 未保存';
     }
   });
-  document.getElementById('ef').addEventListener('submit', function () {
-    isSaved = true;
-  });
+
+  if (_BIG) {
+    document.getElementById('pg-prev').onclick = function () {
+      if (offset > 0) { offset = Math.max(0, offset - _BIG.page); load(); }
+    };
+    document.getElementById('pg-next').onclick = function () {
+      if (offset + _BIG.page < _BIG.size) { offset += _BIG.page; load(); }
+    };
+  }
+  load();
 }());
 </script>
 </body></html>"""
 
-@main_app.route("/svc/<int:sid>/edit", methods=["GET","POST"])
-@login_required
-def edit_file(sid):
+EDITOR_T = main_app.jinja_env.from_string(EDITOR_TPL)
+
+# 文件内容通过 /svc/<sid>/file 单独读写：
+#   GET   带 ETag（大小 + 内容摘要），支持 If-None-Match → 304 和 Range 分段
+#   PATCH {"start", "end", "lines"} 行区间替换，必须带 If-Match；只改 UTF-8 文本，别的编码返回 415
+#   PUT   整个替换，带 If-Match 时同样做乐观并发检查
+# 写入都是同目录临时文件 + os.replace，读到的永远是完整的旧文件或新文件。
+# ETag 不用 mtime：手机存储上 mtime 常常只有秒级，同一秒里两次等长的保存会撞同一个 ETag。
+# 编辑器能打开的文件每次都重新算摘要；更大的文件按 (inode, mtime, ctime, 大小) 缓存摘要
+EDITOR_MAX   = 2 << 20     # 超过这个大小的文件在编辑器里分段只读
+EDITOR_PAGE  = 256 << 10   # 分段大小
+DIGEST_CACHE = 256         # 大文件摘要缓存的条目数
+_digests     = collections.OrderedDict()     # (路径, inode, mtime_ns, ctime_ns, 大小) -> 摘要
+_digest_lock = threading.Lock()
+
+def file_etag(path, st):
+    key = None
+    if st.st_size > EDITOR_MAX:
+        key = (str(path), st.st_ino, st.st_mtime_ns, st.st_ctime_ns, st.st_size)
+        with _digest_lock:
+            hit = _digests.get(key)
+            if hit is not None:
+                _digests.move_to_end(key)
+                return hit
+    h = hashlib.blake2b(digest_size=10)
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(UPLOAD_CHUNK)
+            if not chunk:
+                break
+            h.update(chunk)
+    tag = "{:x}-{}".format(st.st_size, h.hexdigest())
+    if key is not None:
+        with _digest_lock:
+            _digests[key] = tag
+            while len(_digests) > DIGEST_CACHE:
+                _digests.popitem(last=False)
+    return tag
+
+def atomic_write(target, data):
+    target.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=str(target.parent), prefix="." + target.name + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        if target.exists():
+            shutil.copymode(str(target), tmp)
+        os.replace(tmp, str(target))
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+    invalidate_listing(target.parent)
+    return "{:x}-{}".format(len(data), hashlib.blake2b(data, digest_size=10).hexdigest())
+
+def _edit_target(sid):
     u = me()
     with db() as c:
         svc = c.execute("SELECT * FROM services WHERE id=? AND user_id=?", [sid, u["id"]]).fetchone()
     if not svc:
         abort(404)
-
     path = (request.args.get("path") or request.form.get("path","")).strip("/")
     if not path:
         abort(400)
     target = safe_path(svc_dir(svc), path)
-    if not target:
+    if not target or target.is_dir():
         abort(403)
+    return svc, path, target
+
+@main_app.route("/svc/<int:sid>/file", methods=["GET", "PUT", "PATCH"])
+@login_required
+def file_api(sid):
+    svc, path, target = _edit_target(sid)
+    st = target.stat() if target.exists() else None
+    if request.method == "GET":
+        if st is None:
+            return jsonify(error="文件不存在"), 404
+        return send_file(target, mimetype="text/plain; charset=utf-8", etag=file_etag(target, st),
+                         max_age=0, conditional=True)
+
+    cur = file_etag(target, st) if st else None
+    if request.if_match and not (request.if_match.star_tag or request.if_match.contains(cur or "")):
+        return jsonify(error="文件已被修改，请刷新后再保存", etag=cur), 412
+    if request.method == "PUT":
+        return jsonify(etag=atomic_write(target, request.get_data()))
+
+    if not request.if_match:
+        return jsonify(error="缺少 If-Match"), 428
+    if st and st.st_size > EDITOR_MAX:
+        return jsonify(error="文件过大，不支持按行修改"), 413
+    hunk = request.get_json(silent=True) or {}
+    try:
+        text = target.read_bytes().decode("utf-8") if st else ""
+    except UnicodeDecodeError:
+        # 按行替换要解码再编码回去，非 UTF-8 的字节会被换成 U+FFFD，整个文件就坏了
+        return jsonify(error="文件不是 UTF-8 文本，不能按行修改，请整个替换（PUT）"), 415
+    nl   = "\r\n" if "\r\n" in text else "\n"
+    rows = re.split(r"\r?\n", text)
+    try:
+        start, end, new = int(hunk["start"]), int(hunk["end"]), [str(x) for x in hunk["lines"]]
+    except (KeyError, TypeError, ValueError):
+        return jsonify(error="补丁格式错误"), 400
+    if not 0 <= start <= end <= len(rows):
+        return jsonify(error="补丁超出文件范围"), 400
+    rows[start:end] = new
+    return jsonify(etag=atomic_write(target, nl.join(rows).encode("utf-8")))
+
+@main_app.route("/svc/<int:sid>/edit")
+@login_required
+def edit_file(sid):
+    svc, path, target = _edit_target(sid)
+    u = me()
 
     back_rel = str(Path(path).parent) if str(Path(path).parent) != "." else ""
     back_url = "/svc/{}".format(sid) + ("?rel={}".format(back_rel) if back_rel else "")
 
-    if request.method == "POST":
-        code = request.form.get("code","")
-        target.parent.mkdir(parents=True, exist_ok=True)
-        target.write_text(code, encoding="utf-8")
-        flash("已保存", "success")
-        return redirect("/svc/{}/edit?path={}".format(sid, path))
-
-    code = target.read_text(encoding="utf-8", errors="replace") if target.exists() else ""
+    size = target.stat().st_size if target.exists() else 0
 
     ext           = Path(path).suffix.lower()
     cm_mode       = EXT_MODE.get(ext)          # None → 纯文本
     extra_scripts = MODE_SCRIPTS.get(cm_mode, [])
-    code_json     = json.dumps(code)            # Python str → JS 字符串字面量
     mode_json     = json.dumps(cm_mode)         # None→"null"  "python"→'"python"'
+    big           = {"size": size, "page": EDITOR_PAGE} if size > EDITOR_MAX else None
+    file_url      = "/svc/{}/file?".format(sid) + urlencode({"path": path})
 
-    user = me()
-    if user:
-        nav = '<a href="/">仪表盘</a><a href="/logout">退出 {}</a>'.format(user["username"])
-    else:
-        nav = '<a href="/login">登录</a>'
+    nav = '<a href="/">仪表盘</a><a href="/logout">退出 {}</a>'.format(u["username"])
 
-    return render_template_string(
-        EDITOR_TPL,
+    return EDITOR_T.render(
         e_cdn           = CDN,
         e_path          = path,
         e_svc_title     = svc["title"] or svc["name"],
         e_back_url      = back_url,
-        e_code_json     = code_json,
+        e_file_url_json = json.dumps(file_url),
         e_mode_json     = mode_json,
+        e_big           = big,
+        e_big_json      = json.dumps(big),
         e_extra_scripts = extra_scripts,
-        e_css           = CSS,
+        e_css           = CSS_LINK,
         e_nav           = nav,
     )
 
 # ═══ 部署 / 停止 / 删除路由 ════════════════════════════════════
-@main_app.route("/svc/<int:sid>/deploy", methods=["POST"])
+@main_app.route("/svc/<int:sid>/workers", methods=["POST"])
 @login_required
-def do_deploy(sid):
+def set_workers(sid):
     u = me()
     with db() as c:
         svc = c.execute("SELECT * FROM services WHERE id=? AND user_id=?", [sid, u["id"]]).fetchone()
     if not svc:
         abort(404)
-    ok, msg = deploy(sid)
-    flash(msg, "success" if ok else "error")
-    return redirect(request.referrer or "/")
+    try:
+        n = int(request.form.get("workers", "0"))
+    except ValueError:
+        n = -1
+    if not 0 <= n <= MAX_WORKERS:
+        flash("worker 进程数需在 0-{} 之间".format(MAX_WORKERS), "error")
+    else:
+        with db() as c:
+            c.execute("UPDATE services SET workers=? WHERE id=?", [n, sid])
+        flash("已保存，重新部署后生效", "success")
+    return redirect("/svc/{}".format(sid))
 
-@main_app.route("/svc/<int:sid>/undeploy", methods=["POST"])
+@main_app.route("/svc/<int:sid>/limits", methods=["POST"])
 @login_required
-def do_undeploy(sid):
+def set_limits(sid):
     u = me()
     with db() as c:
         svc = c.execute("SELECT * FROM services WHERE id=? AND user_id=?", [sid, u["id"]]).fetchone()
     if not svc:
         abort(404)
-    undeploy(sid)
-    flash("服务已停止", "info")
-    return redirect(request.referrer or "/")
+    try:
+        vals = [float(request.form.get("rate_limit") or 0)] + [
+            int(request.form.get(k) or 0) for k in ("rate_burst", "max_inflight", "queue_ms")]
+    except ValueError:
+        vals = [-1]
+    if min(vals) < 0:
+        flash("限流参数需为非负数", "error")
+    else:
+        with db() as c:
+            c.execute("UPDATE services SET rate_limit=?,rate_burst=?,max_inflight=?,queue_ms=? WHERE id=?",
+                      vals + [sid])
+            svc = c.execute("SELECT * FROM services WHERE id=?", [sid]).fetchone()
+        if svc["name"] in dispatcher.mounts:
+            dispatcher.limit(svc["name"], Limiter.for_service(svc))
+        flash("限流设置已生效", "success")
+    return redirect("/svc/{}".format(sid))
+
+@main_app.route("/svc/<int:sid>/cache", methods=["POST"])
+@login_required
+def set_cache(sid):
+    u = me()
+    with db() as c:
+        svc = c.execute("SELECT * FROM services WHERE id=? AND user_id=?", [sid, u["id"]]).fetchone()
+    if not svc:
+        abort(404)
+    try:
+        vals = [int(request.form.get(k) or 0) for k in ("cache_mb", "cache_disk_mb")]
+    except ValueError:
+        vals = [-1]
+    if not all(0 <= v <= CACHE_MAX_MB for v in vals):
+        flash("缓存大小需在 0-{} MiB 之间".format(CACHE_MAX_MB), "error")
+    else:
+        with db() as c:
+            c.execute("UPDATE services SET cache_mb=?,cache_disk_mb=? WHERE id=?", vals + [sid])
+            svc = c.execute("SELECT * FROM services WHERE id=?", [sid]).fetchone()
+        if svc["name"] in dispatcher.mounts:
+            dispatcher.cache(svc["name"], ResponseCache.for_service(svc))
+        flash("缓存设置已生效", "success")
+    return redirect("/svc/{}".format(sid))
+
+@main_app.route("/svc/<int:sid>/cache/purge", methods=["POST"])
+@login_required
+def purge_cache(sid):
+    u = me()
+    with db() as c:
+        svc = c.execute("SELECT * FROM services WHERE id=? AND user_id=?", [sid, u["id"]]).fetchone()
+    if not svc:
+        abort(404)
+    rc = dispatcher.caches.get(svc["name"])
+    if rc is not None:
+        rc.purge()
+    flash("缓存已清空", "info")
+    return redirect("/svc/{}".format(sid))
+
+@main_app.route("/svc/<int:sid>/deploy", methods=["POST"])
+@login_required
+def do_deploy(sid):
+    return _queue_job(sid, "deploy")
+
+@main_app.route("/svc/<int:sid>/undeploy", methods=["POST"])
+@login_required
+def do_undeploy(sid):
+    return _queue_job(sid, "undeploy")
 
 @main_app.route("/svc/<int:sid>/remove", methods=["POST"])
 @login_required
 def remove_svc(sid):
+    return _queue_job(sid, "remove")
+
+def _queue_job(sid, kind):
     u = me()
     with db() as c:
         svc = c.execute("SELECT * FROM services WHERE id=? AND user_id=?", [sid, u["id"]]).fetchone()
     if not svc:
         abort(404)
-    undeploy(sid)
-    shutil.rmtree(svc_dir(svc), ignore_errors=True)
+    if svc["status"] == "removing":
+        flash("服务正在删除", "error")
+        return redirect("/")
+    jid, new = submit_job(sid, u["id"], kind)
+    if kind == "remove":
+        set_status(sid, "removing")
+    if new:
+        flash("已开始{}，进度见页面".format(JOB_KIND_CN[kind]), "info")
+    else:
+        flash("相同的任务已在进行中", "info")
+    return redirect("/" if kind == "remove" else request.referrer or "/")
+
+@main_app.route("/svc/<int:sid>/job")
+@login_required
+def job_status(sid):
+    u = me()
     with db() as c:
-        c.execute("DELETE FROM services WHERE id=?", [sid])
-    flash("服务已删除", "info")
-    return redirect("/")
+        job = c.execute("SELECT * FROM jobs WHERE svc_id=? AND user_id=? ORDER BY id DESC LIMIT 1",
+                        [sid, u["id"]]).fetchone()
+    if not job:
+        abort(404)
+    return jsonify(id=job["id"], kind=job["kind"], state=job["state"], attempts=job["attempts"],
+                   progress=job["progress"], message=job["message"], updated_at=job["updated_at"],
+                   active=job["state"] in ("queued", "running"), label=job_label(job))
+
+# ═══ 线程池 WSGI 服务器 ════════════════════════════════════════
+# run_simple(threaded=True) 每个连接开一个线程，没有上限也没有背压。
+# pool 后端：固定数量的工作线程 + 有界连接队列，HTTP/1.1 keep-alive，
+# 超过连接上限或队列满时直接回 503；收到 SIGTERM 先停止 accept，
+# 再等在途请求处理完（最多 DRAIN_TIMEOUT 秒）后退出。纯 Python 实现。
+SERVER          = os.environ.get("PAAS_SERVER", "pool")   # pool | simple
+SERVER_THREADS  = 16       # 工作线程数
+SERVER_QUEUE    = 64       # 等待工作线程的连接队列深度
+MAX_CONN        = 256      # 同时打开的连接上限（处理中 + 排队）
+KEEPALIVE       = 5        # keep-alive 空闲超时（秒）
+KEEPALIVE_DRAIN = 1 << 20  # 应用没读完的请求体最多替它读掉这么多，再多就关连接
+DRAIN_TIMEOUT   = 20       # 优雅退出时最多等待的秒数
+
+REJECT_503 = (b"HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\n"
+              b"Retry-After: 1\r\nConnection: close\r\n\r\n")
+
+class PoolHandler(WSGIRequestHandler):
+    """Werkzeug 的 run_wsgi 每个响应都带 Connection: close，这里自己发响应：
+    请求体按 Content-Length（或 chunked）限长，响应用 Content-Length 或 chunked 分帧，
+    应用没读完的请求体替它读掉，连接才能接着处理下一个请求"""
+    protocol_version = "HTTP/1.1"
+    timeout          = KEEPALIVE
+
+    def setup(self):
+        super().setup()
+        self.served = 0
+        if self.connection.family != socket.AF_UNIX:
+            # 响应头和响应体分两次写，不关 Nagle 的话小响应要等对端的延迟 ACK（约 40ms）
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def handle_one_request(self):
+        if self.served and not self._idle_wait():
+            self.close_connection = True
+            return
+        self.served += 1
+        super().handle_one_request()
+
+    def _want_close(self, body):
+        # 发响应头之前决定：有连接在排队或正在退出时不再保持，把线程让出来；
+        # 应用没读完的请求体超过 KEEPALIVE_DRAIN 也不保持；chunked 请求体（浏览器不会发）
+        # 事先不知道还剩多少，一律不保持
+        if self.close_connection or self.server.draining or not self.server.jobs.empty():
+            return True
+        if not isinstance(body, LimitedStream):
+            return True
+        return body.limit - body.tell() > KEEPALIVE_DRAIN
+
+    def _idle_wait(self):
+        """两个请求之间的空闲期：等到下一个请求返回 True；超时、有连接排队或正在退出返回 False"""
+        self.connection.setblocking(False)
+        try:
+            pipelined = self.rfile.peek(1)       # 客户端流水线发来的请求可能已经在缓冲区里
+        except BlockingIOError:
+            pipelined = b""
+        finally:
+            self.connection.settimeout(self.timeout)
+        if pipelined:
+            return True
+        deadline = time.monotonic() + KEEPALIVE
+        while not select.select([self.connection], [], [], 0.2)[0]:
+            if self.server.draining or not self.server.jobs.empty() or time.monotonic() > deadline:
+                return False
+        return True
+
+    @staticmethod
+    def _drain(stream, limit=KEEPALIVE_DRAIN):
+        try:
+            while limit > 0:
+                n = len(stream.read(min(limit, 65536)))
+                if not n:
+                    return True
+                limit -= n
+        except (OSError, ClientDisconnected):
+            pass
+        return False
+
+    def run_wsgi(self):
+        if self.headers.get("Expect", "").lower().strip(" \t") == "100-continue":
+            self.wfile.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+        environ = self.environ = self.make_environ()
+        if self.request_version < "HTTP/1.1":
+            self.close_connection = True
+        if not environ.get("wsgi.input_terminated"):
+            length = environ.get("CONTENT_LENGTH") or "0"
+            if not length.isdigit():
+                self.close_connection = True
+                self.send_error(400, "Bad Content-Length")
+                return
+            environ["wsgi.input"] = LimitedStream(self.rfile, int(length))
+
+        status_set = headers_set = None
+        sent = chunked = bodyless = False
+        left = None             # 声明了 Content-Length 时还剩多少字节没发
+
+        def write(data):
+            nonlocal sent, chunked, bodyless, left
+            if not sent:
+                sent = True
+                code, _, msg = status_set.partition(" ")
+                code = int(code)
+                self.send_response(code, msg)
+                keys = {}
+                for k, v in headers_set:
+                    self.send_header(k, v)
+                    keys[k.lower()] = v
+                bodyless = environ["REQUEST_METHOD"] == "HEAD" or code < 200 or code in (204, 304)
+                if bodyless:
+                    pass
+                elif "content-length" in keys:
+                    left = int(keys["content-length"])
+                elif self.request_version >= "HTTP/1.1":
+                    chunked = True
+                    self.send_header("Transfer-Encoding", "chunked")
+                else:
+                    self.close_connection = True      # HTTP/1.0 没有长度：靠关连接结束响应
+                if self._want_close(environ["wsgi.input"]):
+                    self.close_connection = True
+                if "connection" not in keys:
+                    self.send_header("Connection", "close" if self.close_connection else "keep-alive")
+                self.end_headers()
+            if not data or bodyless:
+                return
+            if left is not None:
+                data  = data[:left]
+                left -= len(data)
+            if chunked:
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            else:
+                self.wfile.write(data)
+
+        def start_response(status, headers, exc_info=None):
+            nonlocal status_set, headers_set
+            if exc_info:
+                try:
+                    if sent:
+                        raise exc_info[1].with_traceback(exc_info[2])
+                finally:
+                    exc_info = None
+            status_set, headers_set = status, headers
+            return write
+
+        def execute(app):
+            it = app(environ, start_response)
+            try:
+                for data in it:
+                    write(data)
+                if not sent:
+                    write(b"")
+                if chunked:
+                    self.wfile.write(b"0\r\n\r\n")
+            finally:
+                if hasattr(it, "close"):
+                    it.close()
+            if left:            # 应用发的比 Content-Length 少，这条连接的分帧已经乱了
+                self.close_connection = True
+            # 关连接前也要读掉：客户端还在发请求体时关 socket，它收不到已经发出的响应
+            if not self._drain(environ["wsgi.input"]):
+                self.close_connection = True
+
+        try:
+            execute(self.server.app)
+        except (ConnectionError, socket.timeout) as e:
+            self.close_connection = True
+            self.connection_dropped(e, environ)
+        except Exception:
+            self.close_connection = True
+            if not sent:
+                status_set = headers_set = None
+                try:
+                    execute(InternalServerError())
+                except Exception:
+                    pass
+            self.server.log("error", "Error on request:\n%s", traceback.format_exc())
+
+class PoolServer(BaseWSGIServer):
+    multithread = True
+
+    def __init__(self, host, port, app, threads=SERVER_THREADS,
+                 queue_size=SERVER_QUEUE, max_conn=MAX_CONN):
+        super().__init__(host, port, app, handler=PoolHandler)
+        self.jobs       = queue.Queue(queue_size)
+        self.max_conn   = max_conn
+        self.open_conns = 0
+        self.rejected   = 0
+        self.draining   = False
+        self.lock       = threading.Lock()
+        for _ in range(threads):
+            threading.Thread(target=self._work, daemon=True).start()
+
+    def process_request(self, request, client_address):
+        with self.lock:
+            ok = self.open_conns < self.max_conn
+            if ok:
+                self.open_conns += 1
+        if ok:
+            try:
+                self.jobs.put_nowait((request, client_address))
+                return
+            except queue.Full:
+                with self.lock:
+                    self.open_conns -= 1
+        self.rejected += 1
+        try:
+            request.sendall(REJECT_503)
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+    def _work(self):
+        while True:
+            request, client_address = self.jobs.get()
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+                with self.lock:
+                    self.open_conns -= 1
+
+    def drain(self, timeout=DRAIN_TIMEOUT):
+        self.draining = True
+        deadline = time.time() + timeout
+        while self.open_conns and time.time() < deadline:
+            time.sleep(0.05)
+        return self.open_conns
+
+def serve(app, host="0.0.0.0", port=PORT, backend=SERVER):
+    if backend == "simple":
+        run_simple(host, port, app, use_reloader=False, threaded=True)
+        return
+    server = PoolServer(host, port, app)
+
+    def on_term(signum, frame):
+        # serve_forever 跑在主线程里，shutdown() 必须从别的线程调用
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, on_term)
+    try:
+        server.serve_forever()
+    finally:
+        left = server.drain()
+        print("  已退出{}".format("，{} 个连接未处理完".format(left) if left else ""))
 
 # ═══ 启动 ══════════════════════════════════════════════════════
 if __name__ == "__main__":
+    if sys.argv[1:2] == ["--worker"]:
+        worker_main(*sys.argv[2:])
+        sys.exit(0)
+
     Path(SVC_DIR).mkdir(exist_ok=True)
     init_db()
+    start_accounting()
 
-    with db() as c:
-        rows = c.execute("SELECT * FROM services WHERE status='running'").fetchall()
-    for svc in rows:
-        ok, msg = deploy(svc["id"])
-        print("  自动恢复 [{}]: {}".format(svc["name"], "OK" if ok else "FAIL — " + msg))
+    restore_services()
+    start_jobs()
+    start_access_log()
 
     print("""
   PhonePaaS v3 就绪
   本地: http://0.0.0.0:{port}
   公网: {pub}
   用户服务路径: {pub}{pfx}/<名称>/
-""".format(port=PORT, pub=PUBLIC_URL, pfx=PREFIX))
+  服务器后端: {srv}（环境变量 PAAS_SERVER=pool|simple）
+""".format(port=PORT, pub=PUBLIC_URL, pfx=PREFIX, srv=SERVER))
 
-    run_simple("0.0.0.0", PORT, dispatcher, use_reloader=False, threaded=True)
+    serve(site)
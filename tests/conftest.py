@@ -0,0 +1,35 @@
+import os, sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pythonapi as P
+
+
+@pytest.fixture
+def paas(tmp_path, monkeypatch):
+    """空库 + 空服务目录，跑在临时目录里；数据库连接是按线程缓存的，前后都关掉"""
+    monkeypatch.chdir(tmp_path)
+    P.close_db()
+    P.init_db()
+    yield P
+    P.close_db()
+
+
+def load_speedtest(tmp_path, monkeypatch):
+    """网络测速.py 文件名不是合法模块名，按路径加载；数据库和 sendfile 数据文件放进临时目录"""
+    import importlib.util
+    monkeypatch.chdir(tmp_path)
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "网络测速.py")
+    spec = importlib.util.spec_from_file_location("speedtest", path)
+    mod  = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    monkeypatch.setattr(mod, "PAYLOAD_FILE", str(tmp_path / os.path.basename(mod.PAYLOAD_FILE)))
+    mod.init_data()
+    return mod
+
+
+@pytest.fixture
+def speedtest(tmp_path, monkeypatch):
+    return load_speedtest(tmp_path, monkeypatch)
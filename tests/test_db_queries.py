@@ -0,0 +1,84 @@
+"""每个登录后的页面最多查一次当前用户（PAAS_FAST_AUTH=1 时一次都不查）"""
+from pathlib import Path
+
+import pytest
+
+import pythonapi as P
+
+ROUTES = [
+    "/",
+    "/new",
+    "/svc/1",
+    "/svc/1/edit?path=app.py",
+    "/svc/1/file?path=app.py",
+    "/svc/1/export",
+    "/admin/metrics",
+    "/admin/usage",
+    "/admin/logs",
+]
+
+
+@pytest.fixture
+def client(paas, monkeypatch):
+    statements = []
+    count = P._count_query
+
+    def trace(sql):
+        statements.append(sql)
+        count(sql)
+
+    # db() 在建连接时挂 trace 回调，要在第一次 db() 之前换掉
+    P.close_db()
+    monkeypatch.setattr(P, "_count_query", trace)
+    monkeypatch.setattr(P, "DB_TRACE", True)
+    monkeypatch.setattr(P, "ADMINS", {"alice"})
+    with P.db() as c:
+        c.execute("INSERT INTO users(username,pw_hash) VALUES('alice','x')")
+        c.execute("INSERT INTO services(user_id,name,title,entry) VALUES(1,'demo','demo','app.py')")
+    svc_dir = Path(P.SVC_DIR, "1", "demo")
+    svc_dir.mkdir(parents=True)
+    (svc_dir / "app.py").write_text("app = None\n")
+
+    c = P.main_app.test_client()
+    with c.session_transaction() as s:
+        s["uid"], s["uname"] = 1, "alice"
+    c.statements = statements
+    return c
+
+
+def users_queries(statements):
+    # me() 按 id 查 users；/admin/usage 之类 JOIN users 取用户名的列表查询不算
+    return [s for s in statements if "FROM users WHERE" in " ".join(s.split())]
+
+
+@pytest.mark.parametrize("path", ROUTES)
+def test_one_user_query_per_request(client, path):
+    del client.statements[:]
+    resp = client.get(path)
+    assert resp.status_code == 200, resp.status_code
+    assert len(users_queries(client.statements)) <= 1, client.statements
+    conns, queries = (int(kv.split("=")[1]) for kv in resp.headers["X-DB-Stats"].split())
+    assert conns <= 1
+    assert queries == len([s for s in client.statements
+                           if not s.startswith(("BEGIN", "COMMIT", "ROLLBACK", "PRAGMA"))])
+
+
+@pytest.mark.parametrize("path", ROUTES)
+def test_fast_auth_skips_user_query(client, path, monkeypatch):
+    monkeypatch.setattr(P, "FAST_AUTH", True)
+    del client.statements[:]
+    assert client.get(path).status_code == 200
+    assert users_queries(client.statements) == []
+
+
+def test_db_totals_in_prometheus(client):
+    def totals():
+        text = client.get("/metrics").get_data(as_text=True)
+        return {k: int(v) for k, v in (line.split() for line in text.splitlines()
+                                       if line.startswith("paas_db_"))}
+
+    before = totals()
+    client.get("/")
+    after = totals()
+    assert set(after) == {"paas_db_connections_total", "paas_db_queries_total"}
+    assert after["paas_db_queries_total"] > before["paas_db_queries_total"]
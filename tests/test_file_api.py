@@ -0,0 +1,65 @@
+"""编辑器文件接口：ETag 跟着内容走（mtime 不变也能发现修改），非 UTF-8 文件不能按行修改"""
+import os
+from pathlib import Path
+
+import pytest
+
+import pythonapi as P
+
+URL = "/svc/1/file?path=app.py"
+
+
+@pytest.fixture
+def client(paas):
+    with P.db() as c:
+        c.execute("INSERT INTO users(username,pw_hash) VALUES('alice','x')")
+        c.execute("INSERT INTO services(user_id,name,title,entry) VALUES(1,'demo','demo','app.py')")
+    d = Path(P.SVC_DIR, "1", "demo")
+    d.mkdir(parents=True)
+    (d / "app.py").write_text("a = 1\nb = 2\n")
+    c = P.main_app.test_client()
+    with c.session_transaction() as s:
+        s["uid"], s["uname"] = 1, "alice"
+    c.file = d / "app.py"
+    return c
+
+
+def test_etag_tracks_content_not_mtime(client):
+    tag = client.get(URL).headers["ETag"]
+    st  = client.file.stat()
+    client.file.write_text("a = 9\nb = 2\n")                  # 同样大小
+    os.utime(client.file, ns=(st.st_atime_ns, st.st_mtime_ns))  # 秒级 mtime 的存储上就是这样
+    assert client.get(URL).headers["ETag"] != tag
+    r = client.patch(URL, json={"start": 0, "end": 1, "lines": ["a = 3"]}, headers={"If-Match": tag})
+    assert r.status_code == 412
+    assert client.file.read_text() == "a = 9\nb = 2\n"
+
+
+def test_etag_from_write_matches_get(client):
+    tag = client.get(URL).headers["ETag"].strip('"')
+    r = client.patch(URL, json={"start": 1, "end": 2, "lines": ["b = 5"]}, headers={"If-Match": tag})
+    assert r.status_code == 200
+    new = r.get_json()["etag"]
+    assert client.get(URL).headers["ETag"].strip('"') == new
+    r = client.put(URL, data=b"c = 1\n", headers={"If-Match": new})
+    assert r.status_code == 200
+    assert client.get(URL).headers["ETag"].strip('"') == r.get_json()["etag"]
+
+
+def test_patch_rejects_non_utf8(client):
+    raw = "名字 = 1\n".encode("gbk") + b"x = 2\n"
+    client.file.write_bytes(raw)
+    tag = client.get(URL).headers["ETag"]
+    r = client.patch(URL, json={"start": 1, "end": 2, "lines": ["x = 3"]}, headers={"If-Match": tag})
+    assert r.status_code == 415
+    assert client.file.read_bytes() == raw
+    assert client.put(URL, data=b"x = 3\n", headers={"If-Match": tag}).status_code == 200
+
+
+def test_large_file_digest_cached(client, monkeypatch):
+    monkeypatch.setattr(P, "EDITOR_MAX", 16)
+    client.file.write_bytes(b"x" * 100)
+    tag = client.get(URL).headers["ETag"]
+    assert client.get(URL).headers["ETag"] == tag
+    client.file.write_bytes(b"y" * 100)
+    assert client.get(URL).headers["ETag"] != tag
@@ -0,0 +1,71 @@
+"""压缩后的响应用自己的 ETag（-gzip 后缀），条件请求照样能 304、能乐观并发保存"""
+from pathlib import Path
+
+from werkzeug.test import Client
+
+import pythonapi as P
+
+GZ = {"Accept-Encoding": "gzip"}
+
+
+def test_css_etag_differs_per_encoding(paas):
+    c = Client(P.site)
+    plain = c.get(P.CSS_URL)
+    gz    = c.get(P.CSS_URL, headers=GZ)
+    assert gz.headers["Content-Encoding"] == "gzip"
+    assert plain.headers["ETag"] == '"{}"'.format(P.CSS_HASH)
+    assert gz.headers["ETag"] == '"{}-gzip"'.format(P.CSS_HASH)
+
+    r = c.get(P.CSS_URL, headers=dict(GZ, **{"If-None-Match": gz.headers["ETag"]}))
+    assert r.status_code == 304
+    assert r.headers["ETag"] == gz.headers["ETag"]
+    r = c.get(P.CSS_URL, headers={"If-None-Match": plain.headers["ETag"]})
+    assert r.status_code == 304
+    assert r.headers["ETag"] == plain.headers["ETag"]
+
+
+def test_response_cache_etag_gets_suffix(paas):
+    body = b"x" * 4000
+
+    def app(environ, start_response):
+        start_response("200 OK", [("Content-Type", "text/plain"), ("Cache-Control", "max-age=60")])
+        return [body]
+
+    P.dispatcher.mount("gzetag", app)
+    P.dispatcher.cache("gzetag", P.ResponseCache("gzetag", 1 << 20))
+    try:
+        c = Client(P.site)
+        miss = c.get("/s/gzetag/", headers=GZ)          # 未命中：发完才存进缓存、配上 ETag
+        miss.get_data()
+        miss.close()
+        hit = c.get("/s/gzetag/", headers=GZ)
+        assert hit.headers["X-Cache"] == "HIT"
+        tag = hit.headers["ETag"]
+        assert tag.endswith('-gzip"')
+        assert c.get("/s/gzetag/").headers["ETag"] == tag.replace("-gzip", "")
+        r = c.get("/s/gzetag/", headers=dict(GZ, **{"If-None-Match": tag}))
+        assert r.status_code == 304 and r.headers["ETag"] == tag
+    finally:
+        P.dispatcher.unmount("gzetag")
+
+
+def test_editor_save_with_gzip_etag(paas):
+    with P.db() as db:
+        db.execute("INSERT INTO users(username,pw_hash) VALUES('alice','x')")
+        db.execute("INSERT INTO services(user_id,name,title,entry) VALUES(1,'demo','demo','app.py')")
+    d = Path(P.SVC_DIR, "1", "demo")
+    d.mkdir(parents=True)
+    (d / "app.py").write_text("x = 1\n" * 200)
+
+    login = P.main_app.test_client()
+    with login.session_transaction() as s:
+        s["uid"], s["uname"] = 1, "alice"
+    c = Client(P.site)          # 走 gzip 中间件，和浏览器一样
+    c.set_cookie("session", login.get_cookie("session").value)
+    got = c.get("/svc/1/file?path=app.py", headers=GZ)
+    assert got.headers["Content-Encoding"] == "gzip"
+    tag = got.headers["ETag"]
+    assert tag.endswith('-gzip"')
+    r = c.put("/svc/1/file?path=app.py", data=b"y = 2\n", headers={"If-Match": tag})
+    assert r.status_code == 200, r.get_json()
+    assert (d / "app.py").read_text() == "y = 2\n"
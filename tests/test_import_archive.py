@@ -0,0 +1,106 @@
+"""压缩包导入：路径穿越、符号链接成员、服务目录里已有的符号链接、超配额时已有文件不被破坏"""
+import io, os, tarfile, zipfile
+from pathlib import Path
+
+import pytest
+
+import pythonapi as P
+
+
+@pytest.fixture
+def svc(paas, tmp_path):
+    with P.db() as c:
+        c.execute("INSERT INTO users(username,pw_hash) VALUES('alice','x')")
+        c.execute("INSERT INTO services(user_id,name,title,entry) VALUES(1,'demo','demo','app.py')")
+    base = Path(P.SVC_DIR, "1", "demo").resolve()
+    base.mkdir(parents=True)
+    (base / "a.py").write_text("keep = 1\n")
+    P._usage.pop(1, None)                   # 配额按服务 id 缓存，别吃到上一个测试的数
+    outside = tmp_path / "outside"
+    outside.mkdir()
+    client = P.main_app.test_client()
+    with client.session_transaction() as s:
+        s["uid"], s["uname"] = 1, "alice"
+    client.base, client.outside = base, outside
+    return client
+
+
+def make_zip(members, links=()):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        for name, data in members:
+            zf.writestr(name, data)
+        for name, target in links:
+            info = zipfile.ZipInfo(name)
+            info.external_attr = (0o120777 << 16)
+            zf.writestr(info, target)
+    return buf.getvalue()
+
+
+def make_tar(members, links=()):
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w:gz") as tf:
+        for name, data in members:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tf.addfile(info, io.BytesIO(data))
+        for name, target in links:
+            info = tarfile.TarInfo(name)
+            info.type, info.linkname = tarfile.SYMTYPE, target
+            tf.addfile(info)
+    return buf.getvalue()
+
+
+ARCHIVES = [("x.zip", make_zip), ("x.tar.gz", make_tar)]
+
+
+def post(client, name, data):
+    return client.post("/svc/1/import?name=" + name, data=data)
+
+
+def leftovers(base):
+    return [p for p in base.rglob(".import-*")]
+
+
+@pytest.mark.parametrize("name,make", ARCHIVES)
+def test_traversal_is_skipped(svc, name, make):
+    evil = "../../../../" + os.path.relpath(svc.outside / "evil.py", "/")
+    r = post(svc, name, make([("../escape.py", b"x"), (evil, b"x"), ("ok/b.py", b"b = 2\n")]))
+    assert r.status_code == 200, r.get_json()
+    assert r.get_json()["files"] == 1 and r.get_json()["skipped"] == 2
+    assert (svc.base / "ok" / "b.py").read_bytes() == b"b = 2\n"
+    assert not (svc.base.parent / "escape.py").exists()
+    assert list(svc.outside.iterdir()) == []
+
+
+@pytest.mark.parametrize("name,make", ARCHIVES)
+def test_symlink_members_are_skipped(svc, name, make):
+    r = post(svc, name, make([("b.py", b"b = 2\n")], links=[("link", str(svc.outside)), ("a.py", "/etc/passwd")]))
+    assert r.status_code == 200, r.get_json()
+    assert r.get_json()["skipped"] == 2
+    assert not os.path.lexists(svc.base / "link")
+    assert not (svc.base / "a.py").is_symlink()
+    assert (svc.base / "a.py").read_text() == "keep = 1\n"
+
+
+@pytest.mark.parametrize("name,make", ARCHIVES)
+def test_existing_symlinks_are_not_followed_out(svc, name, make):
+    (svc.base / "out").symlink_to(svc.outside)
+    (svc.base / "passwd").symlink_to(svc.outside / "victim")
+    (svc.outside / "victim").write_text("secret")
+    r = post(svc, name, make([("out/x.py", b"x"), ("passwd", b"pwned"), ("b.py", b"b = 2\n")]))
+    assert r.status_code == 200, r.get_json()
+    assert r.get_json()["skipped"] == 2
+    assert sorted(p.name for p in svc.outside.iterdir()) == ["victim"]
+    assert (svc.outside / "victim").read_text() == "secret"
+
+
+@pytest.mark.parametrize("name,make", ARCHIVES)
+def test_quota_overflow_leaves_files_alone(svc, name, make, monkeypatch):
+    monkeypatch.setattr(P, "SVC_QUOTA", P.svc_usage({"id": 1, "user_id": 1, "name": "demo"}) + 1000)
+    # 第一个成员装得下、会覆盖已有的 a.py，第二个超配额：整个导入作废
+    r = post(svc, name, make([("a.py", b"new = 1\n"), ("big.bin", b"\0" * 5000)]))
+    assert r.status_code == 413
+    assert (svc.base / "a.py").read_text() == "keep = 1\n"
+    assert not (svc.base / "big.bin").exists()
+    assert leftovers(svc.base) == []
@@ -0,0 +1,50 @@
+"""一个服务挂多个挂载点（前缀、嵌套前缀、主机名）时，命中数按挂载点分开计，多线程下不丢"""
+import threading
+
+from werkzeug.test import Client
+
+import pythonapi as P
+
+
+def ok_app(environ, start_response):
+    start_response("200 OK", [("Content-Type", "text/plain")])
+    return [b"ok"]
+
+
+def test_hits_per_mount(paas, monkeypatch):
+    monkeypatch.setattr(P, "ADMINS", {"alice"})
+    with P.db() as c:
+        c.execute("INSERT INTO users(username,pw_hash) VALUES('alice','x')")
+    P.dispatcher.mount("hits", ok_app)
+    P.dispatcher.mount("hits", ok_app, prefix="/s/hits/v2")
+    P.dispatcher.mount("hits", ok_app, host="hits.example.com")
+    try:
+        before = P.dispatcher.hit_counts()["hits"]
+        cl = Client(P.dispatcher)
+
+        def hammer():
+            for _ in range(200):
+                cl.get("/s/hits/x").close()
+                cl.get("/s/hits/v2/x").close()
+            for _ in range(100):
+                cl.get("/", headers={"Host": "hits.example.com"}).close()
+
+        threads = [threading.Thread(target=hammer) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        after = P.dispatcher.hit_counts()["hits"]
+        got   = {k: after[k] - before.get(k, 0) for k in after}
+        assert got == {"/s/hits": 1600, "/s/hits/v2": 1600, "hits.example.com": 800}
+
+        app = P.main_app.test_client()
+        with app.session_transaction() as s:
+            s["uid"], s["uname"] = 1, "alice"
+        assert app.get("/admin/metrics").get_json()["hits"]["mounts"] == after
+        text = app.get("/metrics").get_data(as_text=True)
+        assert 'paas_mount_requests_total{{service="hits",mount="hits.example.com"}} {}'.format(
+            after["hits.example.com"]) in text
+    finally:
+        P.dispatcher.unmount("hits")
@@ -0,0 +1,89 @@
+"""同进程服务反复重新部署：sys.modules / sys.path / RSS 不增长，切换期间请求不失败，改过的子模块会重新加载
+
+PAAS_SOAK_N 控制部署次数（默认 1000）。
+"""
+import os, resource, sys, threading
+from pathlib import Path
+
+from werkzeug.test import Client
+
+import pythonapi as P
+
+SOAK_N    = int(os.environ.get("PAAS_SOAK_N", "1000"))
+RSS_SLACK = 8 * 1024 * 1024     # 允许的 RSS 增长（分配器碎片、缓存预热）
+
+APP = """\
+from flask import Flask
+import helper
+
+app = Flask(__name__)
+
+@app.route("/")
+def index():
+    return helper.VALUE
+"""
+
+
+def rss():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def call(name):
+    resp = Client(P.dispatcher).get("/s/{}/".format(name))
+    return resp.status, resp.get_data()
+
+
+def test_redeploy_soak(paas):
+    with P.db() as c:
+        c.execute("INSERT INTO users(username,pw_hash) VALUES('alice','x')")
+        sid = c.execute("INSERT INTO services(user_id,name,title,entry) "
+                        "VALUES(1,'soak','soak','app.py')").lastrowid
+    d = Path(P.SVC_DIR, "1", "soak")
+    d.mkdir(parents=True)
+    (d / "app.py").write_text(APP)
+    (d / "helper.py").write_text('VALUE = "v1"\n')
+
+    assert P.deploy(sid)[0]
+    for _ in range(20):                      # 预热：首轮的导入缓存、语句缓存、请求路径上的惰性导入不算增长
+        assert P.deploy(sid)[0]
+        assert call("soak") == ("200 OK", b"v1")
+    modules, path, mem = len(sys.modules), len(sys.path), rss()
+    before = set(sys.modules)
+
+    stop, failures, served = threading.Event(), [], [0]
+
+    def hammer():
+        while not stop.is_set():
+            status, body = call("soak")
+            if not status.startswith("200") or body not in (b"v1", b"v2"):
+                failures.append((status, body))
+            served[0] += 1
+
+    t = threading.Thread(target=hammer)
+    t.start()
+    try:
+        for i in range(SOAK_N):
+            if i == SOAK_N // 2:
+                (d / "helper.py").write_text('VALUE = "v2"\n')
+            ok, msg = P.deploy(sid)
+            assert ok, msg
+    finally:
+        stop.set()
+        t.join()
+
+    try:
+        assert failures == []
+        assert served[0] > 0
+        assert call("soak") == ("200 OK", b"v2")    # 中途改过的 helper 被重新导入
+        assert len(sys.modules) == modules, sorted(set(sys.modules) - before)
+        assert len(sys.path) == path
+        assert rss() - mem < RSS_SLACK, "RSS grew {:.1f} MB".format((rss() - mem) / 2**20)
+    finally:
+        P.undeploy(sid)
@@ -0,0 +1,35 @@
+"""每 IP 汇总：两个工作进程（各自一份内存字典）写同一个库，次数和最佳成绩都以库为准"""
+import random
+
+from conftest import load_speedtest
+
+
+def test_two_workers_share_summary(tmp_path, monkeypatch):
+    a = load_speedtest(tmp_path, monkeypatch)
+    b = load_speedtest(tmp_path, monkeypatch)
+    rnd = random.Random(1)
+    ips = ["10.0.0.{}".format(i) for i in range(20)]
+    for _ in range(400):
+        rnd.choice((a, b)).update_records(rnd.choice(ips), rnd.uniform(1, 900),
+                                          rnd.uniform(1, 300), rnd.uniform(1, 100))
+
+    conn = a.db()
+    for ip in ips:
+        n, d, u, l = conn.execute("SELECT COUNT(*), MAX(download), MAX(upload), MIN(latency) "
+                                  "FROM records WHERE ip=?", (ip,)).fetchone()
+        row = conn.execute("SELECT * FROM clients WHERE ip=?", (ip,)).fetchone()
+        assert (row["count"], row["dl_download"], row["up_upload"], row["lat_latency"]) == (n, d, u, l)
+        # 最佳成绩是同一次测试的完整记录
+        assert conn.execute("SELECT COUNT(*) FROM records WHERE ip=? AND download=? AND upload=? AND latency=?",
+                            (ip, row["dl_download"], row["dl_upload"], row["dl_latency"])).fetchone()[0]
+
+    # 刚写过的进程，内存里的汇总就是库里的行
+    ip = ips[0]
+    b.update_records(ip, 1, 1, 99)
+    assert b.get_client_summary(ip)["count"] == n_of(conn, ip)
+    a.load_clients()
+    assert a.CLIENTS[ip] == b.CLIENTS[ip]
+
+
+def n_of(conn, ip):
+    return conn.execute("SELECT COUNT(*) FROM records WHERE ip=?", (ip,)).fetchone()[0]
@@ -0,0 +1,46 @@
+"""/download：字节数精确，Range 正确，生成器和 sendfile 文件两条路径内容一致，跨进程也一致"""
+import random
+
+import pytest
+from werkzeug.wsgi import FileWrapper
+
+
+def test_block_is_deterministic(speedtest):
+    assert speedtest.PAYLOAD_BLOCK == random.Random(speedtest.PAYLOAD_SEED).randbytes(speedtest.BLOCK_SIZE)
+
+
+@pytest.mark.parametrize("size", [1, 7, 100])
+@pytest.mark.parametrize("rng", [None, "bytes=0-9", "bytes=123-", "bytes=-77", "bytes=1048000-1048700"])
+def test_paths_agree(speedtest, size, rng):
+    client = speedtest.app.test_client()
+    total  = size * speedtest.MB
+    full   = client.get(f"/download/{size}").get_data()
+    assert len(full) == total
+
+    headers = {"Range": rng} if rng else {}
+    for environ in ({}, {"wsgi.file_wrapper": FileWrapper}):
+        resp = client.get(f"/download/{size}", headers=headers, environ_base=environ)
+        body = b"".join(resp.response)     # 不按 Content-Length 截断：服务器完全信任 wrapper 的情况
+        resp.close()
+        if rng is None:
+            assert resp.status_code == 200 and body == full
+            continue
+        assert resp.status_code == 206
+        first, last = map(int, resp.headers["Content-Range"].split()[1].split("/")[0].split("-"))
+        assert body == full[first:last + 1]
+        assert len(body) == int(resp.headers["Content-Length"])
+
+
+def test_stale_payload_file_is_not_reused(speedtest, tmp_path):
+    # 别的版本写下的同大小文件：文件名带块哈希，不会被当成当前数据
+    stale = tmp_path / f"speedtest_payload_{speedtest.MAX_DOWNLOAD_MB}mb_0000000000000000.bin"
+    stale.write_bytes(b"\0" * 16)
+    assert speedtest.payload_file() != str(stale)
+    with open(speedtest.payload_file(), "rb") as f:
+        assert f.read(speedtest.BLOCK_SIZE) == speedtest.PAYLOAD_BLOCK
+
+
+def test_unsatisfiable_range(speedtest):
+    resp = speedtest.app.test_client().get("/download/1", headers={"Range": "bytes=99999999-"})
+    assert resp.status_code == 416
+    assert resp.headers["Content-Range"] == f"bytes */{speedtest.MB}"
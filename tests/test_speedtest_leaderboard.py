@@ -0,0 +1,66 @@
+"""排行榜和暴力排序对拍：增量维护、启动重建、多线程保存之后都要和"窗口内全部记录排序取前 N"一致"""
+import random, threading, time
+
+import pytest
+
+from conftest import load_speedtest
+
+WINDOW = 1000.0
+
+
+def brute(records, field, higher_better, now, window, size):
+    live = [(ts, r) for ts, r in records if ts > now - window]
+    live.sort(key=lambda x: ((-1 if higher_better else 1) * x[1][field], -x[0]))
+    return [r[field] for _, r in live[:size]]
+
+
+@pytest.mark.parametrize("field,higher_better", [("download", True), ("latency", False)])
+def test_incremental_matches_brute_force(speedtest, field, higher_better):
+    rnd   = random.Random(7)
+    board = speedtest.Leaderboard(field, WINDOW, higher_better)
+    seen, t = [], 0.0
+    for i in range(20000):
+        t += rnd.expovariate(1.0)
+        # 取一位小数，故意制造大量并列
+        r = {"ip": str(i), "download": round(rnd.uniform(0, 1000), 1), "latency": round(rnd.uniform(0, 100), 1)}
+        board.add(r, t)
+        seen.append((t, r))
+        if i % 499 == 0:
+            now = t + rnd.uniform(0, 50)
+            assert [g[field] for g in board.top(now)] == brute(seen, field, higher_better, now, WINDOW, board.size)
+    assert len(board.items) < 200        # 候选数大约 N·ln(窗口内记录数/N)，远小于窗口内的记录数
+
+
+def test_rebuild_matches_sql(speedtest):
+    rnd = random.Random(3)
+    now = time.time()
+    rows = [("ip{}".format(i % 50), round(rnd.uniform(1, 1000), 2), round(rnd.uniform(1, 500), 2),
+             round(rnd.uniform(1, 200), 2), now - rnd.uniform(0, 8 * 86400)) for i in range(20000)]
+    with speedtest.db() as conn:
+        conn.executemany("INSERT INTO records(ip, download, upload, latency, ts) VALUES(?,?,?,?,?)", rows)
+    speedtest.rebuild_leaderboards()
+    check_against_sql(speedtest)
+
+
+def test_concurrent_saves_match_sql(speedtest):
+    def saver(seed):
+        rnd = random.Random(seed)
+        for _ in range(300):
+            speedtest.update_records("10.0.{}.{}".format(seed, rnd.randrange(20)), rnd.uniform(1, 900),
+                                     rnd.uniform(1, 300), rnd.uniform(1, 100))
+
+    threads = [threading.Thread(target=saver, args=(k,)) for k in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    check_against_sql(speedtest)
+
+
+def check_against_sql(S):
+    for (field, window), board in S.BOARDS.items():
+        order = "ASC" if field == "latency" else "DESC"
+        exp = [r[0] for r in S.db().execute(
+            "SELECT {0} FROM records WHERE ts>? ORDER BY {0} {1}, ts DESC LIMIT ?".format(field, order),
+            (time.time() - S.WINDOWS[window], board.size))]
+        assert [r[field] for r in board.top()] == exp, (field, window)
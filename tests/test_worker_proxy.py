@@ -0,0 +1,52 @@
+"""WorkerProxy 转发请求体：Content-Length 和 chunked 上传都要原样到达 worker"""
+import http.client, os, threading
+
+import pytest
+from werkzeug.serving import make_server
+from werkzeug.wsgi import get_input_stream
+
+import pythonapi as P
+
+
+def echo(environ, start_response):
+    body = get_input_stream(environ).read()     # 按 Content-Length 限长，chunked 时读到结束
+    start_response("200 OK", [("Content-Type", "application/octet-stream"), ("Content-Length", str(len(body)))])
+    return [body]
+
+
+@pytest.fixture
+def port(paas, tmp_path):
+    sock = str(tmp_path / "w.sock")
+    worker = make_server("unix://" + sock, 0, echo, threaded=True)
+    threading.Thread(target=worker.serve_forever, daemon=True).start()
+    P.dispatcher.mount("proxied", P.WorkerProxy(sock))
+    front = P.PoolServer("127.0.0.1", 0, P.site)
+    threading.Thread(target=front.serve_forever, daemon=True).start()
+    yield front.server_port
+    front.shutdown()
+    worker.shutdown()
+    P.dispatcher.unmount("proxied")
+
+
+def post(port, body, **kw):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    conn.request("POST", "/s/proxied/", body=body, **kw)
+    resp = conn.getresponse()
+    data = resp.read()
+    conn.close()
+    return resp.status, data
+
+
+def test_content_length_body(port):
+    data = os.urandom(200000)
+    assert post(port, data) == (200, data)
+
+
+def test_chunked_body(port):
+    data   = os.urandom(200000)
+    chunks = (data[i:i + 7000] for i in range(0, len(data), 7000))
+    assert post(port, chunks, headers={"Transfer-Encoding": "chunked"}, encode_chunked=True) == (200, data)
+
+
+def test_empty_chunked_body(port):
+    assert post(port, iter(()), headers={"Transfer-Encoding": "chunked"}, encode_chunked=True) == (200, b"")
@@ -2,35 +2,121 @@ from flask import Flask, render_template_string, request, Response, jsonify
 import time
 import os
 import json
+import random
+import hashlib
+import bisect
+import sqlite3
+import tempfile
+import threading
 import requests
-from datetime import datetime, timedelta
+from datetime import datetime
 from pathlib import Path
 
 app = Flask(__name__)
 
-# 数据存储文件
-DATA_FILE = 'speedtest_data.json'
+# 数据存储：SQLite（WAL 模式），按 IP 和时间建索引
+DATA_FILE = 'speedtest_data.db'
+LEGACY_FILE = 'speedtest_data.json'      # 旧版 JSON 存储，首次启动时导入
+RETENTION_DAYS = 7
+COMPACT_INTERVAL = 3600                  # 后台清理过期记录的间隔（秒）
+COMPACT_BATCH = 5000                     # 每批删除的行数，避免长时间占用写锁
+LEADERBOARD_SIZE = 10
+
+_local = threading.local()
+
+def db():
+    """每个线程复用一条连接"""
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(DATA_FILE, timeout=10)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        _local.conn = conn
+    return conn
 
-# 初始化数据文件
 def init_data():
-    if not Path(DATA_FILE).exists():
-        data = {
-            'records': [],
-            'weekly_top': []
-        }
-        save_data(data)
-    return load_data()
-
-def load_data():
+    """建表建索引，并导入旧版 JSON 数据"""
+    with db() as conn:
+        conn.executescript("""
+        CREATE TABLE IF NOT EXISTS records(
+            id INTEGER PRIMARY KEY,
+            ip TEXT NOT NULL,
+            download REAL NOT NULL,
+            upload REAL NOT NULL,
+            latency REAL NOT NULL,
+            ts REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS records_ts ON records(ts);
+        CREATE INDEX IF NOT EXISTS records_download ON records(download DESC);
+        DROP INDEX IF EXISTS records_ip_download;
+        DROP INDEX IF EXISTS records_ip_upload;
+        DROP INDEX IF EXISTS records_ip_latency;
+        CREATE TABLE IF NOT EXISTS clients(
+            ip TEXT PRIMARY KEY,
+            count INTEGER NOT NULL,
+            last_seen REAL NOT NULL,
+            dl_download REAL, dl_upload REAL, dl_latency REAL, dl_ts REAL,
+            up_download REAL, up_upload REAL, up_latency REAL, up_ts REAL,
+            lat_download REAL, lat_upload REAL, lat_latency REAL, lat_ts REAL
+        );
+        """)
+        empty = conn.execute('SELECT 1 FROM records LIMIT 1').fetchone() is None
+    if empty and Path(LEGACY_FILE).exists():
+        migrate_legacy()
+    load_clients()
+    rebuild_leaderboards()
+
+def migrate_legacy():
+    """把旧版 speedtest_data.json 里的记录导入数据库（只在库为空时执行一次）"""
     try:
-        with open(DATA_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except:
-        return {'records': [], 'weekly_top': []}
+        with open(LEGACY_FILE, 'r', encoding='utf-8') as f:
+            records = json.load(f).get('records', [])
+    except (OSError, ValueError):
+        return 0
+    rows = []
+    for r in records:
+        try:
+            ts = datetime.fromisoformat(r['timestamp']).timestamp()
+            rows.append((r['ip'], float(r['download']), float(r['upload']), float(r['latency']), ts))
+        except (KeyError, TypeError, ValueError):
+            continue
+    with db() as conn:
+        conn.executemany('INSERT INTO records(ip, download, upload, latency, ts) VALUES(?,?,?,?,?)', rows)
+    print(f"已从 {LEGACY_FILE} 导入 {len(rows)} 条记录")
+    return len(rows)
+
+def row_to_record(row):
+    t = datetime.fromtimestamp(row['ts'])
+    return {
+        'ip': row['ip'],
+        'download': row['download'],
+        'upload': row['upload'],
+        'latency': row['latency'],
+        'timestamp': t.isoformat(),
+        'date': t.strftime('%Y-%m-%d %H:%M:%S')
+    }
 
-def save_data(data):
-    with open(DATA_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+def compact(now=None):
+    """分批删除超过保留期的记录，返回删除条数"""
+    cutoff = (now or time.time()) - RETENTION_DAYS * 86400
+    total = 0
+    while True:
+        with db() as conn:
+            n = conn.execute('DELETE FROM records WHERE id IN '
+                             '(SELECT id FROM records WHERE ts < ? LIMIT ?)', (cutoff, COMPACT_BATCH)).rowcount
+        total += n
+        if n < COMPACT_BATCH:
+            return total
+
+def compactor():
+    """后台线程：定期清理过期记录"""
+    while True:
+        try:
+            compact()
+        except sqlite3.Error as e:
+            print(f"清理过期记录失败: {e}")
+        time.sleep(COMPACT_INTERVAL)
 
 def get_ip_info(ip=None):
     """获取IP地址信息 - 使用ipapi.co"""
@@ -74,63 +160,269 @@ def get_ip_info(ip=None):
             'isp': 'Unknown'
         }
 
-def generate_random_data(size_mb):
-    """生成指定大小的随机数据"""
-    chunk_size = 10240 * 1024  # 10MB chunks
-    total_size = size_mb * chunk_size
-    
-    def generate():
-        sent = 0
-        data = os.urandom(chunk_size)
-        while sent < total_size:
-            yield data
-            sent += chunk_size
-    
-    return generate()
+# 下载测速数据：启动时用固定种子生成一块伪随机数据（不可压缩），切成固定的块表，所有请求共用，
+# 发送时不再分配内存。种子固定，所以每个进程、每次启动生成的内容都一样，续传跨进程也对得上。
+# 数据流第 i 个字节恒为 PAYLOAD_BLOCK[i % BLOCK_SIZE]，临时文件就是这条流的前 MAX_DOWNLOAD_MB。
+# 大小为 total 的下载取文件的最后 total 字节，这样整段下载和 "bytes=N-" 续传都正好读到文件末尾，
+# 服务器提供 wsgi.file_wrapper 时可以整个交给它走 sendfile，不依赖服务器按 Content-Length 截断；
+# 不到文件末尾的 Range 和没有 file_wrapper 的服务器（Werkzeug 自带的）走块表生成器，内容完全一样
+MB = 1024 * 1024
+MAX_DOWNLOAD_MB = 100
+BLOCK_SIZE = 4 * MB                      # 大于常见压缩窗口，重复也压缩不了
+CHUNK_SIZE = 256 * 1024                  # 每次写 socket 的大小
+PAYLOAD_SEED = 0x5EED
+PAYLOAD_BLOCK = random.Random(PAYLOAD_SEED).randbytes(BLOCK_SIZE)
+_view = memoryview(PAYLOAD_BLOCK)
+PAYLOAD_CHUNKS = tuple(bytes(_view[i:i + CHUNK_SIZE]) for i in range(0, BLOCK_SIZE, CHUNK_SIZE))
+PAYLOAD_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+# 文件名带块内容的哈希：种子或块大小改了，旧文件不会被误用
+PAYLOAD_HASH = hashlib.sha256(PAYLOAD_BLOCK).hexdigest()[:16]
+PAYLOAD_FILE = os.path.join(PAYLOAD_DIR, f'speedtest_payload_{MAX_DOWNLOAD_MB}mb_{PAYLOAD_HASH}.bin')
+_payload_lock = threading.Lock()
+
+def generate_random_data(start, stop):
+    """生成 [start, stop) 区间的测速数据；对齐的块直接复用块表，只有首尾不对齐时切片"""
+    pos = start
+    while pos < stop:
+        off = pos % BLOCK_SIZE
+        index, skip = divmod(off, CHUNK_SIZE)
+        chunk = PAYLOAD_CHUNKS[index]
+        n = min(CHUNK_SIZE - skip, stop - pos)
+        yield chunk if n == CHUNK_SIZE else chunk[skip:skip + n]
+        pos += n
+
+def payload_file():
+    """sendfile 用的数据文件，第一次使用时生成（tmpfs 优先），多个进程共用"""
+    with _payload_lock:
+        if os.path.exists(PAYLOAD_FILE) and os.path.getsize(PAYLOAD_FILE) == MAX_DOWNLOAD_MB * MB:
+            return PAYLOAD_FILE
+        tmp = f'{PAYLOAD_FILE}.{os.getpid()}'
+        with open(tmp, 'wb') as f:
+            for _ in range(MAX_DOWNLOAD_MB * MB // BLOCK_SIZE):
+                f.write(PAYLOAD_BLOCK)
+        os.replace(tmp, PAYLOAD_FILE)
+        return PAYLOAD_FILE
+
+# 上传测速：按固定大小把请求体读进每个线程复用的缓冲区后丢弃，只计字节数和时间，
+# 内存占用与上传大小无关。采样点超过 UPLOAD_MAX_SAMPLES 时两两合并、间隔翻倍
+UPLOAD_BUF_SIZE = 256 * 1024
+UPLOAD_SAMPLE_INTERVAL = 0.25            # 采样间隔（秒）
+UPLOAD_MAX_SAMPLES = 120
+
+def drain_upload(stream):
+    """读完上传数据，返回 (字节数, 耗时秒, [(时刻, 该区间字节数), ...])"""
+    buf = getattr(_local, 'upload_buf', None)
+    if buf is None:
+        buf = _local.upload_buf = memoryview(bytearray(UPLOAD_BUF_SIZE))
+    interval = UPLOAD_SAMPLE_INTERVAL
+    samples = []
+    total = pending = 0
+    start = last = time.perf_counter()
+    while True:
+        n = stream.readinto(buf)
+        if not n:
+            break
+        total += n
+        pending += n
+        now = time.perf_counter()
+        if now - last >= interval:
+            samples.append((now - start, pending))
+            pending, last = 0, now
+            if len(samples) > UPLOAD_MAX_SAMPLES:
+                merged = [(samples[i + 1][0], samples[i][1] + samples[i + 1][1])
+                          for i in range(0, len(samples) - 1, 2)]
+                if len(samples) % 2:
+                    merged.append(samples[-1])
+                samples = merged
+                interval *= 2
+    elapsed = time.perf_counter() - start
+    if pending:
+        samples.append((elapsed, pending))
+    return total, elapsed, samples
+
+# 每个 IP 一条汇总：最佳下载、最佳上传、最低延迟（各自是完整的那次测试）、测试次数、最后一次时间。
+# 保存结果时和明细记录在同一个事务里更新，内存里留一份字典，查询不访问数据库。
+# 合并在 SQL 里做（ON CONFLICT ... DO UPDATE），以库里的行为准：多个工作进程共用一个库时，
+# 各自内存里的字典只是缓存，不会拿过期的值把别的进程写进去的次数、最佳成绩覆盖掉。
+# 内存里每次测试只存 (下载, 上传, 延迟, 时间戳) 元组，三项最佳是同一次测试时共用一个元组。
+# 汇总是历史最佳，不受明细记录 RETENTION_DAYS 保留期的影响
+CLIENTS = {}                          # ip -> (次数, 最后时间, 最佳下载, 最佳上传, 最低延迟)
+_clients_lock = threading.Lock()      # 写库、刷新字典、更新排行榜一起做，同一进程里按时间顺序串行
+
+def _best_set(prefix, field, op):
+    """一项最佳对应的四列：新测试在 field 上更好（op）时整组换成新的，否则保持不变"""
+    cond = f'excluded.{prefix}_{field} {op} {prefix}_{field}'
+    return ', '.join(f'{prefix}_{c}=CASE WHEN {cond} THEN excluded.{prefix}_{c} ELSE {prefix}_{c} END'
+                     for c in ('download', 'upload', 'latency', 'ts'))
+
+# UPDATE 里的列引用都是更新前的旧值，所以每组的条件不会被同一条语句里先改的列影响
+CLIENT_SQL = ('INSERT INTO clients VALUES(?,?,?, ?,?,?,?, ?,?,?,?, ?,?,?,?) '
+              'ON CONFLICT(ip) DO UPDATE SET count=count+excluded.count, '
+              'last_seen=max(last_seen, excluded.last_seen), '
+              f"{_best_set('dl', 'download', '>')}, {_best_set('up', 'upload', '>')}, "
+              f"{_best_set('lat', 'latency', '<')}")
+
+def _merge_best(agg, test, ts):
+    if agg is None:
+        return (1, ts, test, test, test)
+    count, last_seen, dl, up, lat = agg
+    return (count + 1, max(ts, last_seen),
+            test if test[0] > dl[0] else dl,
+            test if test[1] > up[1] else up,
+            test if test[2] < lat[2] else lat)
+
+def _client_row(ip, agg):
+    return (ip, agg[0], agg[1]) + agg[2] + agg[3] + agg[4]
+
+def _row_agg(r):
+    dl, up, lat = tuple(r[3:7]), tuple(r[7:11]), tuple(r[11:15])
+    up = dl if up == dl else up
+    lat = dl if lat == dl else up if lat == up else lat
+    return (r[1], r[2], dl, up, lat)
+
+def load_clients():
+    """启动时把汇总表读进内存；汇总表为空而明细不为空时（旧库升级）从明细重建"""
+    conn = db()
+    CLIENTS.clear()
+    cur = conn.cursor()
+    cur.row_factory = None
+    for r in cur.execute('SELECT * FROM clients'):
+        CLIENTS[r[0]] = _row_agg(r)
+    if CLIENTS:
+        return
+    for r in cur.execute('SELECT ip, download, upload, latency, ts FROM records ORDER BY ts'):
+        CLIENTS[r[0]] = _merge_best(CLIENTS.get(r[0]), r[1:], r[4])
+    if CLIENTS:
+        with conn:
+            conn.executemany(CLIENT_SQL, [_client_row(ip, agg) for ip, agg in CLIENTS.items()])
 
 def update_records(client_ip, download_speed, upload_speed, latency):
     """更新测试记录"""
-    data = load_data()
-    
-    # 添加新记录
-    record = {
-        'ip': client_ip,
-        'download': round(download_speed, 2),
-        'upload': round(upload_speed, 2),
-        'latency': round(latency, 2),
-        'timestamp': datetime.now().isoformat(),
-        'date': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    }
-    
-    data['records'].append(record)
-    
-    # 清理7天前的记录
-    week_ago = datetime.now() - timedelta(days=7)
-    data['records'] = [r for r in data['records'] 
-                       if datetime.fromisoformat(r['timestamp']) > week_ago]
-    
-    # 更新每周排名（按下载速度）
-    weekly_sorted = sorted(data['records'], key=lambda x: x['download'], reverse=True)
-    data['weekly_top'] = weekly_sorted[:10]
-    
-    save_data(data)
+    with _clients_lock:
+        # 时间戳在锁里取、排行榜也在锁里更新：排行榜要求按时间顺序喂入
+        # （"比它新且不比它差"的计数），锁外取的时间戳在线程之间会乱序
+        ts = time.time()
+        test = (round(download_speed, 2), round(upload_speed, 2), round(latency, 2), ts)
+        with db() as conn:
+            conn.execute('INSERT INTO records(ip, download, upload, latency, ts) VALUES(?,?,?,?,?)',
+                         (client_ip,) + test)
+            conn.execute(CLIENT_SQL, _client_row(client_ip, (1, ts, test, test, test)))
+            row = conn.execute('SELECT * FROM clients WHERE ip=?', (client_ip,)).fetchone()
+        CLIENTS[client_ip] = _row_agg(tuple(row))
+        record = _test_record(client_ip, test)
+        for board in BOARDS.values():
+            board.add(record, ts)
     return record
 
+def _test_record(ip, test):
+    return row_to_record({'ip': ip, 'download': test[0], 'upload': test[1], 'latency': test[2], 'ts': test[3]})
+
 def get_client_best_record(client_ip):
-    """获取客户端最佳记录"""
-    data = load_data()
-    client_records = [r for r in data['records'] if r['ip'] == client_ip]
-    
-    if not client_records:
+    """获取客户端最佳记录：一次字典查找"""
+    agg = CLIENTS.get(client_ip)
+    if not agg:
         return None
-    
-    best = {
-        'download': max(client_records, key=lambda x: x['download']),
-        'upload': max(client_records, key=lambda x: x['upload']),
-        'latency': min(client_records, key=lambda x: x['latency'])
-    }
-    
-    return best
+    return {'download': _test_record(client_ip, agg[2]),
+            'upload': _test_record(client_ip, agg[3]),
+            'latency': _test_record(client_ip, agg[4])}
+
+def get_client_summary(client_ip):
+    agg = CLIENTS.get(client_ip)
+    if not agg:
+        return None
+    return {'count': agg[0], 'last_seen': datetime.fromtimestamp(agg[1]).strftime('%Y-%m-%d %H:%M:%S')}
+
+class Leaderboard:
+    """滑动时间窗口内的前 N 名，插入时增量维护，查询不访问存储。
+
+    只保留可能（重新）进入前 N 的候选记录：比它新、又不比它差的记录
+    已经有 N 条时，它在窗口里再也排不进前 N，直接丢弃。随机数据下候选数
+    大约是 N·ln(记录数/N)，插入和查询都只扫这一小段。
+    """
+
+    def __init__(self, field, window, higher_better=True, size=LEADERBOARD_SIZE):
+        self.field = field
+        self.window = window
+        self.sign = -1 if higher_better else 1
+        self.size = size
+        self.keys = []       # 排序键，越小名次越靠前
+        self.items = []      # 与 keys 一一对应：[时间戳, 比它新且不比它差的记录数, 记录]
+        self.lock = threading.Lock()
+
+    def add(self, record, ts):
+        k = self.sign * record[self.field]
+        cutoff = ts - self.window
+        with self.lock:
+            pos = bisect.bisect_left(self.keys, k)
+            keys, items = [], []
+            for key, item in zip(self.keys[:pos], self.items[:pos]):
+                if item[0] > cutoff:
+                    keys.append(key)
+                    items.append(item)
+            keys.append(k)
+            items.append([ts, 0, record])
+            for key, item in zip(self.keys[pos:], self.items[pos:]):
+                item[1] += 1
+                if item[1] < self.size and item[0] > cutoff:
+                    keys.append(key)
+                    items.append(item)
+            self.keys, self.items = keys, items
+
+    def top(self, now=None):
+        cutoff = (now or time.time()) - self.window
+        with self.lock:
+            items = self.items
+        out = []
+        for ts, _, record in items:
+            if ts > cutoff:
+                out.append(record)
+                if len(out) == self.size:
+                    break
+        return out
+
+    def loader(self, now):
+        """返回一个函数，按时间从新到旧喂入 (时间戳, 行)；喂完调用 loader(None) 生效"""
+        cutoff = now - self.window
+        best, found = [], []
+
+        def feed(ts, row=None):
+            if row is None:
+                found.sort(key=lambda x: (x[0], -x[1]))
+                with self.lock:
+                    self.keys = [x[0] for x in found]
+                    self.items = [[x[1], x[2], row_to_record(x[3])] for x in found]
+                return
+            if ts <= cutoff:
+                return
+            k = self.sign * row[self.field]
+            dominated = bisect.bisect_right(best, k)
+            if dominated >= self.size:
+                return
+            bisect.insort(best, k)
+            if len(best) > self.size:
+                best.pop()
+            found.append((k, ts, dominated, row))
+
+        return feed
+
+WINDOWS = {'day': 86400, 'week': RETENTION_DAYS * 86400}
+BOARDS = {(field, name): Leaderboard(field, span, field != 'latency')
+          for field in ('download', 'upload', 'latency') for name, span in WINDOWS.items()}
+
+def rebuild_leaderboards():
+    """启动时从数据库重建所有排行榜：按时间倒序流式读一遍，不把整表读进内存"""
+    now = time.time()
+    feeds = [board.loader(now) for board in BOARDS.values()]
+    cur = db().execute('SELECT * FROM records WHERE ts>? ORDER BY ts DESC', (now - max(WINDOWS.values()),))
+    for row in cur:
+        for feed in feeds:
+            feed(row['ts'], row)
+    for feed in feeds:
+        feed(None)
+
+def get_leaderboard(field='download', window='week'):
+    """排行榜直接从内存结构里读"""
+    return BOARDS[(field, window)].top()
 
 HTML_TEMPLATE = """
 <!DOCTYPE html>
@@ -777,10 +1069,12 @@ async function startUploadTest() {
 
     const start = performance.now();
     try {
-        await fetch('/upload', {
+        const r = await fetch('/upload', {
             method: 'POST',
             body: data
         });
+        const server = await r.json();
+        console.log(`服务器端测得上传: ${server.mbps} Mbps (${server.received} 字节, ${server.elapsed}s)`);
     } catch(e) {
         console.error("Upload test failed");
     }
@@ -909,24 +1203,48 @@ def index():
 
 @app.route('/download/<int:size_mb>')
 def download_test(size_mb):
-    """下载测速端点"""
-    size_mb = min(size_mb, 100)  # 限制最大100MB
-    return Response(
-        generate_random_data(size_mb),
-        mimetype='application/octet-stream',
-        headers={
-            'Content-Disposition': f'attachment; filename=test_{size_mb}mb.bin',
-            'Cache-Control': 'no-cache, no-store, must-revalidate',
-            'Pragma': 'no-cache',
-            'Expires': '0'
-        }
-    )
+    """下载测速端点：正好 size_mb MiB，支持单段 Range"""
+    size_mb = max(1, min(size_mb, MAX_DOWNLOAD_MB))  # 限制最大100MB
+    total = size_mb * MB
+    headers = {
+        'Content-Disposition': f'attachment; filename=test_{size_mb}mb.bin',
+        'Cache-Control': 'no-cache, no-store, must-revalidate',
+        'Pragma': 'no-cache',
+        'Expires': '0',
+        'Accept-Ranges': 'bytes'
+    }
+    start, stop, status = 0, total, 200
+    if request.range and len(request.range.ranges) == 1:   # 多段 Range 不支持，按整体返回
+        span = request.range.range_for_length(total)
+        if span is None:
+            headers['Content-Range'] = f'bytes */{total}'
+            return Response(status=416, headers=headers)
+        start, stop, status = span[0], span[1], 206
+        headers['Content-Range'] = f'bytes {start}-{stop - 1}/{total}'
+    headers['Content-Length'] = str(stop - start)
+
+    base = (MAX_DOWNLOAD_MB - size_mb) * MB      # 这次下载在数据流里的起点
+    file_wrapper = request.environ.get('wsgi.file_wrapper')
+    if file_wrapper and stop == total:
+        f = open(payload_file(), 'rb')
+        f.seek(base + start)
+        body = file_wrapper(f, CHUNK_SIZE)
+    else:
+        body = generate_random_data(base + start, base + stop)
+    return Response(body, status=status, mimetype='application/octet-stream',
+                    headers=headers, direct_passthrough=True)
 
 @app.route('/upload', methods=['POST'])
 def upload_test():
     """上传测速端点"""
-    data = request.get_data()
-    return jsonify({'received': len(data), 'status': 'ok'})
+    received, elapsed, samples = drain_upload(request.stream)
+    return jsonify({
+        'received': received,
+        'elapsed': round(elapsed, 4),
+        'mbps': round(received * 8 / elapsed / MB, 2) if elapsed > 0 else 0,
+        'samples': [{'t': round(t, 3), 'bytes': n} for t, n in samples],
+        'status': 'ok'
+    })
 
 @app.route('/ping')
 def ping():
@@ -1007,16 +1325,19 @@ def best_records():
             client_ip = ip_info.get('ip', 'Unknown')
         
         records = get_client_best_record(client_ip)
-        return jsonify({'records': records, 'ip': client_ip})
+        return jsonify({'records': records, 'ip': client_ip, 'summary': get_client_summary(client_ip)})
     except Exception as e:
         print(f"获取最佳记录失败: {e}")
         return jsonify({'records': None, 'ip': 'Unknown'})
 
 @app.route('/api/leaderboard')
 def leaderboard():
-    """获取排行榜"""
-    data = load_data()
-    return jsonify({'top': data['weekly_top']})
+    """获取排行榜：?board=download|upload|latency&window=week|day"""
+    field = request.args.get('board', 'download')
+    window = request.args.get('window', 'week')
+    if (field, window) not in BOARDS:
+        return jsonify({'status': 'error', 'message': 'board 可选 download/upload/latency，window 可选 day/week'}), 400
+    return jsonify({'top': get_leaderboard(field, window), 'board': field, 'window': window})
 
 if __name__ == '__main__':
     print("=" * 60)
@@ -1025,6 +1346,7 @@ if __name__ == '__main__':
     
     # 初始化数据
     init_data()
+    threading.Thread(target=compactor, daemon=True).start()
     
     # 获取服务器IP信息
     print("\n正在获取服务器信息...")
@@ -1044,7 +1366,7 @@ if __name__ == '__main__':
     print("  ✅ 本周速度排行榜 TOP 10")
     print("  ✅ 使用 ipapi.co API 获取IP信息")
     print("  ✅ 专业化界面设计")
-    print("  ✅ JSON数据持久化存储")
+    print("  ✅ SQLite (WAL) 数据持久化存储")
     print("\n📝 注意事项：")
     print("  - ipapi.co 免费版限制：1000次/天")
     print("  - 如遇到IP加载失败，请稍后重试")